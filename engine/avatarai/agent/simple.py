@@ -1,81 +1,286 @@
+import asyncio
+from functools import partial
+from typing import TYPE_CHECKING, AsyncGenerator, List, Optional
 
-from avatarai.models.llm import LLM
-from nostr_sdk import Event, KindStandard
-from avatarai.nostr.client import Nostr
-from avatarai.config import AvatarConfig
+from nostr_sdk import Event
 
+from avatarai.config import AvatarConfig
+from avatarai.engine.config_loader import avatar_id_of
 from avatarai.logger import init_logger
+from avatarai.memory.conversation import AvatarMemory
+from avatarai.models.cache import ResponseCache, get_response_cache
+from avatarai.models.gateway import LLMGateway, get_llm_gateway
+from avatarai.models.llm import LLM, LLMCallStats, Messages
+from avatarai.nostr.checkpoint import AvatarCheckpoint
+from avatarai.nostr.client import Nostr
+from avatarai.nostr.filters import (
+    DIRECT_MESSAGE_KIND,
+    GIFT_WRAP_KIND,
+    PRIVATE_DIRECT_MESSAGE_KIND,
+    REACTION_KIND,
+    TEXT_NOTE_KIND,
+    ZAP_RECEIPT_KIND,
+    build_avatar_filters,
+)
+from avatarai.nostr.outbox import AvatarOutboxStore
+from avatarai.nostr.router import KindRouter
+from avatarai.nostr.verify import EventVerifier, get_event_verifier
+from avatarai.utils.metrics import MetricSet
 
 from .protocol import AgentProtocol
 
+if TYPE_CHECKING:
+    # 向量库依赖 NumPy，只在配置了 embedding 模型时由引擎创建
+    from avatarai.memory.vector import VectorHit, VectorStore
+
 logger = init_logger("avatarai.agent.simple")
 
+# 长期记忆达到该数量后建立 IVF 索引，之后数量每翻一倍重建一次
+MEMORY_INDEX_THRESHOLD = 20000
+
 
 class SimpleAgent(AgentProtocol):
 
-    def __init__(self, avatar_config: AvatarConfig):
-        model_credentials = {
-            "api_key": avatar_config.llm_config.api_key,
-            "api_url": avatar_config.llm_config.api_url,
-        }
-        self.llm_model = LLM(
-            model=avatar_config.llm_config.model,
-            credentials=model_credentials
-        )
+    def __init__(self, avatar_config: AvatarConfig, llm_model: Optional[LLM] = None,
+                 verifier: Optional[EventVerifier] = None,
+                 checkpoint: Optional[AvatarCheckpoint] = None,
+                 llm_gateway: Optional[LLMGateway] = None,
+                 response_cache: Optional[ResponseCache] = None,
+                 memory: Optional[AvatarMemory] = None,
+                 vector_store: Optional["VectorStore"] = None,
+                 outbox_store: Optional[AvatarOutboxStore] = None):
+        """
+        Args:
+            avatar_config: Avatar配置
+            llm_model: 指定的LLM客户端，为None时从网关获取按配置共享的客户端
+            verifier: 事件验证器，为None时使用进程级共享验证器
+            checkpoint: 事件处理检查点，为None时不持久化处理进度
+            llm_gateway: LLM调用网关，为None时使用进程级共享网关
+            response_cache: LLM响应缓存，为None时使用进程级共享缓存
+            memory: 会话记忆，为None时每次对话都不带历史
+            vector_store: 长期记忆向量库，需要配置 embedding 模型才会使用
+            outbox_store: 发件箱存储，为None时未送达的事件不会跨重启保留
+        """
+        self.avatar_config = avatar_config
+        self.avatar_id = avatar_id_of(avatar_config)
+        self.llm_gateway = llm_gateway or get_llm_gateway()
+        self.llm_model = llm_model or self.llm_gateway.get_llm(avatar_config.llm_config)
+        self.response_cache = response_cache or get_response_cache()
+        self.memory = memory
+        self.vector_store = vector_store
+        # 向量库的读写和建索引都在线程中执行，用锁串行化
+        self._vector_lock = asyncio.Lock()
+        indexed = vector_store is not None and vector_store.indexed
+        self._indexed_count = len(vector_store) if indexed else 0
+        self.verifier = verifier or get_event_verifier()
         self.nostr_client = Nostr(
             private_key=avatar_config.nostr_config.private_key,
-            relays=avatar_config.nostr_config.relays
+            relays=avatar_config.nostr_config.relays,
+            checkpoint=checkpoint,
+            outbox_store=outbox_store
         )
+        self.router = KindRouter(default=self._on_unknown)
+        self._register_handlers()
+        self._serving = False
 
     async def serve(self):
         """
         启动并部署Agent，设置Nostr连接和事件监听
         """
         await self.nostr_client.connect()
-        await self.nostr_client.subscribe(callback=self.nostr)
+        # 只订阅与本Avatar相关的事件，并从检查点恢复
+        for subscription in build_avatar_filters(self.nostr_client.public_key):
+            await self.nostr_client.subscribe(
+                subscription.filter, callback=self.nostr,
+                name=subscription.name, since_offset=subscription.since_offset)
+        self._serving = True
         logger.info("Agent已成功部署，Nostr连接和事件监听已启动")
 
+    async def stop(self):
+        """
+        停止Agent，断开Nostr连接
+        """
+        self._serving = False
+        await self.nostr_client.disconnect()
+        if self.vector_store is not None:
+            async with self._vector_lock:
+                self.vector_store.close()
+        logger.info(f"Agent {self.avatar_config.name} 已停止")
+
     async def nostr(self, event: Event) -> None:
-        logger.info(f"SimpleAgent 收到Nostr事件: {event}")
+        logger.debug(f"SimpleAgent 收到Nostr事件: {event.id().to_hex()}")
+
+        if not await self.verifier.verify(event):
+            logger.warning(f"SimpleAgent 收到无效事件: {event.id().to_hex()}")
+            return
+
+        await self.router.dispatch(event)
+
+    def _register_handlers(self) -> None:
+        """注册各类事件的处理器，新的事件类型在这里扩展"""
+        self.router.register(TEXT_NOTE_KIND, self._on_text_note)
+        self.router.register(DIRECT_MESSAGE_KIND, self._on_direct_message)
+        # 私信会调用LLM回复，同时处理的数量由 Nostr 分发队列的worker数量限制
+        self.router.register(GIFT_WRAP_KIND, self._on_gift_wrap)
+        self.router.register(REACTION_KIND, self._on_reaction)
+        self.router.register(ZAP_RECEIPT_KIND, self._on_zap_receipt)
+
+    async def _on_text_note(self, event: Event) -> None:
+        logger.info(f"SimpleAgent 收到 TextNote 事件内容: {event.content()}")
+
+    async def _on_direct_message(self, event: Event) -> None:
+        # NIP-04 私信已不推荐使用，只记录不解密
+        logger.info(f"SimpleAgent 收到 NIP-04 私信: {event.id().to_hex()}")
+
+    async def _on_gift_wrap(self, event: Event) -> None:
+        unwrapped = await self.nostr_client.unwrap_gift_wrap(event)
+        sender = unwrapped.sender().to_hex()
+        rumor = unwrapped.rumor()
+        if sender == self.nostr_client.public_key.to_hex():
+            # 自己发出的私信副本
+            return
+        if rumor.kind().as_u16() != PRIVATE_DIRECT_MESSAGE_KIND:
+            logger.info(
+                f"SimpleAgent 收到 GiftWrap 内的 kind {rumor.kind().as_u16()} 事件")
+            return
+
+        logger.info(f"SimpleAgent 收到私信: {rumor.content()}")
+        reply = await self.chat(sender, rumor.content())
+        if reply:
+            await self.nostr_client.send_private_msg(sender, reply)
+            # 先回复再写入长期记忆，embedding 调用不增加回复延迟
+            await self.remember_turn(rumor.content(), reply)
+
+    async def _on_reaction(self, event: Event) -> None:
+        logger.info(f"SimpleAgent 收到 Reaction: {event.content()} "
+                    f"来自 {event.author().to_hex()}")
+
+    async def _on_zap_receipt(self, event: Event) -> None:
+        logger.info(f"SimpleAgent 收到 Zap 回执: {event.id().to_hex()}")
+
+    async def _on_unknown(self, event: Event) -> None:
+        logger.warning(f"SimpleAgent 收到未知事件: kind {event.kind().as_u16()}")
 
-        if not event.verify():
-            logger.warning(f"SimpleAgent 收到无效事件: {event}")
+    @property
+    def ready(self) -> bool:
+        """已完成启动，订阅已建立且有中继在线"""
+        return self._serving and self.nostr_client.ready
+
+    def stats(self) -> dict:
+        return {
+            "nostr": self.nostr_client.stats(),
+            "handlers": self.router.stats(),
+        }
+
+    def collect_metrics(self, metrics: MetricSet) -> None:
+        self.nostr_client.collect_metrics(metrics, avatar=self.avatar_id)
+        self.router.collect_metrics(metrics, avatar=self.avatar_id)
+
+    async def chat(self, peer: str, content: str) -> str:
+        """
+        与对端进行一轮对话，读写该对端的会话记忆
+
+        LLM调用成功后才把这一轮的两条消息写入会话记忆，调用失败不会
+        留下没有回复的用户消息。
+
+        Args:
+            peer: 对端公钥（hex）
+            content: 对端发来的消息
+        """
+        messages = [{"role": "system", "content": self.avatar_config.description}]
+        memories = (await self.recall([content], k=3))[0]
+        if memories:
+            recalled = "\n".join(f"- {hit.payload}" for hit in memories)
+            messages.append({"role": "system",
+                             "content": f"相关的长期记忆：\n{recalled}"})
+        if self.memory is not None:
+            messages.extend(self.memory.context(peer))
+        messages.append({"role": "user", "content": content})
+
+        reply = await self.invoke_llm(messages)
+        if self.memory is not None and reply:
+            self.memory.append(peer, "user", content)
+            self.memory.append(peer, "assistant", reply)
+        return reply
+
+    @property
+    def long_term_memory_enabled(self) -> bool:
+        return (self.vector_store is not None
+                and bool(self.avatar_config.llm_config.embedding_model))
+
+    async def remember(self, texts: List[str]) -> List[int]:
+        """把文本写入长期记忆，返回记忆ID"""
+        if not self.long_term_memory_enabled or not texts:
+            return []
+        vectors = await asyncio.gather(
+            *(self.llm_gateway.embed(self.llm_model, text) for text in texts))
+        async with self._vector_lock:
+            return await asyncio.to_thread(self.vector_store.add, vectors, texts)
+
+    async def remember_turn(self, content: str, reply: str) -> None:
+        """把一轮对话写入长期记忆，失败只记录日志，不影响对话"""
+        if not self.long_term_memory_enabled:
             return
+        try:
+            await self.remember([f"对方: {content}\n我: {reply}"])
+            await self.selfimprove()
+        except Exception as e:
+            logger.warning(f"写入长期记忆失败: {str(e)}")
+
+    async def recall(self, queries: List[str], k: int = 5) -> List[List["VectorHit"]]:
+        """批量检索与查询最相关的长期记忆"""
+        if not self.long_term_memory_enabled or len(self.vector_store) == 0:
+            return [[] for _ in queries]
+        vectors = await asyncio.gather(
+            *(self.llm_gateway.embed(self.llm_model, query) for query in queries))
+        # 矩阵乘法和 top-k 放到线程中，不阻塞事件循环
+        async with self._vector_lock:
+            return await asyncio.to_thread(self.vector_store.search, vectors, k)
+
+    async def invoke_llm(self, messages: Messages, stats: Optional[LLMCallStats] = None,
+                         **params) -> str:
+        """调用LLM，优先使用缓存的响应"""
+        chunks = []
+        async for chunk in self.stream_llm(messages, stats=stats, **params):
+            chunks.append(chunk)
+        return "".join(chunks)
+
+    async def stream_llm(self, messages: Messages, stats: Optional[LLMCallStats] = None,
+                         **params) -> AsyncGenerator[str, None]:
+        """
+        流式调用LLM
+
+        相同人设下重复的问题直接回放缓存的响应；未命中时经由网关调用，
+        与其他Avatar共享并发额度。配置了 embedding 模型时启用语义缓存。
+        """
+        embed = None
+        if self.avatar_config.llm_config.embedding_model:
+            embed = partial(self.llm_gateway.embed, self.llm_model)
+
+        def producer():
+            return self.llm_gateway.stream(
+                self.avatar_id, self.llm_model, messages, stats=stats, **params)
+
+        async for chunk in self.response_cache.stream(
+                self.llm_model.model, messages, self.avatar_config.description,
+                producer, embed=embed, **params):
+            yield chunk
 
-        match event.kind().as_std():
-            case KindStandard.TEXT_NOTE():
-                logger.info(f"SimpleAgent 收到 TextNote 事件内容: {event.content()}")
-            case KindStandard.GIFT_WRAP():
-                # todo: 处理GiftWrap事件
-                gift_wrap = await self.nostr_client.unwrap_gift_wrap(event)
-                logger.info(f"SimpleAgent 收到 GiftWrap 事件内容: {gift_wrap}")
-            case _:
-                logger.warning(f"SimpleAgent 收到未知事件: {event}")
-
-        # if event.author().to_bech32() != self.nostr_client.public_key.to_bech32():
-        #     return
-
-
-        # if not event.verify():
-        #         logging.warning(
-        #             "Ignoring event with invalid signature or id: %s", event.as_json()
-        #         )
-        #         return
-
-        #     match event.kind().as_enum():
-        #         case KindEnum.WALLET_CONNECT_REQUEST():
-        #             await handle_nip47_event(event)
-        #         case _:
-        #             raise NotImplementedError()
-
-        if event.kind() == 1:
-            content = event.content()
-            logger.info(f"SimpleAgent 收到 TextNote 事件内容: {content}")
-        elif event.kind() == 4:
-            content = event.content()
-            logger.info(f"SimpleAgent 收到 DM 事件内容: {content}")
     async def randomwalk(self) -> None:
         pass
 
     async def selfimprove(self) -> None:
-        pass
+        """
+        整理长期记忆：数量达到 MEMORY_INDEX_THRESHOLD 后建立 IVF 索引，
+        之后数量每翻一倍按新的数据分布重建，检索只扫描最近的簇
+        """
+        if not self.long_term_memory_enabled:
+            return
+        count = len(self.vector_store)
+        if count < MEMORY_INDEX_THRESHOLD:
+            return
+        if self.vector_store.indexed and count < 2 * self._indexed_count:
+            return
+        async with self._vector_lock:
+            await asyncio.to_thread(self.vector_store.build_index)
+        self._indexed_count = count
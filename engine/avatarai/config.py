@@ -1,13 +1,19 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from pydantic import BaseModel, Field
 
+# 兼容 OpenAI Chat Completions 接口的 provider
+OPENAI_COMPATIBLE_PROVIDERS = ("openai", "openrouter", "vllm", "")
+
 
 class LLMConfig(BaseModel):
     api_url: str = Field(description="The api url of the llm")
     model: str = Field(description="The model of the llm")
     provider: str = Field(description="The provider of the llm")
     api_key: str = Field(description="The api key of the llm")
+    embedding_model: Optional[str] = Field(
+        default=None,
+        description="The embedding model of the llm, defaults to the chat model")
 
 
 class ToolConfig(BaseModel):
@@ -32,4 +38,24 @@ class AvatarConfig(BaseModel):
 
 
 class AvatarAIConfig(BaseModel):
-    avatar_config: Optional[AvatarConfig] = Field(default=None, description="The avatar configuration")
+    avatar_configs: List[AvatarConfig] = Field(
+        default_factory=list,
+        description="The avatar configurations hosted by the engine")
+    data_dir: Optional[str] = Field(
+        default=None, description="The directory for persistent avatar state")
+    startup_timeout: float = Field(
+        default=30.0,
+        description="Seconds allowed for a single avatar to connect and subscribe")
+    shutdown_timeout: float = Field(
+        default=30.0,
+        description="Seconds allowed for a single avatar to drain and stop")
+    avatar_path: Optional[str] = Field(
+        default=None,
+        description="The avatar config file or directory the configs were loaded from")
+    avatar_files: Dict[str, str] = Field(
+        default_factory=dict,
+        description="The avatar id loaded from each config file")
+    reload_interval: float = Field(
+        default=0.0,
+        description="Seconds between checks for changed config files, "
+                    "0 disables hot reload")
@@ -1,9 +1,35 @@
-from typing import List
+import asyncio
+import os
+import re
+import time
+from typing import Dict, List, Optional
 
-from avatarai.engine.protocol import EngineProtocol
-from avatarai.engine.engine_args import EngineArgs
-from avatarai.config import AvatarAIConfig
 from avatarai.agent.simple import SimpleAgent
+from avatarai.config import AvatarAIConfig, AvatarConfig
+from avatarai.engine.config_loader import (
+    AvatarConfigWatcher,
+    ConfigChanges,
+    avatar_id_of,
+)
+from avatarai.engine.engine_args import EngineArgs
+from avatarai.engine.protocol import EngineProtocol
+from avatarai.engine.registry import AvatarRegistry
+from avatarai.logger import init_logger
+from avatarai.memory.conversation import ConversationStore
+from avatarai.models.cache import get_response_cache
+from avatarai.models.gateway import get_llm_gateway
+from avatarai.nostr.checkpoint import CheckpointStore
+from avatarai.nostr.outbox import OutboxStore
+from avatarai.nostr.pool import get_relay_pool
+from avatarai.nostr.verify import get_event_verifier
+from avatarai.utils.metrics import MetricSet, get_metrics_registry
+from avatarai.utils.stats import Histogram
+from avatarai.utils.tasks import get_loop_monitor, get_task_supervisor
+
+logger = init_logger("avatarai.engine.async_avatar_engine")
+
+# 采集指标时每处理这么多个Avatar让出一次事件循环
+METRICS_CHUNK_SIZE = 64
 
 
 class AsyncAvatarEngine(EngineProtocol):
@@ -12,7 +38,43 @@ class AsyncAvatarEngine(EngineProtocol):
 
     def __init__(self, engine_config: AvatarAIConfig):
         self.engine_config = engine_config
-        self.agent = SimpleAgent(engine_config.avatar_config)
+        self.avatars: AvatarRegistry[SimpleAgent] = AvatarRegistry()
+        # 所有Avatar的LLM调用经由同一个网关，共享客户端和并发额度
+        self.llm_gateway = get_llm_gateway()
+        self._serving = False
+        # 启动耗时：整体（None表示尚未完成）及每个Avatar
+        self.startup_duration: Optional[float] = None
+        self.avatar_startup_time = Histogram()
+        # 启动失败的Avatar及原因
+        self.startup_errors: Dict[str, str] = {}
+        self.config_watcher: Optional[AvatarConfigWatcher] = None
+        self._reload_task: Optional[asyncio.Task] = None
+        self.checkpoint_store: Optional[CheckpointStore] = None
+        self.conversation_store: Optional[ConversationStore] = None
+        self.outbox_store: Optional[OutboxStore] = None
+        if engine_config.data_dir:
+            self.checkpoint_store = CheckpointStore(
+                os.path.join(engine_config.data_dir, "checkpoints.sqlite3"))
+            self.conversation_store = ConversationStore(
+                os.path.join(engine_config.data_dir, "conversations.sqlite3"))
+            self.outbox_store = OutboxStore(
+                os.path.join(engine_config.data_dir, "outbox.sqlite3"))
+
+        for avatar_config in engine_config.avatar_configs:
+            avatar_id = self.avatar_id_of(avatar_config)
+            if avatar_id in self.avatars:
+                raise ValueError(f"重复的Avatar ID: {avatar_id}")
+            self.avatars.put(avatar_id, self._create_agent(avatar_id, avatar_config))
+
+        if engine_config.avatar_path and engine_config.reload_interval > 0:
+            self.config_watcher = AvatarConfigWatcher(engine_config.avatar_path)
+            self.config_watcher.track({
+                file_path: self.avatars.get(avatar_id).avatar_config
+                for file_path, avatar_id in engine_config.avatar_files.items()
+                if avatar_id in self.avatars
+            })
+
+        get_metrics_registry().register(self.collect_metrics)
 
     @classmethod
     def from_engine_args(cls, engine_args: EngineArgs) -> "AsyncAvatarEngine":
@@ -20,22 +82,288 @@ class AsyncAvatarEngine(EngineProtocol):
 
         return cls(engine_config=engine_config)
 
+    @staticmethod
+    def avatar_id_of(avatar_config: AvatarConfig) -> str:
+        """Avatar的唯一ID，优先使用全局唯一的memoId"""
+        return avatar_id_of(avatar_config)
+
+    async def collect_metrics(self, metrics: MetricSet) -> None:
+        """
+        采集引擎及所有Avatar的指标，只读取计数
+
+        Avatar较多时逐块采集，每 METRICS_CHUNK_SIZE 个Avatar让出一次事件循环，
+        采集不会长时间阻塞事件处理。
+        """
+        metrics.gauge("avatars", "托管的Avatar数量", len(self.avatars))
+        metrics.gauge("engine_serving", "引擎是否正在运行", int(self._serving))
+        metrics.gauge("avatars_ready", "订阅已建立且有中继在线的Avatar数量",
+                      sum(1 for _, agent in self.avatars.items() if agent.ready))
+        metrics.gauge("avatars_failed", "启动失败的Avatar数量",
+                      len(self.startup_errors))
+        if self.startup_duration is not None:
+            metrics.gauge("engine_startup_seconds", "引擎启动所有Avatar的耗时",
+                          self.startup_duration)
+        metrics.histogram("avatar_startup_seconds", "单个Avatar连接和订阅的耗时",
+                          self.avatar_startup_time)
+        for index, (_, agent) in enumerate(self.avatars.items(), 1):
+            agent.collect_metrics(metrics)
+            if index % METRICS_CHUNK_SIZE == 0:
+                await asyncio.sleep(0)
+        get_relay_pool().collect_metrics(metrics)
+        get_event_verifier().collect_metrics(metrics)
+        self.llm_gateway.collect_metrics(metrics)
+        get_response_cache().collect_metrics(metrics)
+        get_task_supervisor().collect_metrics(metrics)
+        get_loop_monitor().collect_metrics(metrics)
+
+    def _create_agent(self, avatar_id: str, avatar_config: AvatarConfig) -> SimpleAgent:
+        checkpoint = None
+        if self.checkpoint_store:
+            checkpoint = self.checkpoint_store.for_avatar(avatar_id)
+        memory = None
+        if self.conversation_store:
+            memory = self.conversation_store.for_avatar(avatar_id)
+        outbox_store = None
+        if self.outbox_store:
+            outbox_store = self.outbox_store.for_avatar(avatar_id)
+        vector_store = None
+        if self.engine_config.data_dir and avatar_config.llm_config.embedding_model:
+            # 长期记忆需要 embedding 模型，未配置时不创建向量库，也不加载 NumPy
+            from avatarai.memory.vector import VectorStore
+
+            # 每个Avatar一个向量库目录
+            dirname = re.sub(r"[^\w.-]", "_", avatar_id)
+            vector_store = VectorStore(
+                os.path.join(self.engine_config.data_dir, "vectors", dirname))
+        return SimpleAgent(avatar_config, checkpoint=checkpoint,
+                           llm_gateway=self.llm_gateway, memory=memory,
+                           vector_store=vector_store, outbox_store=outbox_store)
+
     async def serve(self) -> None:
-        await self.agent.serve()
+        """
+        并发启动所有Avatar
+
+        每个Avatar的启动受 startup_timeout 限制，失败或超时的Avatar记录在
+        startup_errors 中，不影响其他Avatar；启动完成前 ready() 为False。
+        """
+        self._serving = True
+        if self.checkpoint_store:
+            self.checkpoint_store.start()
+        if self.conversation_store:
+            self.conversation_store.start()
+        if self.outbox_store:
+            self.outbox_store.start()
+        started = time.monotonic()
+        items = list(self.avatars.items())
+        results = await asyncio.gather(
+            *(self._start_agent(avatar_id, agent) for avatar_id, agent in items),
+            return_exceptions=True)
+        for (avatar_id, _), result in zip(items, results):
+            if isinstance(result, Exception):
+                self.startup_errors[avatar_id] = str(result) or type(result).__name__
+                logger.error(f"Avatar {avatar_id} 启动失败: "
+                             f"{self.startup_errors[avatar_id]}")
+        self.startup_duration = time.monotonic() - started
+        logger.info(f"引擎已启动，共托管 {len(self.avatars)} 个Avatar，"
+                    f"失败 {len(self.startup_errors)} 个，"
+                    f"耗时 {self.startup_duration:.2f}s")
+        if self.config_watcher and self._serving:
+            self._reload_task = get_task_supervisor().spawn(self._watch_configs(),
+                                                            "engine-reload-configs")
 
     async def stop(self) -> None:
-        pass
+        """停止所有Avatar，每个Avatar排空队列的时间受 shutdown_timeout 限制"""
+        self._serving = False
+        if self._reload_task:
+            self._reload_task.cancel()
+            await asyncio.gather(self._reload_task, return_exceptions=True)
+            self._reload_task = None
+        items = list(self.avatars.items())
+        results = await asyncio.gather(
+            *(asyncio.wait_for(agent.stop(),
+                               timeout=self.engine_config.shutdown_timeout)
+              for _, agent in items),
+            return_exceptions=True)
+        for (avatar_id, _), result in zip(items, results):
+            if isinstance(result, asyncio.TimeoutError):
+                logger.error(f"Avatar {avatar_id} 未能在 "
+                             f"{self.engine_config.shutdown_timeout}s 内停止")
+            elif isinstance(result, Exception):
+                logger.error(f"Avatar {avatar_id} 停止失败: {str(result)}")
+        get_metrics_registry().unregister(self.collect_metrics)
+        await get_relay_pool().close()
+        if self.checkpoint_store:
+            self.checkpoint_store.close()
+        if self.conversation_store:
+            self.conversation_store.close()
+        if self.outbox_store:
+            self.outbox_store.close()
 
     async def add_avatar_async(self, avatar_id: str, **kwargs) -> bool:
-        pass
+        """
+        热添加Avatar，引擎运行中时立即启动
+
+        Args:
+            avatar_id: Avatar ID
+            avatar_config: Avatar配置（AvatarConfig）
+        """
+        avatar_config: Optional[AvatarConfig] = kwargs.get("avatar_config")
+        if avatar_config is None:
+            raise ValueError("添加Avatar需要提供 avatar_config")
+
+        async with self.avatars.lock(avatar_id):
+            if avatar_id in self.avatars:
+                logger.warning(f"Avatar {avatar_id} 已存在")
+                return False
+
+            await self._create_and_start(avatar_id, avatar_config)
+
+        logger.info(f"已添加Avatar: {avatar_id}")
+        return True
 
     async def remove_avatar_async(self, avatar_id: str, **kwargs) -> bool:
-        pass
+        """
+        热移除Avatar：取消订阅，处理完已入队的事件并发出回复后再释放中继
+
+        Args:
+            avatar_id: Avatar ID
+        """
+        async with self.avatars.lock(avatar_id):
+            agent = self.avatars.pop(avatar_id)
+            if agent is None:
+                return False
+            self.startup_errors.pop(avatar_id, None)
+            await agent.stop()
+
+        logger.info(f"已移除Avatar: {avatar_id}")
+        return True
+
+    async def replace_avatar_async(self, avatar_id: str,
+                                   avatar_config: AvatarConfig) -> bool:
+        """
+        用新配置替换Avatar，不存在时直接新增
+
+        在该Avatar的锁内先排空并停止旧实例（同一私钥的两个实例不能同时处理事件），
+        再启动新实例；新实例启动失败时按旧配置重新启动，并抛出启动失败的异常。
+
+        Returns:
+            是否替换了已有的Avatar
+        """
+        async with self.avatars.lock(avatar_id):
+            old = self.avatars.pop(avatar_id)
+            if old is not None:
+                await old.stop()
+            try:
+                await self._create_and_start(avatar_id, avatar_config)
+            except Exception:
+                if old is not None:
+                    await self._restore(avatar_id, old.avatar_config)
+                raise
+            self.startup_errors.pop(avatar_id, None)
+
+        logger.info(f"已{'更新' if old is not None else '添加'}Avatar: {avatar_id}")
+        return old is not None
+
+    async def _create_and_start(self, avatar_id: str,
+                                avatar_config: AvatarConfig) -> None:
+        """创建Avatar，引擎运行中时启动，成功后放入注册表；调用方需持有该Avatar的锁"""
+        agent = self._create_agent(avatar_id, avatar_config)
+        if self._serving:
+            try:
+                await self._start_agent(avatar_id, agent)
+            except Exception:
+                # 启动到一半失败时释放已占用的中继和存储
+                await agent.stop()
+                raise
+        self.avatars.put(avatar_id, agent)
+
+    async def _restore(self, avatar_id: str, avatar_config: AvatarConfig) -> None:
+        """新配置启动失败后按旧配置恢复Avatar"""
+        try:
+            await self._create_and_start(avatar_id, avatar_config)
+            logger.warning(f"Avatar {avatar_id} 新配置启动失败，已恢复原配置")
+        except Exception as e:
+            self.startup_errors[avatar_id] = str(e) or type(e).__name__
+            logger.error(f"Avatar {avatar_id} 恢复原配置失败: "
+                         f"{self.startup_errors[avatar_id]}")
+
+    async def get_avatar_async(self, avatar_id: str, **kwargs) -> Optional[SimpleAgent]:
+        return self.avatars.get(avatar_id)
+
+    async def get_all_avatars_async(self, **kwargs) -> List[str]:
+        return self.avatars.ids()
+
+    def ready(self) -> bool:
+        """启动已完成，且每个Avatar的订阅都已建立、有中继在线"""
+        if not self._serving or self.startup_duration is None:
+            return False
+        return all(agent.ready for _, agent in self.avatars.items())
+
+    def readiness(self) -> dict:
+        """就绪状态明细，供 /ready 接口返回"""
+        avatars = {}
+        for avatar_id, agent in self.avatars.items():
+            avatars[avatar_id] = {
+                "ready": agent.ready,
+                "error": self.startup_errors.get(avatar_id),
+                "relays": agent.nostr_client.pool.health_snapshot(
+                    agent.nostr_client.relays),
+            }
+        return {
+            "ready": self.ready(),
+            "serving": self._serving,
+            "startup_duration": self.startup_duration,
+            "avatars": avatars,
+        }
 
-    async def get_avatar_async(self, avatar_id: str, **kwargs) -> any:
-        pass
+    async def apply_config_changes(self, changes: ConfigChanges) -> List[str]:
+        """
+        应用配置变化：只启动、停止或重启配置有变化的Avatar
 
-    async def get_all_avatars_async(self, **kwargs) -> List[any]:
-        pass
+        Returns:
+            未能应用变化的Avatar ID；更新失败的Avatar继续按旧配置运行
+        """
+        avatar_ids = changes.removed + list(changes.changed) + list(changes.added)
+        tasks = [self.remove_avatar_async(avatar_id) for avatar_id in changes.removed]
+        tasks += [self.replace_avatar_async(avatar_id, c)
+                  for avatar_id, c in changes.changed.items()]
+        tasks += [self.add_avatar_async(avatar_id, avatar_config=c)
+                  for avatar_id, c in changes.added.items()]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        failed = []
+        for avatar_id, result in zip(avatar_ids, results):
+            if isinstance(result, Exception):
+                logger.error(f"应用Avatar {avatar_id} 的配置变化时出错: {str(result)}")
+                failed.append(avatar_id)
+        logger.info(f"Avatar配置已重新加载：新增 {len(changes.added)} 个，"
+                    f"更新 {len(changes.changed)} 个，移除 {len(changes.removed)} 个，"
+                    f"失败 {len(failed)} 个")
+        return failed
 
+    async def _watch_configs(self) -> None:
+        """按 reload_interval 轮询配置文件，解析放在线程中进行"""
+        while True:
+            await asyncio.sleep(self.engine_config.reload_interval)
+            try:
+                changes = await asyncio.to_thread(self.config_watcher.poll)
+            except Exception as e:
+                logger.error(f"检查Avatar配置变化时出错: {str(e)}")
+                continue
+            for file_path, error in changes.errors.items():
+                logger.error(f"Avatar配置文件无效，保留原配置 {file_path}: {error}")
+            if changes:
+                failed = await self.apply_config_changes(changes)
+                if failed:
+                    # 下次轮询时重试，而不是把失败的配置当作已生效
+                    self.config_watcher.revert(failed)
 
+    async def _start_agent(self, avatar_id: str, agent: SimpleAgent) -> None:
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(agent.serve(),
+                                   timeout=self.engine_config.startup_timeout)
+        except asyncio.TimeoutError as e:
+            raise TimeoutError(f"Avatar {avatar_id} 未能在 "
+                               f"{self.engine_config.startup_timeout}s "
+                               "内完成启动") from e
+        self.avatar_startup_time.observe(time.monotonic() - started)
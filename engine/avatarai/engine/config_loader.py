@@ -0,0 +1,303 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import tomli
+
+from avatarai.config import (
+    OPENAI_COMPATIBLE_PROVIDERS,
+    AvatarConfig,
+    LLMConfig,
+    NostrConfig,
+    ToolConfig,
+)
+from avatarai.logger import init_logger
+
+logger = init_logger("avatarai.engine.config_loader")
+
+# 文件数超过该值时才使用多进程解析，少量文件时进程启动开销大于收益
+PARALLEL_THRESHOLD = 64
+
+
+class AvatarConfigError(ValueError):
+    """单个Avatar配置文件无效"""
+
+    def __init__(self, file_path: str, message: str):
+        super().__init__(f"{file_path}: {message}")
+        self.file_path = file_path
+        self.message = message
+
+
+def parse_avatar_config(config_data: dict) -> AvatarConfig:
+    """把TOML解析结果转换为Avatar配置"""
+    llm_config = LLMConfig(
+        api_url=config_data.get('llm', {}).get('apiUrl', ''),
+        model=config_data.get('llm', {}).get('model', ''),
+        provider=config_data.get('llm', {}).get('provider', ''),
+        api_key=config_data.get('llm', {}).get('apiKey', ''),
+        embedding_model=config_data.get('llm', {}).get('embeddingModel')
+    )
+
+    tools_config = [
+        ToolConfig(id=tool_id)
+        for tool_id in config_data.get('tools', [])
+    ]
+
+    nostr_config = NostrConfig(
+        private_key=config_data.get('nostr', {}).get('privateKey', ''),
+        relays=config_data.get('nostr', {}).get('relays', [])
+    )
+
+    return AvatarConfig(
+        name=config_data.get('name', ''),
+        description=config_data.get('description', ''),
+        memoId=config_data.get('memoId', ''),
+        version=config_data.get('version', '1.0.0'),
+        author=config_data.get('author', ''),
+        tags=config_data.get('tags', []),
+        llm_config=llm_config,
+        tools_config=tools_config,
+        nostr_config=nostr_config
+    )
+
+
+def loads_avatar_config(text: str) -> AvatarConfig:
+    """从TOML文本加载Avatar配置，格式错误时抛出异常"""
+    return parse_avatar_config(tomli.loads(text))
+
+
+def load_avatar_config(file_path: str) -> AvatarConfig:
+    """从TOML文件加载Avatar配置，文件不存在或格式错误时抛出异常"""
+    with open(file_path, 'rb') as f:
+        return parse_avatar_config(tomli.load(f))
+
+
+def avatar_id_of(avatar_config: AvatarConfig) -> str:
+    """Avatar的唯一ID，优先使用全局唯一的memoId"""
+    return avatar_config.memoId or avatar_config.name
+
+
+def validate_avatar_config(avatar_config: AvatarConfig) -> None:
+    """校验启动Avatar所需的配置项，不满足时抛出 ValueError"""
+    # 只有校验私钥需要 nostr_sdk，导入本模块（例如解析命令行参数）时不加载
+    from nostr_sdk import Keys
+
+    if not avatar_id_of(avatar_config):
+        raise ValueError("缺少 memoId 或 name")
+    if avatar_config.llm_config.provider not in OPENAI_COMPATIBLE_PROVIDERS:
+        raise ValueError(f"不支持的LLM provider: {avatar_config.llm_config.provider}")
+    nostr_config = avatar_config.nostr_config
+    if not nostr_config.private_key:
+        raise ValueError("缺少 nostr.privateKey")
+    try:
+        Keys.parse(nostr_config.private_key)
+    except Exception as e:
+        raise ValueError("nostr.privateKey 不是有效的私钥") from e
+    if not nostr_config.relays:
+        raise ValueError("nostr.relays 不能为空")
+    for relay_url in nostr_config.relays:
+        if not relay_url.startswith(("ws://", "wss://")):
+            raise ValueError(f"无效的中继地址: {relay_url}")
+
+
+def parse_avatar_file(file_path: str) -> AvatarConfig:
+    """解析并校验单个配置文件，失败时抛出 AvatarConfigError"""
+    try:
+        avatar_config = load_avatar_config(file_path)
+        validate_avatar_config(avatar_config)
+    except AvatarConfigError:
+        raise
+    except Exception as e:
+        raise AvatarConfigError(file_path, str(e) or type(e).__name__) from e
+    return avatar_config
+
+
+def _parse_batch(file_paths: List[str]
+                 ) -> List[Tuple[str, Optional[AvatarConfig], Optional[str]]]:
+    """在工作进程中解析一批文件，返回 (文件, 配置, 错误)"""
+    results = []
+    for file_path in file_paths:
+        try:
+            results.append((file_path, parse_avatar_file(file_path), None))
+        except AvatarConfigError as e:
+            results.append((file_path, None, e.message))
+    return results
+
+
+def list_avatar_files(path: str) -> List[str]:
+    """配置路径下的所有TOML文件；path 为文件时返回它本身"""
+    if os.path.isfile(path):
+        return [path]
+    return sorted(
+        entry.path for entry in os.scandir(path)
+        if entry.is_file() and entry.name.endswith(".toml")
+        and not entry.name.startswith(".")
+    )
+
+
+def load_avatar_configs(file_paths: List[str], max_workers: Optional[int] = None
+                        ) -> Tuple[Dict[str, AvatarConfig], Dict[str, str]]:
+    """
+    并发解析并校验多个配置文件
+
+    文件较多时分批交给进程池解析（TOML解析和私钥校验都是CPU密集的），
+    同一Avatar ID出现在多个文件中时，这些文件都记为错误。
+
+    Args:
+        file_paths: 配置文件列表
+        max_workers: 解析进程数，为None时使用CPU核数
+
+    Returns:
+        (文件 -> 配置, 文件 -> 错误信息)
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    if len(file_paths) < PARALLEL_THRESHOLD or max_workers == 1:
+        results = _parse_batch(file_paths)
+    else:
+        # 每个进程处理若干批，减少进程间传输的次数
+        batch_size = max(1, len(file_paths) // (max_workers * 4))
+        batches = [file_paths[i:i + batch_size]
+                   for i in range(0, len(file_paths), batch_size)]
+        # 热加载时在线程中调用，nostr_sdk 的运行时线程已经启动，fork 出的子进程
+        # 可能继承被其他线程持有的锁，因此用 spawn 启动工作进程
+        mp_context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 mp_context=mp_context) as executor:
+            results = [item for batch in executor.map(_parse_batch, batches)
+                       for item in batch]
+
+    configs: Dict[str, AvatarConfig] = {}
+    errors: Dict[str, str] = {}
+    for file_path, avatar_config, error in results:
+        if error is not None:
+            errors[file_path] = error
+        else:
+            configs[file_path] = avatar_config
+
+    owners: Dict[str, List[str]] = {}
+    for file_path, avatar_config in configs.items():
+        owners.setdefault(avatar_id_of(avatar_config), []).append(file_path)
+    for avatar_id, files in owners.items():
+        if len(files) > 1:
+            for file_path in files:
+                errors[file_path] = (f"Avatar ID {avatar_id} 与其他文件重复: "
+                                     f"{', '.join(files)}")
+                del configs[file_path]
+    return configs, errors
+
+
+@dataclass
+class ConfigChanges:
+    """一次轮询发现的配置变化，键为Avatar ID"""
+    added: Dict[str, AvatarConfig] = field(default_factory=dict)
+    changed: Dict[str, AvatarConfig] = field(default_factory=dict)
+    removed: List[str] = field(default_factory=list)
+    errors: Dict[str, str] = field(default_factory=dict)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+
+class AvatarConfigWatcher:
+    """
+    按 mtime 轮询配置目录
+
+    只重新解析 mtime 或大小变化的文件，并与上次加载的配置比较，
+    内容不变的文件（例如只是被 touch）不会触发重启。解析失败的文件
+    保留上一次的有效配置，Avatar继续按旧配置运行；解析成功但未能应用的
+    变化通过 revert 撤销，下次轮询时重新解析对应文件并重试。
+    """
+
+    def __init__(self, path: str, max_workers: Optional[int] = None):
+        """
+        Args:
+            path: 配置文件或目录
+            max_workers: 解析进程数
+        """
+        self.path = path
+        self.max_workers = max_workers
+        # 文件 -> (mtime_ns, size)
+        self._stats: Dict[str, Tuple[int, int]] = {}
+        # 文件 -> 当前生效的配置
+        self._configs: Dict[str, AvatarConfig] = {}
+        # 最近一次轮询之前的配置，用于撤销未能应用的变化
+        self._previous: Dict[str, AvatarConfig] = {}
+
+    def track(self, configs: Dict[str, AvatarConfig]) -> None:
+        """以已加载的配置（文件 -> 配置）作为比较的基准"""
+        self._stats = self._stat_files(list_avatar_files(self.path))
+        self._configs = dict(configs)
+
+    def poll(self) -> ConfigChanges:
+        """检查配置文件的变化（阻塞调用，应放在线程中执行）"""
+        changes = ConfigChanges()
+        try:
+            stats = self._stat_files(list_avatar_files(self.path))
+        except OSError as e:
+            logger.error(f"读取Avatar配置目录失败 {self.path}: {str(e)}")
+            return changes
+
+        modified = [path for path, stat in stats.items()
+                    if self._stats.get(path) != stat]
+        deleted = [path for path in self._stats if path not in stats]
+        self._stats = stats
+        if not modified and not deleted:
+            return changes
+
+        parsed, changes.errors = load_avatar_configs(modified, self.max_workers)
+        configs = dict(self._configs)
+        for file_path in deleted:
+            configs.pop(file_path, None)
+        configs.update(parsed)
+
+        old = {avatar_id_of(c): c for c in self._configs.values()}
+        new: Dict[str, AvatarConfig] = {}
+        # 先放入未修改的文件，ID冲突时保留原有的那份
+        for file_path in sorted(configs, key=lambda path: path in parsed):
+            avatar_config = configs[file_path]
+            avatar_id = avatar_id_of(avatar_config)
+            if avatar_id in new:
+                changes.errors[file_path] = f"Avatar ID {avatar_id} 与其他文件重复"
+                del configs[file_path]
+                continue
+            new[avatar_id] = avatar_config
+
+        for avatar_id, avatar_config in new.items():
+            if avatar_id not in old:
+                changes.added[avatar_id] = avatar_config
+            elif avatar_config != old[avatar_id]:
+                changes.changed[avatar_id] = avatar_config
+        changes.removed = [avatar_id for avatar_id in old if avatar_id not in new]
+        self._previous = self._configs
+        self._configs = configs
+        return changes
+
+    def revert(self, avatar_ids: List[str]) -> None:
+        """
+        撤销最近一次轮询中未能应用的变化
+
+        这些Avatar恢复为上一次的配置，对应的文件在下次轮询时视为已修改，
+        重新解析后再次尝试应用。
+        """
+        failed = set(avatar_ids)
+        for file_path in [path for path, c in self._configs.items()
+                          if avatar_id_of(c) in failed]:
+            del self._configs[file_path]
+            self._stats.pop(file_path, None)
+        for file_path, avatar_config in self._previous.items():
+            if avatar_id_of(avatar_config) in failed:
+                self._configs[file_path] = avatar_config
+                self._stats.pop(file_path, None)
+
+    @staticmethod
+    def _stat_files(file_paths: List[str]) -> Dict[str, Tuple[int, int]]:
+        stats = {}
+        for file_path in file_paths:
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                continue
+            stats[file_path] = (stat.st_mtime_ns, stat.st_size)
+        return stats
@@ -1,9 +1,7 @@
 from dataclasses import dataclass, field
-from typing import List, Optional
 import os
-import tomli
 
-from avatarai.config import AvatarConfig, LLMConfig, ToolConfig, NostrConfig, AvatarAIConfig
+from avatarai.config import AvatarAIConfig
 from avatarai.logger import init_logger
 
 logger = init_logger(__name__)
@@ -13,7 +11,16 @@ logger = init_logger(__name__)
 class EngineArgs:
     """Arguments for AvatarAI engine."""
     avatar_path: str = field(default=None,
-                                   metadata={"description": "Avatar配置文件路径"})
+                                   metadata={"description": "Avatar配置文件或目录路径"})
+    data_dir: str = field(default=os.path.expanduser("~/.avatarai"),
+                          metadata={"description": "Avatar持久化状态目录"})
+    startup_timeout: float = field(
+        default=30.0, metadata={"description": "单个Avatar连接和订阅的最长时间（秒）"})
+    shutdown_timeout: float = field(
+        default=30.0, metadata={"description": "单个Avatar排空并停止的最长时间（秒）"})
+    reload_interval: float = field(
+        default=0.0,
+        metadata={"description": "检查配置文件变化的间隔（秒），0表示不热加载"})
 
     def __post_init__(self):
         """初始化后的处理"""
@@ -24,59 +31,58 @@ class EngineArgs:
             raise ValueError(f"Avatar配置文件路径不存在: {self.avatar_path}")
 
     def create_avatar_ai_config(self) -> AvatarAIConfig:
-        """从Avatar路径创建AvatarAI配置"""
-        avatar_config = None
-        if self.avatar_path.endswith('.toml'):
-            avatar_config = self._load_avatar_config(self.avatar_path)
-
-        if not avatar_config:
-            raise ValueError("未能从指定路径加载任何有效的Avatar配置")
-
-        return AvatarAIConfig(avatar_config=avatar_config)
-
-    def _load_avatar_config(self, file_path: str) -> Optional[AvatarConfig]:
-        """从TOML文件加载Avatar配置"""
-        try:
-            with open(file_path, 'rb') as f:
-                config_data = tomli.load(f)
-
-            llm_config = LLMConfig(
-                api_url=config_data.get('llm', {}).get('apiUrl', ''),
-                model=config_data.get('llm', {}).get('model', ''),
-                provider=config_data.get('llm', {}).get('provider', ''),
-                api_key=config_data.get('llm', {}).get('apiKey', '')
-            )
-
-            tools_config = [
-                ToolConfig(id=tool_id)
-                for tool_id in config_data.get('tools', [])
-            ]
-
-            nostr_config = NostrConfig(
-                private_key=config_data.get('nostr', {}).get('privateKey', ''),
-                relays=config_data.get('nostr', {}).get('relays', [])
-            )
+        """
+        从Avatar路径创建AvatarAI配置
+
+        路径可以是单个TOML文件或包含多个TOML文件的目录，所有文件并发解析并
+        在启动前校验，任何文件无效时列出每个文件的错误并拒绝启动。
+        """
+        # 解析和校验依赖 nostr_sdk，只解析命令行参数时不需要加载
+        from avatarai.engine.config_loader import (
+            avatar_id_of,
+            list_avatar_files,
+            load_avatar_configs,
+        )
 
-            return AvatarConfig(
-                name=config_data.get('name', ''),
-                description=config_data.get('description', ''),
-                memoId=config_data.get('memoId', ''),
-                version=config_data.get('version', '1.0.0'),
-                author=config_data.get('author', ''),
-                tags=config_data.get('tags', []),
-                llm_config=llm_config,
-                tools_config=tools_config,
-                nostr_config=nostr_config
-            )
-        except Exception as e:
-            logger.error(f"加载Avatar配置文件失败 {file_path}: {str(e)}")
-            return None
+        file_paths = list_avatar_files(self.avatar_path)
+        configs, errors = load_avatar_configs(file_paths)
+        if errors:
+            details = "\n".join(f"  {file_path}: {error}"
+                                for file_path, error in sorted(errors.items()))
+            raise ValueError(f"{len(errors)} 个Avatar配置文件无效:\n{details}")
+        if not configs:
+            raise ValueError("未能从指定路径加载任何有效的Avatar配置: "
+                             f"{self.avatar_path}")
+        logger.info(f"从 {self.avatar_path} 加载了 {len(configs)} 个Avatar配置")
+
+        return AvatarAIConfig(avatar_configs=list(configs.values()),
+                              data_dir=self.data_dir,
+                              startup_timeout=self.startup_timeout,
+                              shutdown_timeout=self.shutdown_timeout,
+                              avatar_path=self.avatar_path,
+                              avatar_files={
+                                  file_path: avatar_id_of(avatar_config)
+                                  for file_path, avatar_config in configs.items()},
+                              reload_interval=self.reload_interval)
 
     @staticmethod
     def add_cli_args(parser):
         """添加命令行参数"""
         parser.add_argument('--avatar-path', type=str, default=None,
-                           help='Avatar配置文件路径，xxxx.toml')
+                           help='Avatar配置文件路径（xxxx.toml），或包含多个TOML文件的目录')
+        parser.add_argument('--data-dir', type=str, default=EngineArgs.data_dir,
+                           help='Avatar持久化状态目录（事件检查点等）')
+        parser.add_argument('--startup-timeout', type=float,
+                           default=EngineArgs.startup_timeout,
+                           help='单个Avatar连接中继和订阅的最长时间（秒），'
+                                '超时的Avatar不影响其他Avatar')
+        parser.add_argument('--shutdown-timeout', type=float,
+                           default=EngineArgs.shutdown_timeout,
+                           help='停止时单个Avatar排空队列的最长时间（秒）')
+        parser.add_argument('--reload-interval', type=float,
+                           default=EngineArgs.reload_interval,
+                           help='检查配置文件变化的间隔（秒），只重启配置有变化的Avatar；'
+                                '0表示不热加载')
         return parser
 
 
@@ -84,5 +90,9 @@ class EngineArgs:
     def from_cli_args(cls, args):
         """从命令行参数创建EngineArgs实例"""
         return cls(
-            avatar_path=args.avatar_path
+            avatar_path=args.avatar_path,
+            data_dir=args.data_dir,
+            startup_timeout=args.startup_timeout,
+            shutdown_timeout=args.shutdown_timeout,
+            reload_interval=args.reload_interval
         )
@@ -0,0 +1,52 @@
+import asyncio
+import zlib
+from typing import Dict, Generic, Iterator, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class AvatarRegistry(Generic[T]):
+    """
+    分片的 Avatar 注册表
+
+    以 avatar_id 为键，O(1) 查找。写操作按分片加锁，
+    不同分片上的热添加/删除互不阻塞，读操作无锁。
+    """
+
+    def __init__(self, num_shards: int = 16):
+        if num_shards <= 0:
+            raise ValueError("num_shards 必须大于0")
+        self.num_shards = num_shards
+        self._shards: List[Dict[str, T]] = [{} for _ in range(num_shards)]
+        self._locks: List[asyncio.Lock] = [asyncio.Lock() for _ in range(num_shards)]
+
+    def _shard_index(self, avatar_id: str) -> int:
+        # crc32 在进程间稳定，hash() 受 PYTHONHASHSEED 影响
+        return zlib.crc32(avatar_id.encode("utf-8")) % self.num_shards
+
+    def lock(self, avatar_id: str) -> asyncio.Lock:
+        """返回 avatar_id 所在分片的写锁"""
+        return self._locks[self._shard_index(avatar_id)]
+
+    def get(self, avatar_id: str) -> Optional[T]:
+        return self._shards[self._shard_index(avatar_id)].get(avatar_id)
+
+    def put(self, avatar_id: str, item: T) -> None:
+        self._shards[self._shard_index(avatar_id)][avatar_id] = item
+
+    def pop(self, avatar_id: str) -> Optional[T]:
+        return self._shards[self._shard_index(avatar_id)].pop(avatar_id, None)
+
+    def ids(self) -> List[str]:
+        return [avatar_id for shard in self._shards for avatar_id in shard]
+
+    def items(self) -> Iterator[Tuple[str, T]]:
+        for shard in self._shards:
+            # 拷贝一份，避免迭代期间被并发修改
+            yield from list(shard.items())
+
+    def __contains__(self, avatar_id: str) -> bool:
+        return avatar_id in self._shards[self._shard_index(avatar_id)]
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
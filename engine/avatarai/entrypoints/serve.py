@@ -1,29 +1,297 @@
 import asyncio
+import hmac
+import importlib
+import json
+import os
+import time
 from argparse import Namespace
+from contextlib import asynccontextmanager
 from typing import Any, Optional
 
-from fastapi import FastAPI
-from fastapi.responses import Response
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
 
 from avatarai.utils.args_utils import FlexibleArgumentParser
+from avatarai.config import AvatarAIConfig, AvatarConfig
 from avatarai.engine.engine_args import EngineArgs
-from avatarai.engine.async_avatar_engine import AsyncAvatarEngine
 from avatarai.logger import init_logger
+from avatarai.utils.metrics import get_metrics_registry
+from avatarai.utils.profiler import get_profiler
+from avatarai.utils.tasks import get_loop_monitor, get_task_supervisor
 
 
 logger = init_logger("avatarai.entrypoints.serve")
 
 TIMEOUT_KEEP_ALIVE = 5  # seconds.
-app = FastAPI()
+# 已校验的配置，由 init_app 设置；引擎在 lifespan 中创建
+engine_config: Optional[AvatarAIConfig] = None
 engine = None
+# 管理接口的访问令牌，为None时管理接口不开放
+admin_token: Optional[str] = None
+
+
+async def _start_engine(engine_config: AvatarAIConfig) -> None:
+    """
+    加载引擎模块、创建引擎并启动所有Avatar
+
+    引擎依赖的模块（nostr客户端、LLM、存储、NumPy等）在线程中导入，
+    HTTP服务在导入期间已经开始监听，/health 可以立即响应。
+    """
+    global engine
+
+    started = time.monotonic()
+    module = await asyncio.to_thread(importlib.import_module,
+                                     "avatarai.engine.async_avatar_engine")
+    engine = module.AsyncAvatarEngine(engine_config=engine_config)
+    logger.info(f"引擎模块加载完成，耗时 {time.monotonic() - started:.2f}s")
+    await engine.serve()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    引擎作为后台任务随HTTP服务启动和停止
+
+    加载引擎、连接中继、订阅都不阻塞HTTP服务，启动期间 /health 即可访问，/ready 在
+    所有Avatar完成订阅后才返回200；停止时先结束启动任务，再排空并停止各Avatar。
+    """
+    loop_monitor = get_loop_monitor()
+    loop_monitor.start()
+    serve_task = None
+    if engine_config is not None:
+        serve_task = get_task_supervisor().spawn(_start_engine(engine_config),
+                                                 "engine-serve")
+    try:
+        yield
+    finally:
+        if serve_task is not None and not serve_task.done():
+            serve_task.cancel()
+            await asyncio.gather(serve_task, return_exceptions=True)
+        if engine is not None:
+            await engine.stop()
+            logger.info("引擎已停止")
+        await loop_monitor.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+async def require_admin(request: Request) -> None:
+    """
+    管理接口（/avatars、/profiler、/tasks）的访问控制
+
+    要求请求头 Authorization: Bearer <token>。未配置 --admin-token 时管理接口
+    不开放，一律返回404：经反向代理转发的请求在服务端看来也来自本机，
+    不能按来源地址放行。
+    """
+    if not admin_token:
+        raise HTTPException(status_code=404,
+                            detail="未配置 --admin-token，管理接口未开放")
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token, admin_token):
+        raise HTTPException(status_code=401, detail="需要有效的管理令牌")
 
 
 @app.get("/health")
 async def health() -> Response:
-    """健康检查接口"""
+    """存活检查接口，只反映进程和事件循环可响应"""
     return Response(status_code=200)
 
 
+@app.get("/ready")
+async def ready() -> JSONResponse:
+    """就绪检查接口，所有Avatar订阅已建立且有中继在线时返回200，否则返回503"""
+    if engine is None:
+        return JSONResponse({"ready": False}, status_code=503)
+    readiness = engine.readiness()
+    return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
+
+
+@app.get("/metrics")
+async def metrics() -> Response:
+    """Prometheus 指标接口"""
+    # 在事件循环中分块复制各组件的计数，格式化放到线程中，避免阻塞事件处理
+    collected = await get_metrics_registry().collect()
+    text = await asyncio.to_thread(collected.render)
+    return Response(content=text, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/tasks", dependencies=[Depends(require_admin)])
+async def tasks() -> JSONResponse:
+    """后台任务及其挂起位置、事件循环延迟和最近的阻塞记录"""
+    supervisor = get_task_supervisor()
+    return JSONResponse({
+        "groups": supervisor.stats(),
+        "tasks": supervisor.snapshot(),
+        "event_loop": get_loop_monitor().stats(),
+    })
+
+
+@app.get("/profiler", dependencies=[Depends(require_admin)])
+async def profiler_status() -> JSONResponse:
+    """采样分析器状态"""
+    return JSONResponse(get_profiler().stats())
+
+
+@app.post("/profiler/start", dependencies=[Depends(require_admin)])
+async def start_profiler(interval: Optional[float] = None,
+                         reset: bool = False) -> JSONResponse:
+    """
+    开始采样
+
+    Args:
+        interval: 采样间隔（秒），默认10ms
+        reset: 是否清空之前的样本
+    """
+    if interval is not None and not 0.001 <= interval <= 1.0:
+        raise HTTPException(status_code=400, detail="interval 需要在 0.001 到 1 秒之间")
+    profiler = get_profiler()
+    if reset:
+        profiler.reset()
+    profiler.start(interval)
+    return JSONResponse(profiler.stats())
+
+
+@app.post("/profiler/stop", dependencies=[Depends(require_admin)])
+async def stop_profiler() -> JSONResponse:
+    """停止采样，已有样本保留"""
+    profiler = get_profiler()
+    # 等待采样线程退出，不占用事件循环
+    await asyncio.to_thread(profiler.stop)
+    return JSONResponse(profiler.stats())
+
+
+@app.get("/profiler/collapsed", dependencies=[Depends(require_admin)])
+async def profiler_collapsed() -> Response:
+    """collapsed 格式的调用栈，可直接生成火焰图"""
+    text = await asyncio.to_thread(get_profiler().collapsed)
+    return Response(content=text, media_type="text/plain; charset=utf-8")
+
+
+def _resolve_config_path(path: str) -> str:
+    """按路径加载配置时，只允许读取配置目录（--avatar-path）下的TOML文件"""
+    root = engine_config.avatar_path if engine_config else None
+    if not root:
+        raise HTTPException(status_code=400,
+                            detail="未配置 --avatar-path，不能按路径加载Avatar配置")
+    root = os.path.realpath(root)
+    if os.path.isfile(root):
+        root = os.path.dirname(root)
+    # 相对路径相对于配置目录解析，符号链接解析后也必须仍在目录内
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root or not resolved.endswith(".toml"):
+        raise HTTPException(status_code=400, detail="只能加载配置目录下的 .toml 文件")
+    return resolved
+
+
+def _require_engine() -> None:
+    """引擎仍在加载时返回503"""
+    if engine is None:
+        raise HTTPException(status_code=503, detail="引擎正在启动")
+
+
+async def _read_avatar_config(request: Request) -> AvatarConfig:
+    """
+    从请求中读取Avatar配置
+
+    请求体为TOML文本，或JSON：{"path": "配置目录下的TOML文件路径"}
+    / {"toml": "TOML文本"}
+    """
+    from avatarai.engine.config_loader import (
+        load_avatar_config,
+        loads_avatar_config,
+        validate_avatar_config,
+    )
+
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("application/json"):
+            data = json.loads(body)
+            if data.get("path"):
+                file_path = _resolve_config_path(data["path"])
+                avatar_config = await asyncio.to_thread(load_avatar_config, file_path)
+            else:
+                avatar_config = loads_avatar_config(data.get("toml", ""))
+        else:
+            avatar_config = loads_avatar_config(body.decode("utf-8"))
+        validate_avatar_config(avatar_config)
+        return avatar_config
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400,
+                            detail=f"无效的Avatar配置: {str(e)}") from e
+
+
+def _describe_avatar(avatar_id: str, agent) -> dict:
+    return {
+        "id": avatar_id,
+        "name": agent.avatar_config.name,
+        "public_key": agent.nostr_client.public_key.to_hex(),
+        "relays": agent.nostr_client.relays,
+        "connected": agent.nostr_client.connected,
+        "stats": agent.stats(),
+    }
+
+
+@app.get("/avatars", dependencies=[Depends(require_admin)])
+async def list_avatars() -> JSONResponse:
+    """列出引擎托管的所有Avatar"""
+    _require_engine()
+    return JSONResponse({"avatars": await engine.get_all_avatars_async()})
+
+
+@app.get("/avatars/{avatar_id}", dependencies=[Depends(require_admin)])
+async def get_avatar(avatar_id: str) -> JSONResponse:
+    """查看单个Avatar的状态和统计"""
+    _require_engine()
+    agent = await engine.get_avatar_async(avatar_id)
+    if agent is None:
+        raise HTTPException(status_code=404, detail=f"Avatar不存在: {avatar_id}")
+    return JSONResponse(_describe_avatar(avatar_id, agent))
+
+
+@app.post("/avatars", dependencies=[Depends(require_admin)])
+async def add_avatar(request: Request) -> JSONResponse:
+    """加载并启动一个新的Avatar，不影响其他Avatar"""
+    _require_engine()
+    avatar_config = await _read_avatar_config(request)
+    avatar_id = engine.avatar_id_of(avatar_config)
+    try:
+        added = await engine.add_avatar_async(avatar_id, avatar_config=avatar_config)
+    except Exception as e:
+        logger.error(f"添加Avatar {avatar_id} 失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"添加Avatar失败: {str(e)}") from e
+    if not added:
+        raise HTTPException(status_code=409, detail=f"Avatar已存在: {avatar_id}")
+    return JSONResponse({"id": avatar_id}, status_code=201)
+
+
+@app.put("/avatars/{avatar_id}", dependencies=[Depends(require_admin)])
+async def replace_avatar(avatar_id: str, request: Request) -> JSONResponse:
+    """用新配置更新单个Avatar：先排空旧实例再启动新实例，新实例启动失败时恢复旧实例"""
+    _require_engine()
+    avatar_config = await _read_avatar_config(request)
+    if engine.avatar_id_of(avatar_config) != avatar_id:
+        raise HTTPException(status_code=400, detail="配置中的Avatar ID与路径不一致")
+    try:
+        replaced = await engine.replace_avatar_async(avatar_id, avatar_config)
+    except Exception as e:
+        logger.error(f"更新Avatar {avatar_id} 失败: {str(e)}")
+        raise HTTPException(status_code=500,
+                            detail=f"启动Avatar失败，已保留原配置: {str(e)}") from e
+    return JSONResponse({"id": avatar_id}, status_code=200 if replaced else 201)
+
+
+@app.delete("/avatars/{avatar_id}", dependencies=[Depends(require_admin)])
+async def remove_avatar(avatar_id: str) -> Response:
+    """停止并移除Avatar，处理完已入队的事件后才返回"""
+    _require_engine()
+    if not await engine.remove_avatar_async(avatar_id):
+        raise HTTPException(status_code=404, detail=f"Avatar不存在: {avatar_id}")
+    return Response(status_code=204)
+
+
 def build_app(args: Namespace) -> FastAPI:
     global app
 
@@ -32,14 +300,16 @@ def build_app(args: Namespace) -> FastAPI:
 
 
 async def init_app(args: Namespace) -> FastAPI:
-    global engine
+    global engine_config, admin_token
 
     if args.root_path:
         app.root_path = args.root_path
 
+    admin_token = getattr(args, "admin_token", None) or None
     engine_args = EngineArgs.from_cli_args(args)
-    engine = AsyncAvatarEngine.from_engine_args(engine_args)
-    await engine.serve()
+    # 配置在监听端口前校验，配置无效时直接退出；
+    # 引擎的创建和启动在 lifespan 中以后台任务进行
+    engine_config = engine_args.create_avatar_ai_config()
     return app
 
 
@@ -54,6 +324,8 @@ async def run_server(args: Namespace, **uvicorn_kwargs: Any) -> None:
         host=args.host or "0.0.0.0",
         port=args.port,
         log_level=args.log_level,
+        timeout_keep_alive=TIMEOUT_KEEP_ALIVE,
+        **uvicorn_kwargs,
     )
     server = uvicorn.Server(config)
     await server.serve()
@@ -69,6 +341,12 @@ if __name__ == "__main__":
         default=None,
         help="FastAPI root_path when app is behind a path based routing proxy")
     parser.add_argument("--log-level", type=str, default="info")
+    parser.add_argument(
+        "--admin-token",
+        type=str,
+        default=os.getenv("AVATARAI_ADMIN_TOKEN"),
+        help="管理接口（/avatars、/profiler、/tasks）的Bearer令牌，"
+        "默认读取 AVATARAI_ADMIN_TOKEN；未配置时不开放管理接口")
     parser = EngineArgs.add_cli_args(parser)
     args = parser.parse_args()
 
@@ -1,11 +1,12 @@
-import datetime
+import atexit
 import json
 import logging
 import os
-import sys
-from functools import lru_cache, partial
+import queue
+from functools import lru_cache
 from logging import Logger
 from logging.config import dictConfig
+from logging.handlers import QueueListener
 from os import path
 from types import MethodType
 from typing import Any, Optional, cast
@@ -15,6 +16,14 @@ AVATARAI_CONFIGURE_LOGGING = os.environ.get("AVATARAI_CONFIGURE_LOGGING", "1") =
 AVATARAI_LOGGING_CONFIG_PATH = os.environ.get("AVATARAI_LOGGING_CONFIG_PATH", "")
 AVATARAI_LOGGING_LEVEL = os.environ.get("AVATARAI_LOGGING_LEVEL", "INFO")
 AVATARAI_LOGGING_PREFIX = os.environ.get("AVATARAI_LOGGING_PREFIX", "[AvatarAI] ")
+# text 或 json
+AVATARAI_LOGGING_FORMAT = os.environ.get("AVATARAI_LOGGING_FORMAT", "text")
+# 为 1 时日志经有界队列交给后台线程写出，调用方不做格式化和I/O
+AVATARAI_LOGGING_QUEUE = os.environ.get("AVATARAI_LOGGING_QUEUE", "0") == "1"
+AVATARAI_LOGGING_QUEUE_SIZE = int(
+    os.environ.get("AVATARAI_LOGGING_QUEUE_SIZE", "10000"))
+# 按记录器限速，例如 "avatarai.nostr=50,avatarai.agent=5"（条/秒，只限制 WARNING 以下）
+AVATARAI_LOGGING_RATE_LIMITS = os.environ.get("AVATARAI_LOGGING_RATE_LIMITS", "")
 
 _FORMAT = (f"{AVATARAI_LOGGING_PREFIX}%(levelname)s %(asctime)s "
            "%(filename)s:%(lineno)d] %(message)s")
@@ -27,11 +36,22 @@ DEFAULT_LOGGING_CONFIG = {
             "datefmt": _DATE_FORMAT,
             "format": _FORMAT,
         },
+        "avatarai_json": {
+            "()": "avatarai.utils.logging_utils.JsonFormatter",
+        },
+    },
+    "filters": {
+        "avatarai_rate_limit": {
+            "()": "avatarai.utils.logging_utils.RateLimitFilter",
+            "spec": AVATARAI_LOGGING_RATE_LIMITS,
+        },
     },
     "handlers": {
         "avatarai": {
             "class": "logging.StreamHandler",
-            "formatter": "avatarai",
+            "formatter": ("avatarai_json" if AVATARAI_LOGGING_FORMAT == "json"
+                          else "avatarai"),
+            "filters": ["avatarai_rate_limit"] if AVATARAI_LOGGING_RATE_LIMITS else [],
             "level": AVATARAI_LOGGING_LEVEL,
             "stream": "ext://sys.stdout",
         },
@@ -110,6 +130,45 @@ def _configure_avatarai_root_logger() -> None:
     if logging_config:
         dictConfig(logging_config)
 
+    if AVATARAI_LOGGING_QUEUE:
+        _enable_queue_logging(logging.getLogger("avatarai"),
+                              AVATARAI_LOGGING_QUEUE_SIZE)
+
+
+_queue_listener: Optional[QueueListener] = None
+
+
+def _enable_queue_logging(root: Logger, queue_size: int) -> None:
+    """
+    把记录器上已配置的处理器移到后台监听线程，记录器只保留一个入队的处理器
+
+    处理器上的过滤器（例如限速）移到入队处理器上，在调用方线程中尽早丢弃日志。
+    """
+    global _queue_listener
+    from avatarai.utils.logging_utils import (
+        DrainingQueueListener,
+        NonBlockingQueueHandler,
+    )
+
+    handlers = list(root.handlers)
+    if not handlers:
+        return
+    queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+    for handler in handlers:
+        root.removeHandler(handler)
+        for log_filter in list(handler.filters):
+            handler.removeFilter(log_filter)
+            queue_handler.addFilter(log_filter)
+    # 低于所有处理器级别的日志不必入队
+    queue_handler.setLevel(min(handler.level for handler in handlers))
+    root.addHandler(queue_handler)
+
+    _queue_listener = DrainingQueueListener(queue_handler.queue, *handlers,
+                                            respect_handler_level=True)
+    _queue_listener.start()
+    # 退出时写完队列中剩余的日志
+    atexit.register(_queue_listener.stop)
+
 
 def init_logger(name: str) -> _AvatarAILogger:
     """此函数的主要目的是确保以这样的方式检索记录器，
@@ -135,63 +194,3 @@ _configure_avatarai_root_logger()
 
 logger = init_logger(__name__)
 
-
-def _trace_calls(log_path, root_dir, frame, event, arg=None):
-    if event in ['call', 'return']:
-        # 提取文件名、行号、函数名和代码对象
-        filename = frame.f_code.co_filename
-        lineno = frame.f_lineno
-        func_name = frame.f_code.co_name
-        if not filename.startswith(root_dir):
-            # 只记录 avatarai root_dir 中的函数
-            return
-        # 记录每个函数调用或返回
-        try:
-            last_frame = frame.f_back
-            if last_frame is not None:
-                last_filename = last_frame.f_code.co_filename
-                last_lineno = last_frame.f_lineno
-                last_func_name = last_frame.f_code.co_name
-            else:
-                # 初始帧
-                last_filename = ""
-                last_lineno = 0
-                last_func_name = ""
-            with open(log_path, 'a') as f:
-                ts = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
-                if event == 'call':
-                    f.write(f"{ts} 调用"
-                            f" {func_name} 在 {filename}:{lineno}"
-                            f" 来自 {last_func_name} 在 {last_filename}:"
-                            f"{last_lineno}\n")
-                else:
-                    f.write(f"{ts} 返回自"
-                            f" {func_name} 在 {filename}:{lineno}"
-                            f" 到 {last_func_name} 在 {last_filename}:"
-                            f"{last_lineno}\n")
-        except NameError:
-            # 关闭期间模块被删除
-            pass
-    return partial(_trace_calls, log_path, root_dir)
-
-
-def enable_trace_function_call(log_file_path: str,
-                               root_dir: Optional[str] = None):
-    """
-    启用跟踪 `root_dir` 下的代码中的每个函数调用。
-    这对调试挂起或崩溃很有用。
-    `log_file_path` 是日志文件的路径。
-    `root_dir` 是要跟踪的代码的根目录。如果为 None，则为 avatarai 根目录。
-
-    请注意，此调用是线程级的，任何调用此函数的线程都将启用跟踪。
-    其他线程不受影响。
-    """
-    logger.warning(
-        "AVATARAI_TRACE_FUNCTION 已启用。它将记录 Python 执行的每个"
-        " 函数。这将使代码运行变慢。建议"
-        "仅用于调试挂起或崩溃。")
-    logger.info("跟踪帧日志保存到 %s", log_file_path)
-    if root_dir is None:
-        # 默认情况下，这是 avatarai 根目录
-        root_dir = os.path.dirname(os.path.dirname(__file__))
-    sys.settrace(partial(_trace_calls, log_file_path, root_dir))
@@ -0,0 +1,240 @@
+import asyncio
+import os
+import sqlite3
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from avatarai.logger import init_logger
+from avatarai.utils.tasks import get_task_supervisor
+
+logger = init_logger("avatarai.memory.conversation")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    avatar_id TEXT NOT NULL,
+    peer TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    created_at INTEGER NOT NULL,
+    PRIMARY KEY (avatar_id, peer, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS conversations (
+    avatar_id TEXT NOT NULL,
+    peer TEXT NOT NULL,
+    last_seq INTEGER NOT NULL,
+    PRIMARY KEY (avatar_id, peer)
+) WITHOUT ROWID;
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：ASCII约4个字符一个token，其他字符（如中文）按一个字符一个token"""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars) + 1
+
+
+class StoredMessage(NamedTuple):
+    seq: int
+    role: str
+    content: str
+    tokens: int
+
+
+class _ConversationWindow:
+    """单个会话最近的消息，总token数不超过预算"""
+
+    def __init__(self, budget: int, next_seq: int):
+        self.budget = budget
+        self.next_seq = next_seq
+        self.messages: Deque[StoredMessage] = deque()
+        self.tokens = 0
+
+    def push(self, message: StoredMessage) -> None:
+        self.messages.append(message)
+        self.tokens += message.tokens
+        self._trim()
+
+    def prepend(self, message: StoredMessage) -> bool:
+        """加载历史时从新到旧补齐，超出预算返回False"""
+        if self.messages and self.tokens + message.tokens > self.budget:
+            return False
+        self.messages.appendleft(message)
+        self.tokens += message.tokens
+        return True
+
+    def _trim(self) -> None:
+        # 至少保留最新的一条消息
+        while len(self.messages) > 1 and self.tokens > self.budget:
+            self.tokens -= self.messages.popleft().tokens
+
+
+class ConversationStore:
+    """
+    Avatar会话记忆的本地持久化存储（SQLite）
+
+    按 (Avatar, 对端公钥) 记录完整的消息历史。每个会话在内存中维护一个
+    不超过token预算的滑动窗口，新消息追加到窗口尾部并从头部截断，
+    构建上下文时不需要重新读取历史；窗口只在首次访问时按主键倒序读取
+    最近的若干条，耗时与历史总量无关。
+    写入先缓存在内存中批量提交，调用 start 后还会定时提交，
+    一阵消息之后长时间没有新消息时，最后一批也不会一直留在内存中。
+    """
+
+    def __init__(self, path: str, token_budget: int = 2048, cache_size: int = 1024,
+                 flush_interval: float = 1.0) -> None:
+        """
+        Args:
+            path: SQLite 数据库文件路径
+            token_budget: 每个会话上下文的token预算
+            cache_size: 内存中保留窗口的会话数量
+            flush_interval: 两次批量提交的最小间隔（秒）
+        """
+        self.path = path
+        self.token_budget = token_budget
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+        self._windows: OrderedDict[Tuple[str, str], _ConversationWindow] = (
+            OrderedDict())
+        self._pending_messages: List[tuple] = []
+        self._pending_conversations: Dict[Tuple[str, str], int] = {}
+        self._last_flush = time.monotonic()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """启动定时提交任务，在事件循环中调用"""
+        if self._flush_task is None:
+            self._flush_task = get_task_supervisor().spawn(
+                self._flush_periodically(), "conversation-flush")
+
+    def for_avatar(self, avatar_id: str) -> "AvatarMemory":
+        return AvatarMemory(self, avatar_id)
+
+    def append(self, avatar_id: str, peer: str, role: str, content: str) -> int:
+        """追加一条消息，返回它在会话中的序号"""
+        window = self._window(avatar_id, peer)
+        message = StoredMessage(window.next_seq, role, content,
+                                estimate_tokens(content))
+        window.next_seq += 1
+        window.push(message)
+        self._pending_messages.append(
+            (avatar_id, peer, message.seq, role, content, message.tokens,
+             int(time.time())))
+        self._pending_conversations[(avatar_id, peer)] = message.seq
+        self._maybe_flush()
+        return message.seq
+
+    def context(self, avatar_id: str, peer: str) -> List[Dict[str, str]]:
+        """会话的上下文：预算内最近的消息，OpenAI 消息格式"""
+        window = self._window(avatar_id, peer)
+        return [{"role": m.role, "content": m.content} for m in window.messages]
+
+    def history(self, avatar_id: str, peer: str, limit: int = 50,
+                before_seq: Optional[int] = None) -> List[StoredMessage]:
+        """按序号倒序分页读取完整历史"""
+        self.flush()
+        rows = self._conn.execute(
+            "SELECT seq, role, content, tokens FROM messages "
+            "WHERE avatar_id = ? AND peer = ? AND seq < ? "
+            "ORDER BY seq DESC LIMIT ?",
+            (avatar_id, peer, before_seq if before_seq is not None else 2 ** 62, limit)
+        ).fetchall()
+        return [StoredMessage(*row) for row in rows]
+
+    def flush(self) -> None:
+        """提交缓存的消息"""
+        messages, self._pending_messages = self._pending_messages, []
+        conversations, self._pending_conversations = self._pending_conversations, {}
+        self._last_flush = time.monotonic()
+        if not messages and not conversations:
+            return
+        try:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO messages "
+                    "(avatar_id, peer, seq, role, content, tokens, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", messages)
+                self._conn.executemany(
+                    "INSERT INTO conversations (avatar_id, peer, last_seq) "
+                    "VALUES (?, ?, ?) "
+                    "ON CONFLICT (avatar_id, peer) DO UPDATE SET "
+                    "last_seq = MAX(last_seq, excluded.last_seq)",
+                    [key + (last_seq,) for key, last_seq in conversations.items()])
+        except sqlite3.Error as e:
+            logger.error(f"写入会话记忆失败: {str(e)}")
+
+    def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self.flush()
+        self._conn.close()
+
+    def _window(self, avatar_id: str, peer: str) -> _ConversationWindow:
+        key = (avatar_id, peer)
+        window = self._windows.get(key)
+        if window is not None:
+            self._windows.move_to_end(key)
+            return window
+
+        window = self._load_window(avatar_id, peer)
+        self._windows[key] = window
+        while len(self._windows) > self.cache_size:
+            self._windows.popitem(last=False)
+        return window
+
+    def _load_window(self, avatar_id: str, peer: str) -> _ConversationWindow:
+        # 被淘汰的窗口可能还有未提交的消息，先落盘再读取
+        if self._pending_messages:
+            self.flush()
+        row = self._conn.execute(
+            "SELECT last_seq FROM conversations WHERE avatar_id = ? AND peer = ?",
+            (avatar_id, peer)).fetchone()
+        window = _ConversationWindow(self.token_budget, row[0] + 1 if row else 0)
+        if row is None:
+            return window
+
+        cursor = self._conn.execute(
+            "SELECT seq, role, content, tokens FROM messages "
+            "WHERE avatar_id = ? AND peer = ? ORDER BY seq DESC",
+            (avatar_id, peer))
+        for seq, role, content, tokens in cursor:
+            if not window.prepend(StoredMessage(seq, role, content, tokens)):
+                break
+        cursor.close()
+        return window
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(max(self.flush_interval, 0.1))
+            self._maybe_flush()
+
+    def _maybe_flush(self) -> None:
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+
+class AvatarMemory:
+    """绑定到单个Avatar的会话记忆视图，会话以对端公钥区分"""
+
+    def __init__(self, store: ConversationStore, avatar_id: str):
+        self.store = store
+        self.avatar_id = avatar_id
+
+    def append(self, peer: str, role: str, content: str) -> int:
+        return self.store.append(self.avatar_id, peer, role, content)
+
+    def context(self, peer: str) -> List[Dict[str, str]]:
+        return self.store.context(self.avatar_id, peer)
+
+    def history(self, peer: str, limit: int = 50,
+                before_seq: Optional[int] = None) -> List[StoredMessage]:
+        return self.store.history(self.avatar_id, peer, limit, before_seq)
@@ -0,0 +1,271 @@
+import json
+import os
+from typing import List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from avatarai.logger import init_logger
+
+logger = init_logger("avatarai.memory.vector")
+
+# 暴力检索时每次参与矩阵乘法的向量行数，限制临时内存
+_SEARCH_CHUNK = 65536
+
+
+class VectorHit(NamedTuple):
+    id: int
+    score: float
+    payload: str
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """每行取分数最高的k个下标，按分数降序"""
+    k = min(k, scores.shape[1])
+    index = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, index, axis=1), axis=1)
+    return np.take_along_axis(index, order, axis=1)
+
+
+class VectorStore:
+    """
+    单个Avatar的长期记忆向量库，只依赖 NumPy，在CPU上运行
+
+    向量归一化后以 float32 追加写入内存映射文件，按余弦相似度检索。
+    未建索引时分块做矩阵乘法暴力检索；记忆增多后可调用 build_index
+    训练 IVF 索引（k-means 聚类中心 + 倒排列表），检索只扫描最近的
+    nprobe 个簇。建索引后的新向量直接分配到最近的簇，无需重建。
+
+    目录结构：
+        meta.json       维度、数量、容量
+        vectors.f32     向量矩阵（容量 x 维度）
+        payloads.jsonl  每个向量对应的文本
+        centroids.npy   IVF 聚类中心（可选）
+        assign.i32      每个向量所属的簇（可选）
+    """
+
+    def __init__(self, path: str, nprobe: int = 8):
+        """
+        Args:
+            path: 向量库目录
+            nprobe: IVF 检索时扫描的簇数量
+        """
+        self.path = path
+        self.nprobe = nprobe
+        os.makedirs(path, exist_ok=True)
+        self.dim: Optional[int] = None
+        self.count = 0
+        self.capacity = 0
+        self._vectors: Optional[np.memmap] = None
+        self._payloads: List[str] = []
+        self._centroids: Optional[np.ndarray] = None
+        self._assign: Optional[np.memmap] = None
+        self._lists: List[np.ndarray] = []
+        self._load()
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def indexed(self) -> bool:
+        return self._centroids is not None
+
+    def add(self, vectors: np.ndarray, payloads: Sequence[str]) -> List[int]:
+        """
+        追加一批向量，返回它们的ID
+
+        Args:
+            vectors: 形状为 (n, dim) 的向量
+            payloads: 每个向量对应的文本
+        """
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if len(vectors) != len(payloads):
+            raise ValueError("向量与文本数量不一致")
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(
+                f"向量维度不匹配: 期望 {self.dim}，实际 {vectors.shape[1]}")
+
+        start = self.count
+        self._ensure_capacity(start + len(vectors))
+        self._vectors[start:start + len(vectors)] = _normalize(vectors)
+        self._vectors.flush()
+        with open(self._file("payloads.jsonl"), "a", encoding="utf-8") as f:
+            for payload in payloads:
+                f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        self._payloads.extend(payloads)
+        self.count += len(vectors)
+
+        if self.indexed:
+            self._assign_clusters(start, self.count)
+        self._save_meta()
+        return list(range(start, self.count))
+
+    def search(self, queries: np.ndarray, k: int = 5) -> List[List[VectorHit]]:
+        """
+        批量检索最相似的k个向量
+
+        Args:
+            queries: 形状为 (q, dim) 的查询向量
+            k: 每个查询返回的数量
+        """
+        queries = _normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        if self.count == 0:
+            return [[] for _ in range(len(queries))]
+        if self.indexed:
+            return [self._search_ivf(query, k) for query in queries]
+        return self._search_flat(queries, k)
+
+    def build_index(self, nlist: Optional[int] = None, iterations: int = 10,
+                    sample_size: int = 65536) -> None:
+        """
+        训练 IVF 索引
+
+        Args:
+            nlist: 簇数量，默认约为 sqrt(向量数)
+            iterations: k-means 迭代次数
+            sample_size: 训练使用的采样向量数
+        """
+        if self.count == 0:
+            return
+        nlist = min(nlist or max(1, int(np.sqrt(self.count))), self.count)
+        rng = np.random.default_rng(0)
+        vectors = self._vectors[:self.count]
+        sample = vectors[np.sort(rng.choice(self.count, min(sample_size, self.count),
+                                            replace=False))]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for cluster in range(nlist):
+                members = sample[labels == cluster]
+                if len(members):
+                    centroids[cluster] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+
+        self._centroids = centroids.astype(np.float32)
+        np.save(self._file("centroids.npy"), self._centroids)
+        self._assign = self._open_memmap("assign.i32", np.int32, (self.capacity,))
+        self._lists = [np.empty(0, dtype=np.int64) for _ in range(nlist)]
+        self._assign_clusters(0, self.count)
+        logger.info(f"向量库 {self.path} 已建立 IVF 索引: {nlist} 个簇, "
+                    f"{self.count} 个向量")
+
+    def close(self) -> None:
+        for array in (self._vectors, self._assign):
+            if array is not None:
+                array.flush()
+        self._vectors = None
+        self._assign = None
+
+    def _search_flat(self, queries: np.ndarray, k: int) -> List[List[VectorHit]]:
+        best_ids = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, self.count, _SEARCH_CHUNK):
+            chunk = self._vectors[start:min(start + _SEARCH_CHUNK, self.count)]
+            scores = np.hstack([best_scores, queries @ chunk.T])
+            ids = np.hstack([best_ids, np.broadcast_to(
+                np.arange(start, start + len(chunk)), (len(queries), len(chunk)))])
+            top = _top_k(scores, k)
+            best_scores = np.take_along_axis(scores, top, axis=1)
+            best_ids = np.take_along_axis(ids, top, axis=1)
+        return [
+            [VectorHit(int(i), float(s), self._payloads[i])
+             for i, s in zip(row_ids, row_scores)]
+            for row_ids, row_scores in zip(best_ids, best_scores)
+        ]
+
+    def _search_ivf(self, query: np.ndarray, k: int) -> List[VectorHit]:
+        nprobe = min(self.nprobe, len(self._centroids))
+        clusters = _top_k((self._centroids @ query)[np.newaxis, :], nprobe)[0]
+        candidates = np.sort(np.concatenate([self._lists[c] for c in clusters]))
+        if len(candidates) == 0:
+            return []
+        # 按ID顺序读取，内存映射上的访问尽量连续
+        scores = self._vectors[candidates] @ query
+        top = _top_k(scores[np.newaxis, :], k)[0]
+        return [VectorHit(int(candidates[i]), float(scores[i]),
+                          self._payloads[candidates[i]])
+                for i in top]
+
+    def _assign_clusters(self, start: int, end: int) -> None:
+        labels = np.argmax(self._vectors[start:end] @ self._centroids.T, axis=1)
+        self._assign[start:end] = labels
+        self._assign.flush()
+        self._extend_lists(labels, start)
+
+    def _extend_lists(self, labels: np.ndarray, start: int) -> None:
+        order = np.argsort(labels, kind="stable")
+        boundaries = np.searchsorted(labels[order], np.arange(len(self._centroids) + 1))
+        for cluster in range(len(self._centroids)):
+            members = order[boundaries[cluster]:boundaries[cluster + 1]] + start
+            if len(members):
+                self._lists[cluster] = np.concatenate([self._lists[cluster], members])
+
+    def _ensure_capacity(self, size: int) -> None:
+        if self._vectors is not None and size <= self.capacity:
+            return
+        # 容量按倍数增长，减少重新映射文件的次数
+        capacity = max(size, self.capacity * 2, 1024)
+        if self._vectors is not None:
+            self._vectors.flush()
+        self._vectors = self._open_memmap("vectors.f32", np.float32,
+                                          (capacity, self.dim))
+        if self.indexed:
+            if self._assign is not None:
+                self._assign.flush()
+            self._assign = self._open_memmap("assign.i32", np.int32, (capacity,))
+        self.capacity = capacity
+        self._save_meta()
+
+    def _open_memmap(self, name: str, dtype, shape: tuple) -> np.memmap:
+        path = self._file(name)
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        with open(path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+    def _load(self) -> None:
+        meta_path = self._file("meta.json")
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        self.dim = meta["dim"]
+        self.count = meta["count"]
+        self.capacity = meta["capacity"]
+        if self.dim is None:
+            return
+        self._vectors = self._open_memmap("vectors.f32", np.float32,
+                                          (self.capacity, self.dim))
+        with open(self._file("payloads.jsonl"), encoding="utf-8") as f:
+            self._payloads = [json.loads(line) for line in f]
+        if len(self._payloads) > self.count:
+            # 上次写入中断，丢弃未计入 meta 的文本，保持与向量对齐
+            self._payloads = self._payloads[:self.count]
+            with open(self._file("payloads.jsonl"), "w", encoding="utf-8") as f:
+                for payload in self._payloads:
+                    f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+
+        if os.path.exists(self._file("centroids.npy")):
+            self._centroids = np.load(self._file("centroids.npy"))
+            self._assign = self._open_memmap("assign.i32", np.int32, (self.capacity,))
+            self._lists = [np.empty(0, dtype=np.int64)
+                           for _ in range(len(self._centroids))]
+            self._extend_lists(np.asarray(self._assign[:self.count]), 0)
+
+    def _save_meta(self) -> None:
+        meta = {"dim": self.dim, "count": self.count, "capacity": self.capacity}
+        tmp_path = self._file("meta.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._file("meta.json"))
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
@@ -0,0 +1,252 @@
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import (
+    TYPE_CHECKING,
+    AsyncGenerator,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+from avatarai.logger import init_logger
+from avatarai.models.llm import Messages
+from avatarai.utils.metrics import MetricSet
+
+if TYPE_CHECKING:
+    # NumPy 只在语义缓存（配置了 embedding 模型）时才加载
+    import numpy as np
+
+logger = init_logger("avatarai.models.cache")
+
+EmbedFunc = Callable[[str], Awaitable[List[float]]]
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s.!?。！？~～…]+$")
+
+
+def normalize_prompt(text: str) -> str:
+    """归一化提示词：忽略大小写、多余空白和结尾标点"""
+    text = _WHITESPACE.sub(" ", text.strip().lower())
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+
+def _normalize_messages(messages: Messages) -> List[Tuple[str, str]]:
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    return [(m.get("role", ""), normalize_prompt(m.get("content", "")))
+            for m in messages]
+
+
+def _digest(*parts) -> str:
+    data = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+@dataclass
+class _CacheEntry:
+    chunks: List[str]
+    expires_at: float
+    scope: str
+    vector: Optional["np.ndarray"] = None
+
+
+@dataclass
+class _SemanticScope:
+    """同一 scope 下的 embedding 矩阵，行与 keys 一一对应"""
+    keys: List[str] = field(default_factory=list)
+    vectors: Optional["np.ndarray"] = None
+
+    def add(self, key: str, vector: "np.ndarray") -> None:
+        import numpy as np
+
+        self.keys.append(key)
+        row = vector[np.newaxis, :]
+        self.vectors = row if self.vectors is None else np.vstack([self.vectors, row])
+
+    def remove(self, key: str) -> None:
+        import numpy as np
+
+        index = self.keys.index(key)
+        self.keys.pop(index)
+        self.vectors = np.delete(self.vectors, index, axis=0) if self.keys else None
+
+    def nearest(self, vector: "np.ndarray") -> Tuple[Optional[str], float]:
+        import numpy as np
+
+        if self.vectors is None:
+            return None, 0.0
+        scores = self.vectors @ vector
+        index = int(np.argmax(scores))
+        return self.keys[index], float(scores[index])
+
+
+class ResponseCache:
+    """
+    LLM 响应缓存
+
+    精确匹配层按 模型 + Avatar人设 + 归一化后的消息 + 调用参数 命中；
+    可选的语义层在精确匹配未命中时，对最后一条消息做 embedding，
+    与同一上下文（模型、人设、之前的消息、参数相同）下已缓存的问题比较余弦相似度。
+    缓存以流式分片保存，命中时按原分片回放。
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl: float = 3600.0,
+                 similarity_threshold: float = 0.95):
+        """
+        Args:
+            max_entries: 最多缓存的响应数量，超出后按LRU淘汰
+            ttl: 响应的有效期（秒）
+            similarity_threshold: 语义层命中所需的最小余弦相似度
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self._entries: OrderedDict[str, _CacheEntry] = OrderedDict()
+        self._scopes: Dict[str, _SemanticScope] = {}
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def stream(self, model: str, messages: Messages, persona: str,
+                     producer: Callable[[], AsyncIterator[str]],
+                     embed: Optional[EmbedFunc] = None,
+                     **params) -> AsyncGenerator[str, None]:
+        """
+        命中时回放缓存的响应，否则调用 producer 并在完整输出后写入缓存
+
+        Args:
+            model: 模型名称
+            messages: 消息
+            persona: Avatar人设（AvatarConfig.description）
+            producer: 未命中时产生流式响应的函数
+            embed: 可选的 embedding 函数，提供时启用语义层
+            params: 调用参数，参与缓存键计算
+        """
+        normalized = _normalize_messages(messages)
+        scope = _digest(model, persona, normalized[:-1], params)
+        key = _digest(scope, normalized[-1:])
+
+        chunks = self._get(key)
+        vector = None
+        if chunks is not None:
+            self.exact_hits += 1
+        elif embed is not None and normalized:
+            vector = await self._embed(embed, normalized[-1][1])
+            chunks = self._get_similar(scope, vector) if vector is not None else None
+            if chunks is not None:
+                self.semantic_hits += 1
+
+        if chunks is not None:
+            for chunk in chunks:
+                yield chunk
+            return
+
+        self.misses += 1
+        produced = []
+        async for chunk in producer():
+            produced.append(chunk)
+            yield chunk
+        # 只缓存完整的响应，调用方提前结束或出错时不写入
+        self._put(key, scope, produced, vector)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._scopes.clear()
+
+    def stats(self) -> dict:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": ((self.exact_hits + self.semantic_hits) / lookups
+                         if lookups else 0.0),
+        }
+
+    def collect_metrics(self, metrics: MetricSet) -> None:
+        metrics.counter("response_cache_hits", "LLM响应缓存命中数", self.exact_hits,
+                        tier="exact")
+        metrics.counter("response_cache_hits", "LLM响应缓存命中数", self.semantic_hits,
+                        tier="semantic")
+        metrics.counter("response_cache_misses", "LLM响应缓存未命中数", self.misses)
+        metrics.counter("response_cache_evictions", "LLM响应缓存淘汰数", self.evictions)
+        metrics.gauge("response_cache_size", "LLM响应缓存条目数", len(self._entries))
+
+    def _get(self, key: str) -> Optional[List[str]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry.chunks
+
+    def _get_similar(self, scope: str, vector: "np.ndarray") -> Optional[List[str]]:
+        semantic_scope = self._scopes.get(scope)
+        if semantic_scope is None:
+            return None
+        key, score = semantic_scope.nearest(vector)
+        if key is None or score < self.similarity_threshold:
+            return None
+        return self._get(key)
+
+    def _put(self, key: str, scope: str, chunks: List[str],
+             vector: Optional["np.ndarray"]) -> None:
+        if not chunks:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = _CacheEntry(chunks, time.monotonic() + self.ttl, scope,
+                                         vector)
+        if vector is not None:
+            self._scopes.setdefault(scope, _SemanticScope()).add(key, vector)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        if entry.vector is None:
+            return
+        semantic_scope = self._scopes.get(entry.scope)
+        if semantic_scope is not None:
+            semantic_scope.remove(key)
+            if not semantic_scope.keys:
+                del self._scopes[entry.scope]
+
+    @staticmethod
+    async def _embed(embed: EmbedFunc, text: str) -> Optional["np.ndarray"]:
+        import numpy as np
+
+        try:
+            vector = np.asarray(await embed(text), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"获取 embedding 失败，跳过语义缓存: {str(e)}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    """获取进程级共享的LLM响应缓存"""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
@@ -0,0 +1,333 @@
+import asyncio
+import hashlib
+import json
+from collections import OrderedDict, deque
+from typing import AsyncGenerator, Deque, Dict, List, Optional, Tuple
+
+from avatarai.config import LLMConfig
+from avatarai.logger import init_logger
+from avatarai.models.llm import LLM, LLMCallStats, Messages
+from avatarai.utils.metrics import MetricSet
+from avatarai.utils.tasks import get_task_supervisor
+
+logger = init_logger("avatarai.models.gateway")
+
+
+class _FairScheduler:
+    """
+    单个 provider 的并发控制
+
+    并发数达到上限后，等待者按Avatar分队列，按轮询顺序放行，
+    单个Avatar的突发请求不会阻塞其他Avatar。
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.active = 0
+        self._waiters: OrderedDict[str, Deque[asyncio.Future]] = OrderedDict()
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._waiters.values())
+
+    async def acquire(self, avatar_id: str) -> None:
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(avatar_id, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已经分到名额但调用方被取消，把名额交给下一个等待者
+                self.release()
+            else:
+                queue = self._waiters.get(avatar_id)
+                if queue is not None and future in queue:
+                    queue.remove(future)
+                    if not queue:
+                        del self._waiters[avatar_id]
+            raise
+
+    def release(self) -> None:
+        self.active -= 1
+        while self._waiters and self.active < self.max_concurrency:
+            avatar_id, queue = next(iter(self._waiters.items()))
+            future = queue.popleft()
+            # 轮询：该Avatar还有等待者就排到队尾
+            del self._waiters[avatar_id]
+            if queue:
+                self._waiters[avatar_id] = queue
+            if future.done():
+                continue
+            self.active += 1
+            future.set_result(None)
+
+
+class _InflightCall:
+    """正在进行的LLM调用，相同请求的调用方共享它的输出"""
+
+    def __init__(self) -> None:
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Condition()
+
+    async def publish(self, chunk: str) -> None:
+        async with self._changed:
+            self.chunks.append(chunk)
+            self._changed.notify_all()
+
+    async def finish(self, error: Optional[BaseException] = None) -> None:
+        async with self._changed:
+            self.done = True
+            self.error = error
+            self._changed.notify_all()
+
+    async def replay(self) -> AsyncGenerator[str, None]:
+        """从头回放已产生的输出，并继续等待后续输出"""
+        index = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(
+                    lambda start=index: start < len(self.chunks) or self.done)
+                chunks = self.chunks[index:]
+                done, error = self.done, self.error
+            for chunk in chunks:
+                yield chunk
+            index += len(chunks)
+            if done and index >= len(self.chunks):
+                if error is not None:
+                    raise error
+                return
+
+
+class _EmbeddingBatcher:
+    """
+    把一个时间窗口内的 embedding 请求合并成一次批量调用
+
+    批量调用与对话调用共用 provider 的并发额度，批次可能混合多个Avatar的请求，
+    在公平队列中作为同一个调用方排队。
+    """
+
+    # 批量 embedding 在公平队列中使用的调用方名
+    QUEUE_NAME = "embedding"
+
+    def __init__(self, llm: LLM, scheduler: _FairScheduler, window: float,
+                 max_batch_size: int):
+        self.llm = llm
+        self.scheduler = scheduler
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    async def embed(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            get_task_supervisor().spawn(self._run(batch), "gateway-embed-batch")
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        try:
+            await self.scheduler.acquire(self.QUEUE_NAME)
+            try:
+                vectors = await self.llm.embed([text for text, _ in batch])
+            finally:
+                self.scheduler.release()
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+
+class LLMGateway:
+    """
+    引擎内所有Avatar共享的LLM调用网关
+
+    - 相同模型和凭证的Avatar复用同一个 LLM 客户端
+    - 完全相同的并发请求只向上游发起一次，输出以流的形式分发给所有调用方
+    - 每个 provider（api_url）限制并发数，超出部分按Avatar公平排队
+    - embedding 请求在短时间窗口内合并为一次批量调用
+    """
+
+    def __init__(self, max_concurrency_per_provider: int = 16,
+                 batch_window: float = 0.005, max_batch_size: int = 64):
+        """
+        Args:
+            max_concurrency_per_provider: 每个 provider 同时进行的上游调用数上限
+            batch_window: embedding 请求的合并窗口（秒）
+            max_batch_size: 单次批量 embedding 的最大条数
+        """
+        self.max_concurrency_per_provider = max_concurrency_per_provider
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self._llms: Dict[Tuple[str, str, str, str], LLM] = {}
+        self._schedulers: Dict[Tuple[str, str], _FairScheduler] = {}
+        self._inflight: Dict[str, _InflightCall] = {}
+        self._batchers: Dict[int, _EmbeddingBatcher] = {}
+
+        self.requests = 0
+        self.coalesced = 0
+
+    def get_llm(self, llm_config: LLMConfig) -> LLM:
+        """按配置获取共享的 LLM 客户端"""
+        key = (llm_config.provider, llm_config.model, llm_config.api_url,
+               llm_config.api_key)
+        llm_model = self._llms.get(key)
+        if llm_model is None:
+            llm_model = LLM(
+                model=llm_config.model,
+                credentials={
+                    "api_key": llm_config.api_key,
+                    "api_url": llm_config.api_url,
+                },
+                provider=llm_config.provider,
+                embedding_model=llm_config.embedding_model
+            )
+            self._llms[key] = llm_model
+        return llm_model
+
+    async def invoke(self, avatar_id: str, llm: LLM, messages: Messages,
+                     stats: Optional[LLMCallStats] = None, **params) -> str:
+        chunks = []
+        async for chunk in self.stream(avatar_id, llm, messages, stats=stats, **params):
+            chunks.append(chunk)
+        return "".join(chunks)
+
+    async def stream(self, avatar_id: str, llm: LLM, messages: Messages,
+                     stats: Optional[LLMCallStats] = None,
+                     **params) -> AsyncGenerator[str, None]:
+        """
+        通过网关流式调用LLM
+
+        Args:
+            avatar_id: 发起调用的Avatar，用于公平调度
+            llm: 目标 LLM 客户端
+            messages: 消息
+            stats: 可选，接收本次调用的耗时统计（合并的调用共享上游的统计）
+        """
+        self.requests += 1
+        key = self._request_key(llm, messages, params)
+        call = self._inflight.get(key)
+        if call is not None:
+            self.coalesced += 1
+        else:
+            call = _InflightCall()
+            self._inflight[key] = call
+            get_task_supervisor().spawn(
+                self._run(key, call, avatar_id, llm, messages, stats, params),
+                f"gateway-call-{avatar_id}", group="gateway-call")
+
+        call.subscribers += 1
+        try:
+            async for chunk in call.replay():
+                yield chunk
+        finally:
+            call.subscribers -= 1
+
+    async def embed(self, llm: LLM, text: str) -> List[float]:
+        """获取文本的 embedding，同一 LLM 客户端的请求会被合并成批"""
+        batcher = self._batchers.get(id(llm))
+        if batcher is None:
+            batcher = _EmbeddingBatcher(llm, self._scheduler(llm), self.batch_window,
+                                        self.max_batch_size)
+            self._batchers[id(llm)] = batcher
+        return await batcher.embed(text)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+            "providers": {
+                f"{provider}:{api_url}": {
+                    "active": scheduler.active,
+                    "waiting": scheduler.waiting,
+                }
+                for (provider, api_url), scheduler in self._schedulers.items()
+            },
+        }
+
+    def collect_metrics(self, metrics: MetricSet) -> None:
+        metrics.counter("llm_requests", "经由网关的LLM请求数", self.requests)
+        metrics.counter("llm_coalesced", "与进行中的相同请求合并的LLM请求数",
+                        self.coalesced)
+        for (provider, api_url), scheduler in self._schedulers.items():
+            metrics.gauge("llm_active_calls", "正在进行的上游LLM调用数",
+                          scheduler.active, provider=provider, api_url=api_url)
+            metrics.gauge("llm_waiting_calls", "等待并发额度的LLM调用数",
+                          scheduler.waiting, provider=provider, api_url=api_url)
+        for llm_model in self._llms.values():
+            llm_model.collect_metrics(metrics)
+
+    def _scheduler(self, llm: LLM) -> _FairScheduler:
+        key = (llm.provider, llm.credentials.get("api_url", ""))
+        scheduler = self._schedulers.get(key)
+        if scheduler is None:
+            scheduler = _FairScheduler(self.max_concurrency_per_provider)
+            self._schedulers[key] = scheduler
+        return scheduler
+
+    @staticmethod
+    def _request_key(llm: LLM, messages: Messages, params: dict) -> str:
+        # 凭证不同的请求不能合并，否则会用先到者的 key 计费，错误也会传给其他调用方
+        api_key = llm.credentials.get("api_key", "")
+        credential = hashlib.sha256(api_key.encode()).hexdigest()
+        return json.dumps(
+            [llm.provider, llm.credentials.get("api_url", ""), credential, llm.model,
+             messages, params],
+            sort_keys=True, ensure_ascii=False)
+
+    async def _run(self, key: str, call: _InflightCall, avatar_id: str, llm: LLM,
+                   messages: Messages, stats: Optional[LLMCallStats],
+                   params: dict) -> None:
+        scheduler = self._scheduler(llm)
+        error = None
+        try:
+            await scheduler.acquire(avatar_id)
+            try:
+                async for chunk in llm.stream(messages, stats=stats, **params):
+                    await call.publish(chunk)
+                    if call.subscribers == 0:
+                        # 所有调用方都已离开，提前结束上游调用
+                        break
+            finally:
+                scheduler.release()
+        except Exception as e:
+            error = e
+            logger.error(f"LLM调用失败 ({llm.model}): {str(e)}")
+        finally:
+            # 先移出，之后到达的相同请求会重新发起调用
+            self._inflight.pop(key, None)
+            await call.finish(error)
+
+
+_llm_gateway: Optional[LLMGateway] = None
+
+
+def get_llm_gateway() -> LLMGateway:
+    """获取进程级共享的LLM网关"""
+    global _llm_gateway
+    if _llm_gateway is None:
+        _llm_gateway = LLMGateway()
+    return _llm_gateway
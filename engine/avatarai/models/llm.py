@@ -1,15 +1,179 @@
+import json
+import time
+from dataclasses import dataclass
+from typing import AsyncGenerator, Dict, List, Optional, Union
 
-from typing import Generator
+import httpx
+
+from avatarai.config import OPENAI_COMPATIBLE_PROVIDERS
+from avatarai.logger import init_logger
+from avatarai.utils.metrics import MetricSet
+from avatarai.utils.stats import Histogram
+
+logger = init_logger("avatarai.models.llm")
+
+Messages = Union[str, List[Dict[str, str]]]
+
+TOKENS_PER_SECOND_BUCKETS = (1, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """进程级共享的HTTP连接池，所有LLM客户端复用"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(60.0, connect=10.0),
+            limits=httpx.Limits(max_connections=256, max_keepalive_connections=64),
+        )
+    return _http_client
+
+
+@dataclass
+class LLMCallStats:
+    """单次LLM调用的耗时统计"""
+    started_at: float = 0.0
+    first_token_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    completion_tokens: int = 0
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        if self.first_token_at is None or self.finished_at is None:
+            return None
+        duration = self.finished_at - self.first_token_at
+        return self.completion_tokens / duration if duration > 0 else None
 
 
 class LLM:
 
-    def __init__(self, model: str, credentials: dict):
+    def __init__(self, model: str, credentials: dict, provider: str = "openai",
+                 client: Optional[httpx.AsyncClient] = None,
+                 embedding_model: Optional[str] = None):
+        """
+        Args:
+            model: 模型名称
+            credentials: 凭证，包含 api_key 和 api_url
+            provider: 模型提供方，目前支持兼容 OpenAI 接口的提供方
+            client: 自定义HTTP客户端，为None时使用进程级共享连接池
+            embedding_model: embedding 模型名称，为None时使用 model
+        """
         self.model = model
+        self.embedding_model = embedding_model or model
         self.credentials = credentials
+        self.provider = provider
+        self._client = client
+        self.time_to_first_token = Histogram()
+        self.tokens_per_second = Histogram(TOKENS_PER_SECOND_BUCKETS)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client or get_http_client()
+
+    async def invoke(self, messages: Messages, stats: Optional[LLMCallStats] = None,
+                     **params) -> str:
+        """非流式调用，内部复用流式接口以便统计首token延迟"""
+        chunks = []
+        async for chunk in self.stream(messages, stats=stats, **params):
+            chunks.append(chunk)
+        return "".join(chunks)
+
+    async def stream(self, messages: Messages, stats: Optional[LLMCallStats] = None,
+                     **params) -> AsyncGenerator[str, None]:
+        """
+        流式调用，逐段产出模型输出
+
+        调用方停止迭代或任务被取消时，底层HTTP响应随之关闭。
+
+        Args:
+            messages: 用户输入，或 OpenAI 格式的消息列表
+            stats: 可选，用于接收本次调用的耗时统计
+            params: 透传给接口的其他参数（temperature 等）
+        """
+        if self.provider not in OPENAI_COMPATIBLE_PROVIDERS:
+            raise NotImplementedError(f"不支持的LLM provider: {self.provider}")
+
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        stats = stats or LLMCallStats()
+        stats.started_at = time.monotonic()
+
+        url = self.credentials.get("api_url", "").rstrip("/") + "/chat/completions"
+        headers = {"Authorization": f"Bearer {self.credentials.get('api_key', '')}"}
+        payload = {"model": self.model, "messages": messages, "stream": True, **params}
+
+        usage_tokens = None
+        async with self.client.stream("POST", url, json=payload,
+                                      headers=headers) as response:
+            if response.status_code >= 400:
+                body = await response.aread()
+                detail = body.decode("utf-8", "replace")
+                raise RuntimeError(f"LLM请求失败 {response.status_code}: {detail}")
+
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                except json.JSONDecodeError:
+                    logger.warning(f"无法解析LLM流式响应: {data}")
+                    continue
+
+                usage = chunk.get("usage")
+                if usage and usage.get("completion_tokens"):
+                    usage_tokens = usage["completion_tokens"]
+                for choice in chunk.get("choices") or []:
+                    content = (choice.get("delta") or {}).get("content")
+                    if not content:
+                        continue
+                    if stats.first_token_at is None:
+                        stats.first_token_at = time.monotonic()
+                        self.time_to_first_token.observe(stats.time_to_first_token)
+                    # 没有 usage 时按流式分片数近似 token 数
+                    stats.completion_tokens += 1
+                    yield content
+
+        stats.finished_at = time.monotonic()
+        if usage_tokens is not None:
+            stats.completion_tokens = usage_tokens
+        if stats.tokens_per_second is not None:
+            self.tokens_per_second.observe(stats.tokens_per_second)
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """批量获取文本的 embedding，返回顺序与输入一致"""
+        if self.provider not in OPENAI_COMPATIBLE_PROVIDERS:
+            raise NotImplementedError(f"不支持的LLM provider: {self.provider}")
+
+        url = self.credentials.get("api_url", "").rstrip("/") + "/embeddings"
+        headers = {"Authorization": f"Bearer {self.credentials.get('api_key', '')}"}
+        payload = {"model": self.embedding_model, "input": texts}
+        response = await self.client.post(url, json=payload, headers=headers)
+        if response.status_code >= 400:
+            raise RuntimeError(
+                f"Embedding请求失败 {response.status_code}: {response.text}")
+        data = sorted(response.json().get("data", []),
+                      key=lambda item: item.get("index", 0))
+        return [item["embedding"] for item in data]
 
-    def invoke(self, messages: str) -> str:
-        pass
+    def stats(self) -> dict:
+        return {
+            "time_to_first_token": self.time_to_first_token.snapshot(),
+            "tokens_per_second": self.tokens_per_second.snapshot(),
+        }
 
-    def stream(self, prompt: str) -> Generator[str, None, None]:
-        pass
+    def collect_metrics(self, metrics: MetricSet, **labels) -> None:
+        labels = {"provider": self.provider, "model": self.model, **labels}
+        metrics.histogram("llm_time_to_first_token_seconds", "LLM首token延迟",
+                          self.time_to_first_token, **labels)
+        metrics.histogram("llm_tokens_per_second", "LLM输出速度（tokens/s）",
+                          self.tokens_per_second, **labels)
@@ -0,0 +1,285 @@
+import asyncio
+import heapq
+import os
+import sqlite3
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from avatarai.logger import init_logger
+from avatarai.utils.tasks import get_task_supervisor
+
+logger = init_logger("avatarai.nostr.checkpoint")
+
+# 每个中继、每个订阅最多挂起的未处理事件数，超出时放弃最早的一个
+MAX_HELD_EVENTS = 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    avatar_id TEXT NOT NULL,
+    relay_url TEXT NOT NULL,
+    subscription TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    PRIMARY KEY (avatar_id, relay_url, subscription)
+);
+CREATE TABLE IF NOT EXISTS processed_events (
+    avatar_id TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    processed_at INTEGER NOT NULL,
+    PRIMARY KEY (avatar_id, event_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_processed_events_processed_at
+    ON processed_events (processed_at);
+"""
+
+
+class CheckpointStore:
+    """
+    事件处理检查点的本地持久化存储（SQLite）
+
+    记录每个Avatar在每个中继、每个订阅上已处理到的 created_at，以及最近处理过的事件ID。
+    写入先缓存在内存中，按时间间隔批量提交，避免每个事件一次磁盘同步。
+    调用 start 后还会定时提交，中继没有新事件时最后一批写入也不会一直留在内存中。
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0,
+                 retention: int = 3 * 24 * 60 * 60) -> None:
+        """
+        Args:
+            path: SQLite 数据库文件路径
+            flush_interval: 两次批量提交的最小间隔（秒）
+            retention: 已处理事件ID的保留时长（秒），需覆盖 GiftWrap 的时间戳回拨
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.retention = retention
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+        self._pending_checkpoints: Dict[Tuple[str, str, str], int] = {}
+        self._pending_events: Dict[Tuple[str, str], int] = {}
+        self._last_flush = time.monotonic()
+        self._last_prune = 0.0
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """启动定时提交任务，在事件循环中调用"""
+        if self._flush_task is None:
+            self._flush_task = get_task_supervisor().spawn(
+                self._flush_periodically(), "checkpoint-flush")
+
+    def for_avatar(self, avatar_id: str) -> "AvatarCheckpoint":
+        return AvatarCheckpoint(self, avatar_id)
+
+    def get_since(self, avatar_id: str, subscription: str) -> Optional[int]:
+        """
+        订阅的恢复点：所有中继检查点中最小的一个，保证任何中继都不会出现缺口，
+        重叠部分由已处理事件ID过滤
+        """
+        rows = self._conn.execute(
+            "SELECT relay_url, created_at FROM checkpoints "
+            "WHERE avatar_id = ? AND subscription = ?",
+            (avatar_id, subscription)).fetchall()
+        by_relay = dict(rows)
+        for (aid, relay_url, sub), created_at in self._pending_checkpoints.items():
+            if aid == avatar_id and sub == subscription:
+                by_relay[relay_url] = max(created_at,
+                                          by_relay.get(relay_url, created_at))
+        positions = list(by_relay.values())
+        return min(positions) if positions else None
+
+    def advance(self, avatar_id: str, relay_url: str, subscription: str,
+                created_at: int) -> None:
+        """推进中继的检查点，只会向前移动"""
+        key = (avatar_id, relay_url, subscription)
+        if created_at > self._pending_checkpoints.get(key, -1):
+            self._pending_checkpoints[key] = created_at
+        self._maybe_flush()
+
+    def mark_processed(self, avatar_id: str, event_id: str) -> None:
+        self._pending_events[(avatar_id, event_id)] = int(time.time())
+        self._maybe_flush()
+
+    def is_processed(self, avatar_id: str, event_id: str) -> bool:
+        if (avatar_id, event_id) in self._pending_events:
+            return True
+        row = self._conn.execute(
+            "SELECT 1 FROM processed_events WHERE avatar_id = ? AND event_id = ?",
+            (avatar_id, event_id)).fetchone()
+        return row is not None
+
+    def flush(self) -> None:
+        """提交缓存的检查点和事件ID"""
+        checkpoints, self._pending_checkpoints = self._pending_checkpoints, {}
+        events, self._pending_events = self._pending_events, {}
+        self._last_flush = time.monotonic()
+        if not checkpoints and not events:
+            return
+        try:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO checkpoints "
+                    "(avatar_id, relay_url, subscription, created_at) "
+                    "VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (avatar_id, relay_url, subscription) "
+                    "DO UPDATE SET created_at = MAX(created_at, excluded.created_at)",
+                    [key + (created_at,) for key, created_at in checkpoints.items()])
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO processed_events "
+                    "(avatar_id, event_id, processed_at) VALUES (?, ?, ?)",
+                    [key + (processed_at,) for key, processed_at in events.items()])
+        except sqlite3.Error as e:
+            logger.error(f"写入检查点失败: {str(e)}")
+        self._maybe_prune()
+
+    def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self.flush()
+        self._conn.close()
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(max(self.flush_interval, 0.1))
+            self._maybe_flush()
+
+    def _maybe_flush(self) -> None:
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def _maybe_prune(self) -> None:
+        # 每小时清理一次过期的事件ID
+        now = time.monotonic()
+        if now - self._last_prune < 3600:
+            return
+        self._last_prune = now
+        try:
+            with self._conn:
+                self._conn.execute(
+                    "DELETE FROM processed_events WHERE processed_at < ?",
+                    (int(time.time()) - self.retention,))
+        except sqlite3.Error as e:
+            logger.error(f"清理已处理事件失败: {str(e)}")
+
+
+class _RelayProgress:
+    """
+    单个中继上单个订阅的处理进度，跟踪尚未处理完的事件
+
+    被丢弃或拒绝的事件挂起在 _held 中，位置停在最早的挂起事件之前，
+    直到该事件的某个副本处理完成；重新订阅时按这个位置恢复，会再次收到它。
+    """
+
+    def __init__(self, max_held: int = MAX_HELD_EVENTS) -> None:
+        self.high = -1
+        self.max_held = max_held
+        self._inflight: List[int] = []
+        self._counts: Dict[int, int] = defaultdict(int)
+        # 事件ID -> created_at
+        self._held: Dict[str, int] = {}
+
+    def begin(self, created_at: int) -> None:
+        heapq.heappush(self._inflight, created_at)
+        self._counts[created_at] += 1
+
+    def end(self, created_at: int) -> None:
+        self._counts[created_at] -= 1
+        self.seen(created_at)
+
+    def seen(self, created_at: int) -> None:
+        self.high = max(self.high, created_at)
+
+    def hold(self, event_id: str, created_at: int) -> None:
+        self._held[event_id] = created_at
+        if len(self._held) > self.max_held:
+            oldest = min(self._held, key=self._held.__getitem__)
+            logger.warning(f"挂起的未处理事件过多，放弃事件 {oldest} "
+                           f"(created_at={self._held.pop(oldest)})")
+
+    def release(self, event_id: str) -> bool:
+        return self._held.pop(event_id, None) is not None
+
+    def position(self) -> int:
+        """可以安全持久化的位置：不越过任何尚未处理完或挂起的事件"""
+        while self._inflight and self._counts[self._inflight[0]] <= 0:
+            del self._counts[heapq.heappop(self._inflight)]
+        position = self.high
+        if self._inflight:
+            position = min(position, self._inflight[0] - 1)
+        if self._held:
+            position = min(position, min(self._held.values()) - 1)
+        return position
+
+
+class AvatarCheckpoint:
+    """
+    绑定到单个Avatar的检查点视图
+
+    中继推送事件的顺序不固定，分发队列也会乱序完成，因此检查点只推进到
+    最早的未完成事件之前，崩溃重启后不会跳过仍在队列中的事件。
+    因反压被丢弃或拒绝的事件同样挡住检查点，直到任一中继推送的副本处理完成。
+    """
+
+    def __init__(self, store: CheckpointStore, avatar_id: str):
+        self.store = store
+        self.avatar_id = avatar_id
+        self._progress: Dict[Tuple[str, str], _RelayProgress] = defaultdict(
+            _RelayProgress)
+
+    def get_since(self, subscription: str) -> Optional[int]:
+        return self.store.get_since(self.avatar_id, subscription)
+
+    def is_processed(self, event_id: str) -> bool:
+        return self.store.is_processed(self.avatar_id, event_id)
+
+    def begin(self, relay_url: str, subscription: str, created_at: int) -> None:
+        """事件进入处理流程"""
+        self._progress[(relay_url, subscription)].begin(created_at)
+
+    def complete(self, relay_url: str, subscription: str, event_id: str,
+                 created_at: int) -> None:
+        """事件处理完成，记录事件ID并推进检查点"""
+        self.store.mark_processed(self.avatar_id, event_id)
+        progress = self._progress[(relay_url, subscription)]
+        progress.end(created_at)
+        progress.release(event_id)
+        self._advance(relay_url, subscription, progress)
+        # 同一事件在其他中继上被丢弃过的副本不必再重新获取
+        for (other_url, sub), other in list(self._progress.items()):
+            if sub == subscription and other.release(event_id):
+                self._advance(other_url, subscription, other)
+
+    def abandon(self, relay_url: str, subscription: str, event_id: str,
+                created_at: int) -> None:
+        """已开始处理的事件被丢弃：结束其未完成状态，不记录为已处理
+
+        检查点停在它之前，直到某个副本处理完成
+        """
+        progress = self._progress[(relay_url, subscription)]
+        progress.end(created_at)
+        progress.hold(event_id, created_at)
+        self._advance(relay_url, subscription, progress)
+
+    def reject(self, relay_url: str, subscription: str, event_id: str,
+               created_at: int) -> None:
+        """事件未进入处理流程就被拒绝，检查点停在它之前"""
+        progress = self._progress[(relay_url, subscription)]
+        progress.seen(created_at)
+        progress.hold(event_id, created_at)
+        self._advance(relay_url, subscription, progress)
+
+    def skip(self, relay_url: str, subscription: str, created_at: int) -> None:
+        """重复或已处理过的事件，只说明该中继已推送到这个位置"""
+        progress = self._progress[(relay_url, subscription)]
+        progress.seen(created_at)
+        self._advance(relay_url, subscription, progress)
+
+    def _advance(self, relay_url: str, subscription: str,
+                 progress: _RelayProgress) -> None:
+        position = progress.position()
+        if position >= 0:
+            self.store.advance(self.avatar_id, relay_url, subscription, position)
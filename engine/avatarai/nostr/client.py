@@ -1,110 +1,132 @@
 import asyncio
 import inspect
-from typing import List, Callable, Optional, Union, Any
+from collections import Counter
+from functools import partial
+from typing import Any, Callable, Iterable, List, Optional
+
 from nostr_sdk import (
-    Keys,
-    NostrSigner,
-    Client,
+    Event,
+    EventBuilder,
     Filter,
     HandleNotification,
-    RelayMessage,
-    Event,
+    Keys,
+    NostrSigner,
     PublicKey,
-    EventBuilder
+    RelayMessage,
+    UnwrappedGift,
+    gift_wrap,
 )
+
 from avatarai.logger import init_logger
+from avatarai.nostr.checkpoint import AvatarCheckpoint
+from avatarai.nostr.dedup import EventDeduplicator
+from avatarai.nostr.dispatch import BackpressurePolicy, EventDispatcher
+from avatarai.nostr.filters import with_since
+from avatarai.nostr.giftwrap import GiftWrapUnwrapper, get_crypto_workers
+from avatarai.nostr.outbox import AvatarOutboxStore, Outbox
+from avatarai.nostr.pool import RelayPool, get_relay_pool
+from avatarai.utils.metrics import MetricSet
 
 logger = init_logger("avatarai.nostr.client")
 
 class Nostr:
     def __init__(self, private_key: str, relays: List[str],
                  auto_reconnect: bool = True,
-                 reconnect_interval: int = 5) -> None:
+                 pool: Optional[RelayPool] = None,
+                 dispatch_workers: int = 4,
+                 dispatch_queue_size: int = 1024,
+                 backpressure: BackpressurePolicy = BackpressurePolicy.DROP_OLDEST,
+                 shed_kinds: Iterable[int] = (),
+                 dedup_size: int = 65536,
+                 dedup_ttl: Optional[float] = 600.0,
+                 checkpoint: Optional[AvatarCheckpoint] = None,
+                 outbox_store: Optional[AvatarOutboxStore] = None) -> None:
         """
         初始化Nostr客户端
 
         Args:
             private_key: 私钥字符串
             relays: 中继服务器URL列表
-            auto_reconnect: 是否自动重连
-            reconnect_interval: 重连间隔（秒）
+            auto_reconnect: 中继重连或关闭订阅后是否自动重新订阅（连接本身由连接池维护）
+            pool: 中继连接池，为None时使用进程级共享连接池
+            dispatch_workers: 事件分发worker数量
+            dispatch_queue_size: 事件分发队列总容量
+            backpressure: 分发队列满时的反压策略，BLOCK 会阻塞连接池上
+                所有Avatar的事件投递
+            shed_kinds: SHED_BY_KIND 策略下可丢弃的事件类型
+            dedup_size: 去重缓存记住的事件ID数量
+            dedup_ttl: 去重缓存的时间窗口（秒）
+            checkpoint: 事件处理检查点，用于重启或重连后从断点恢复
+            outbox_store: 发件箱存储，用于跨重启保留未送达的事件
         """
         self.private_key = private_key
         self.keys = Keys.parse(private_key)
         self.public_key = self.keys.public_key()
         self.signer = NostrSigner.keys(self.keys)
-        self.client = Client(self.signer)
+        self.pool = pool or get_relay_pool()
         self.relays = relays
         self.auto_reconnect = auto_reconnect
-        self.reconnect_interval = reconnect_interval
         self.connected = False
-        self._reconnect_task = None
-        self._current_subscriptions = []
+        self._relays_acquired = False
+        self._subscription_ids: List[str] = []
+        self.dispatcher = EventDispatcher(
+            num_workers=dispatch_workers,
+            max_queue_size=dispatch_queue_size,
+            policy=backpressure,
+            shed_kinds=shed_kinds
+        )
+        # 多个中继会推送同一事件，在验签和回调之前按ID去重
+        self.deduplicator = EventDeduplicator(max_size=dedup_size, ttl=dedup_ttl)
+        self.checkpoint = checkpoint
+        self.unwrapper = GiftWrapUnwrapper(self.signer)
+        self.outbox = Outbox(self.pool, relays, store=outbox_store)
+        # 按 kind 统计收到的事件（去重之前）
+        self.received: Counter = Counter()
 
     async def connect(self) -> bool:
         """连接到所有中继服务器"""
         try:
-            for relay_url in self.relays:
-                await self.client.add_relay(relay_url)
-                logger.info(f"添加中继服务器: {relay_url}")
-
-            await self.client.connect()
+            if not self._relays_acquired:
+                await self.pool.acquire(self.relays)
+                self._relays_acquired = True
+            await self.outbox.start()
             logger.info("成功连接到所有中继服务器")
             self.connected = True
-
-            # 如果启用自动重连且重连任务不存在，创建重连监控任务
-            if self.auto_reconnect and not self._reconnect_task:
-                self._reconnect_task = asyncio.create_task(self._reconnect_monitor())
-
             return True
         except Exception as e:
             logger.error(f"连接失败: {str(e)}")
             return False
 
-    async def _reconnect_monitor(self):
-        """监控连接状态并在断开时自动重连"""
-        while self.auto_reconnect:
-            if not self.connected:
-                logger.info("检测到连接已断开，尝试重新连接...")
-                success = await self.connect()
-                if success and self._current_subscriptions:
-                    # 重新建立之前的订阅
-                    logger.info("重新建立之前的订阅...")
-                    for subscription_info in self._current_subscriptions:
-                        filter_obj, callback = subscription_info
-                        await self.subscribe(filter_obj, callback)
-
-            await asyncio.sleep(self.reconnect_interval)
-
     async def disconnect(self):
         """断开连接并清理资源"""
-        self.auto_reconnect = False
-        if self._reconnect_task:
-            self._reconnect_task.cancel()
-            try:
-                await self._reconnect_task
-            except asyncio.CancelledError:
-                pass
-            self._reconnect_task = None
-
-        self._current_subscriptions.clear()
         self.connected = False
-        # 假设client.disconnect()是nostr_sdk提供的方法
-        # 如果没有，则需要根据SDK的API调整
+        # 连接由连接池共享，这里只取消自己的订阅并释放中继引用
         try:
-            await self.client.disconnect()
+            for subscription_id in self._subscription_ids:
+                await self.pool.unsubscribe(subscription_id)
+            self._subscription_ids.clear()
+            # 先处理完已入队的事件，回复进入发件箱后再停止发件箱，最后释放中继
+            await self.dispatcher.stop(drain=True)
+            await self.outbox.stop(drain=True)
+            if self._relays_acquired:
+                await self.pool.release(self.relays)
+                self._relays_acquired = False
             logger.info("成功断开连接")
         except Exception as e:
             logger.error(f"断开连接时发生错误: {str(e)}")
 
     async def subscribe(self, filter_obj: Optional[Filter] = None,
-                       callback: Optional[Callable[[Event], Any]] = None):
+                       callback: Optional[Callable[[Event], Any]] = None,
+                       name: Optional[str] = None,
+                       since_offset: int = 0):
         """
         订阅事件并开始监听
 
         Args:
             filter_obj: 过滤器对象，如果为None则创建默认过滤器
             callback: 收到事件时的回调函数
+            name: 稳定的订阅名，配置了检查点时从该订阅的断点恢复
+            since_offset: 从断点恢复时 since 需要提前的秒数
 
         Returns:
             订阅ID
@@ -118,9 +140,34 @@ class Nostr:
         # 使用默认过滤器或创建新的
         filter_to_use = filter_obj if filter_obj else Filter()
 
-        # 保存订阅信息以便重连时恢复
-        if callback:
-            self._current_subscriptions.append((filter_to_use, callback))
+        checkpoint = self.checkpoint if name else None
+
+        def current_filter() -> Filter:
+            """订阅当前应使用的过滤器，重新订阅时按最新检查点计算 since"""
+            if checkpoint:
+                return with_since(filter_to_use, checkpoint.get_since(name),
+                                  since_offset)
+            return filter_to_use
+
+        async def process(event: Event, relay_url: str):
+            """执行回调，结束后记录检查点"""
+            try:
+                if inspect.iscoroutinefunction(callback):
+                    await callback(event)
+                else:
+                    callback(event)
+            finally:
+                # 回调失败也要结束该事件，否则检查点会一直停在它之前
+                if checkpoint:
+                    checkpoint.complete(relay_url, name, event.id().to_hex(),
+                                        event.created_at().as_secs())
+
+        def dropped(event: Event, relay_url: str):
+            """已入队的事件被反压丢弃：不记为已处理，其他中继推送的副本仍可进入"""
+            self.deduplicator.forget(event.id().to_hex())
+            if checkpoint:
+                checkpoint.abandon(relay_url, name, event.id().to_hex(),
+                                   event.created_at().as_secs())
 
         # 创建统一的消息处理器
         class NostrNotificationHandler(HandleNotification):
@@ -131,31 +178,48 @@ class Nostr:
                 """处理各种中继消息"""
                 logger.debug(f"从 {relay_url} 收到消息: {msg}")
 
+                # 连接池会按该中继的退避节奏重新订阅，不影响其他中继
                 if msg.as_enum().is_closed():
-                    logger.info(f"订阅连接已关闭: {msg.as_json()}")
-                    self.parent.connected = False
+                    logger.info(f"订阅被 {relay_url} 关闭: {msg.as_json()}")
 
             async def handle(self, relay_url: str, subscription_id: str, event: Event):
                 """处理事件"""
                 if not callback:
                     return
 
-                try:
-                    # 根据回调类型（异步或同步）调用回调
-                    if inspect.iscoroutinefunction(callback):
-                        await callback(event)
-                    else:
-                        callback(event)
-                except Exception as e:
-                    logger.error(f"回调处理事件时出错: {str(e)}")
+                self.parent.received[event.kind().as_u16()] += 1
+                event_id = event.id().to_hex()
+                created_at = event.created_at().as_secs()
+                if (self.parent.deduplicator.is_duplicate(event_id)
+                        or (checkpoint and checkpoint.is_processed(event_id))):
+                    if checkpoint:
+                        checkpoint.skip(relay_url, name, created_at)
+                    return
+
+                # 交给分发队列，不在通知循环中等待回调
+                accepted = await self.parent.dispatcher.submit(
+                    event, partial(process, relay_url=relay_url),
+                    on_drop=partial(dropped, relay_url=relay_url))
+                if not accepted:
+                    logger.debug(f"分发队列已满，丢弃事件: {event_id}")
+                    self.parent.deduplicator.forget(event_id)
+                    if checkpoint:
+                        checkpoint.reject(relay_url, name, event_id, created_at)
+                    return
+                # 入队后到worker取出之前没有让出事件循环，此时开始跟踪不会错过完成
+                if checkpoint:
+                    checkpoint.begin(relay_url, name, created_at)
+
+        self.dispatcher.start()
 
         # 创建订阅并设置处理器
         try:
-            subscription = await self.client.subscribe(filter_to_use)
+            # 连接池统一监听通知，并按订阅ID路由到该处理器
             handler = NostrNotificationHandler(self)
-
-            # 启动监听任务
-            asyncio.create_task(self._listen_with_handler(handler))
+            subscription = await self.pool.subscribe(
+                self.relays, current_filter(), handler,
+                refresh=current_filter if self.auto_reconnect else None)
+            self._subscription_ids.append(subscription)
 
             logger.info(f"成功创建订阅，ID: {subscription}")
             return subscription
@@ -164,25 +228,58 @@ class Nostr:
             self.connected = False
             raise
 
-    async def _listen_with_handler(self, handler):
-        """使用给定的处理器监听事件"""
-        try:
-            await self.client.handle_notifications(handler)
-        except Exception as e:
-            logger.error(f"监听过程中发生错误: {str(e)}")
-            self.connected = False
+    @property
+    def ready(self) -> bool:
+        """已建立订阅，且至少有一个中继处于连接状态"""
+        if not (self.connected and self._subscription_ids):
+            return False
+        return any(health["connected"]
+                   for health in self.pool.health_snapshot(self.relays))
 
-    async def send_private_msg(self, pubkey: str, message: str):
-        """发送私信"""
-        public_key = PublicKey.parse(pubkey)
-        output = await self.client.send_private_msg(public_key, message)
+    def stats(self) -> dict:
+        """事件处理统计"""
+        return {
+            "dispatch": self.dispatcher.stats(),
+            "dedup": self.deduplicator.stats(),
+            "relays": self.pool.health_snapshot(self.relays),
+            "unwrap": self.unwrapper.stats(),
+            "outbox": self.outbox.stats(),
+        }
+
+    def collect_metrics(self, metrics: MetricSet, **labels) -> None:
+        for kind, count in self.received.items():
+            metrics.counter("events_received", "从中继收到的事件数（去重之前）", count,
+                            kind=str(kind), **labels)
+        self.deduplicator.collect_metrics(metrics, **labels)
+        self.dispatcher.collect_metrics(metrics, **labels)
+        self.unwrapper.collect_metrics(metrics, **labels)
+        self.outbox.collect_metrics(metrics, **labels)
 
-        logger.info(f"发送私信成功: {output}")
+    async def unwrap_gift_wrap(self, event: Event) -> UnwrappedGift:
+        """在加解密线程中解开发给本Avatar的GiftWrap事件，结果按事件ID缓存"""
+        return await self.unwrapper.unwrap(event)
+
+    async def send_private_msg(self, pubkey: str, message: str) -> str:
+        """
+        发送私信，返回第一个接受私信的中继
 
-        event = EventBuilder.private_msg_rumor(
+        发给对方和发给自己（多端同步）的两个 GiftWrap 在加解密线程中并行封装，
+        经发件箱并发发往所有中继；只等待发给对方的私信被第一个中继接受。
+        """
+        public_key = PublicKey.parse(pubkey)
+        rumor = EventBuilder.private_msg_rumor(
             public_key,
             message
         ).build(self.public_key)
-        output = await self.client.gift_wrap(self.public_key, event, [])
-        logger.info(f"(selfsend)发送私信成功: {output}")
-        return
+
+        workers = get_crypto_workers()
+        to_receiver, to_self = await asyncio.gather(
+            workers.submit(gift_wrap(self.signer, public_key, rumor, [])),
+            workers.submit(gift_wrap(self.signer, self.public_key, rumor, [])))
+
+        self_copy = self.outbox.enqueue(to_self)
+        # 自己的副本只在后台投递，失败由发件箱重试
+        self_copy.add_done_callback(lambda f: f.cancelled() or f.exception())
+        relay_url = await self.outbox.publish(to_receiver)
+        logger.info(f"发送私信成功: {relay_url}")
+        return relay_url
@@ -0,0 +1,66 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from avatarai.utils.metrics import MetricSet
+
+
+class EventDeduplicator:
+    """
+    按事件ID去重的有界时间窗口集合
+
+    同一事件从多个中继到达时只放行第一次。条目按首次出现的时间排列，
+    数量超过 max_size 时淘汰最早的条目，超过 ttl 秒的条目视为过期，内存占用固定。
+    """
+
+    def __init__(self, max_size: int = 65536, ttl: Optional[float] = 600.0):
+        """
+        Args:
+            max_size: 最多记住的事件ID数量
+            ttl: 事件ID的保留时间（秒），为None时只按容量淘汰
+        """
+        if max_size <= 0:
+            raise ValueError("max_size 必须大于0")
+        self.max_size = max_size
+        self.ttl = ttl
+        self._seen: OrderedDict[str, float] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def is_duplicate(self, event_id: str) -> bool:
+        """检查事件是否已见过，未见过时记录下来"""
+        now = time.monotonic()
+        self._expire(now)
+
+        if event_id in self._seen:
+            self.hits += 1
+            return True
+
+        self._seen[event_id] = now
+        if len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+        self.misses += 1
+        return False
+
+    def forget(self, event_id: str) -> None:
+        self._seen.pop(event_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._seen),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def collect_metrics(self, metrics: MetricSet, **labels) -> None:
+        metrics.counter("dedup_hits", "被去重丢弃的重复事件数", self.hits, **labels)
+        metrics.gauge("dedup_size", "去重缓存中的事件ID数量", len(self._seen), **labels)
+
+    def _expire(self, now: float) -> None:
+        if self.ttl is None:
+            return
+        while self._seen:
+            first_seen = next(iter(self._seen.values()))
+            if now - first_seen < self.ttl:
+                break
+            self._seen.popitem(last=False)
@@ -0,0 +1,193 @@
+import asyncio
+import inspect
+import time
+import zlib
+from enum import Enum
+from typing import Any, Callable, FrozenSet, Iterable, List, Optional, Tuple
+
+from nostr_sdk import Event
+
+from avatarai.logger import init_logger
+from avatarai.utils.metrics import MetricSet
+from avatarai.utils.stats import Histogram
+from avatarai.utils.tasks import get_task_supervisor
+
+logger = init_logger("avatarai.nostr.dispatch")
+
+EventCallback = Callable[[Event], Any]
+DropCallback = Callable[[Event], None]
+
+
+class BackpressurePolicy(str, Enum):
+    """
+    队列满时的处理策略
+
+    连接池的通知循环由所有Avatar共享，只有 BLOCK 会在其中等待：一个Avatar
+    的队列满了，其他Avatar的事件投递也会一起停顿。其余策略都不阻塞通知循环。
+    """
+    # 等待队列有空位，反压到共享的中继通知循环，只适合独占连接池的场景
+    BLOCK = "block"
+    # 丢弃队列中最旧的事件
+    DROP_OLDEST = "drop_oldest"
+    # 丢弃属于 shed_kinds 的新事件，其他事件挤掉队列中最旧的事件
+    SHED_BY_KIND = "shed_by_kind"
+
+
+class EventDispatcher:
+    """
+    事件分发阶段，位于通知处理和回调之间
+
+    每个worker拥有一个有界队列，事件按作者哈希到固定worker，
+    因此同一作者的事件按到达顺序处理，慢回调只阻塞同一worker上的作者。
+    默认策略在队列满时丢弃最旧的事件，提交不会阻塞共享的通知循环。
+    """
+
+    def __init__(self, num_workers: int = 4, max_queue_size: int = 1024,
+                 policy: BackpressurePolicy = BackpressurePolicy.DROP_OLDEST,
+                 shed_kinds: Iterable[int] = ()) -> None:
+        """
+        Args:
+            num_workers: worker任务数量
+            max_queue_size: 所有worker队列的总容量
+            policy: 队列满时的反压策略
+            shed_kinds: SHED_BY_KIND 策略下可以丢弃的事件类型
+        """
+        if num_workers <= 0:
+            raise ValueError("num_workers 必须大于0")
+        self.num_workers = num_workers
+        self.max_queue_size = max_queue_size
+        self.policy = BackpressurePolicy(policy)
+        self.shed_kinds: FrozenSet[int] = frozenset(shed_kinds)
+        per_worker_size = max(1, -(-max_queue_size // num_workers))
+        self._queues: List[asyncio.Queue] = [
+            asyncio.Queue(maxsize=per_worker_size) for _ in range(num_workers)
+        ]
+        self._workers: List[asyncio.Task] = []
+
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.wait_time = Histogram()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        self._workers = [
+            get_task_supervisor().spawn(self._worker(queue), f"dispatch-worker-{i}",
+                                        group="dispatch-worker")
+            for i, queue in enumerate(self._queues)
+        ]
+
+    async def stop(self, drain: bool = True) -> None:
+        """停止所有worker，drain为True时先处理完已入队的事件"""
+        if drain and self._workers:
+            await asyncio.gather(*(queue.join() for queue in self._queues))
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        # 不排空时，队列中剩下的事件按丢弃处理
+        for queue in self._queues:
+            while not queue.empty():
+                self._drop_oldest(queue)
+
+    async def submit(self, event: Event, callback: EventCallback,
+                     on_drop: Optional[DropCallback] = None) -> bool:
+        """
+        提交事件到分发队列
+
+        只有 BLOCK 策略会等待队列空位，其他策略立即返回。
+
+        Args:
+            event: 事件
+            callback: 处理事件的回调
+            on_drop: 已接受的事件在处理前被丢弃时调用（被更新的事件挤出队列，
+                或停止时未排空），调用方借此撤销为该事件记录的状态
+
+        Returns:
+            事件是否被接受（被反压策略拒绝时返回False，不调用 on_drop）
+        """
+        queue = self._queues[self._worker_index(event)]
+        item: Tuple[Event, EventCallback, float, Optional[DropCallback]] = (
+            event, callback, time.monotonic(), on_drop)
+
+        if queue.full():
+            if self.policy == BackpressurePolicy.BLOCK:
+                await queue.put(item)
+                self.enqueued += 1
+                return True
+            if (self.policy == BackpressurePolicy.SHED_BY_KIND
+                    and event.kind().as_u16() in self.shed_kinds):
+                self.dropped += 1
+                return False
+            self._drop_oldest(queue)
+
+        queue.put_nowait(item)
+        self.enqueued += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_size": self.max_queue_size,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "wait_time": self.wait_time.snapshot(),
+        }
+
+    def collect_metrics(self, metrics: MetricSet, **labels) -> None:
+        metrics.gauge("dispatch_queue_depth", "分发队列中等待处理的事件数",
+                      self.queue_depth, **labels)
+        metrics.counter("dispatch_enqueued", "进入分发队列的事件数", self.enqueued,
+                        **labels)
+        metrics.counter("dispatch_processed", "分发队列处理完成的事件数",
+                        self.processed, **labels)
+        metrics.counter("dispatch_dropped", "因反压被丢弃的事件数", self.dropped,
+                        **labels)
+        metrics.counter("dispatch_failed", "回调出错的事件数", self.failed, **labels)
+        metrics.histogram("dispatch_wait_seconds", "事件在分发队列中的等待时间",
+                          self.wait_time, **labels)
+
+    def _drop_oldest(self, queue: asyncio.Queue) -> None:
+        try:
+            event, _, _, on_drop = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        queue.task_done()
+        self.dropped += 1
+        if on_drop is not None:
+            try:
+                on_drop(event)
+            except Exception as e:
+                logger.error(f"处理被丢弃的事件时出错: {str(e)}")
+
+    def _worker_index(self, event: Event) -> int:
+        author = event.author().to_hex()
+        return zlib.crc32(author.encode("utf-8")) % self.num_workers
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            event, callback, enqueued_at, _ = await queue.get()
+            self.wait_time.observe(time.monotonic() - enqueued_at)
+            try:
+                if inspect.iscoroutinefunction(callback):
+                    await callback(event)
+                else:
+                    callback(event)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"回调处理事件时出错: {str(e)}")
+            finally:
+                queue.task_done()
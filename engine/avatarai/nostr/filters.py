@@ -0,0 +1,55 @@
+from typing import List, NamedTuple, Optional
+
+from nostr_sdk import Filter, Kind, PublicKey, Timestamp
+
+TEXT_NOTE_KIND = 1
+# NIP-04 私信
+DIRECT_MESSAGE_KIND = 4
+REACTION_KIND = 7
+# NIP-17 私信，作为 rumor 包在 GiftWrap 中
+PRIVATE_DIRECT_MESSAGE_KIND = 14
+GIFT_WRAP_KIND = 1059
+ZAP_RECEIPT_KIND = 9735
+
+# NIP-59 要求 GiftWrap 的 created_at 随机回拨，最多可达两天
+GIFT_WRAP_TIMESTAMP_TWEAK = 2 * 24 * 60 * 60
+
+
+class AvatarSubscription(NamedTuple):
+    """Avatar的一个逻辑订阅"""
+    # 稳定的订阅名，用作检查点的键
+    name: str
+    filter: Filter
+    # 恢复时 since 需要提前的秒数
+    since_offset: int = 0
+
+
+def build_avatar_filters(public_key: PublicKey) -> List[AvatarSubscription]:
+    """
+    为Avatar构造服务端订阅过滤器，只请求与其相关的事件
+
+    Args:
+        public_key: Avatar的公钥
+
+    Returns:
+        订阅列表：提及该公钥的 TextNote、私信、Reaction 和 Zap 回执，
+        以及发给该公钥的 GiftWrap
+    """
+    notes = Filter().kinds([
+        Kind(TEXT_NOTE_KIND), Kind(DIRECT_MESSAGE_KIND),
+        Kind(REACTION_KIND), Kind(ZAP_RECEIPT_KIND),
+    ]).pubkey(public_key)
+    gift_wraps = Filter().kind(Kind(GIFT_WRAP_KIND)).pubkey(public_key)
+    return [
+        AvatarSubscription("notes", notes),
+        # GiftWrap 的时间戳被回拨过，需要把恢复点相应提前
+        AvatarSubscription("gift_wraps", gift_wraps, GIFT_WRAP_TIMESTAMP_TWEAK),
+    ]
+
+
+def with_since(filter_obj: Filter, since: Optional[int],
+               since_offset: int = 0) -> Filter:
+    """给过滤器加上 since 恢复点"""
+    if since is None:
+        return filter_obj
+    return filter_obj.since(Timestamp.from_secs(max(0, since - since_offset)))
@@ -0,0 +1,163 @@
+import asyncio
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from nostr_sdk import Event, NostrSigner, UnwrappedGift
+
+from avatarai.logger import init_logger
+from avatarai.utils.metrics import MetricSet
+from avatarai.utils.stats import Histogram
+
+logger = init_logger("avatarai.nostr.giftwrap")
+
+
+class CryptoWorkers:
+    """
+    加解密线程组，每个线程运行独立的事件循环
+
+    nostr_sdk 的 GiftWrap 封装和解包是异步FFI接口，计算发生在驱动它的事件循环线程上。
+    把它们放到独立线程的事件循环中执行，主事件循环只负责转发结果；
+    FFI 调用期间释放 GIL，多核时各线程可以并行计算。
+    """
+
+    def __init__(self, num_workers: Optional[int] = None):
+        """
+        Args:
+            num_workers: 线程数，默认取 CPU 核数（最多4个）
+        """
+        self.num_workers = num_workers or min(4, os.cpu_count() or 1)
+        self._loops: List[asyncio.AbstractEventLoop] = []
+        self._threads: List[threading.Thread] = []
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+
+    def submit(self, coro) -> asyncio.Future:
+        """在工作线程中执行协程，返回可在当前事件循环中等待的 Future"""
+        self._ensure_started()
+        loop = self._loops[next(self._next) % self.num_workers]
+        return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            for loop in self._loops:
+                loop.call_soon_threadsafe(loop.stop)
+            for thread in self._threads:
+                thread.join(timeout=1.0)
+            self._loops.clear()
+            self._threads.clear()
+
+    def _ensure_started(self) -> None:
+        if self._loops:
+            return
+        with self._lock:
+            if self._loops:
+                return
+            for index in range(self.num_workers):
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, daemon=True,
+                                          name=f"nostr-crypto-{index}")
+                thread.start()
+                self._threads.append(thread)
+                self._loops.append(loop)
+
+
+_workers: Optional[CryptoWorkers] = None
+
+
+def get_crypto_workers() -> CryptoWorkers:
+    """进程级共享的加解密线程组，所有Avatar复用"""
+    global _workers
+    if _workers is None:
+        _workers = CryptoWorkers()
+    return _workers
+
+
+class GiftWrapUnwrapper:
+    """
+    GiftWrap 解包阶段
+
+    NIP-59 的两层解密在加解密线程中执行，多个事件可并发解包；
+    解包结果按 GiftWrap 事件ID缓存，同一事件被重复投递或重复处理时不再解密，
+    并发到达的相同事件共享同一次解包。
+    """
+
+    def __init__(self, signer: NostrSigner, cache_size: int = 4096,
+                 workers: Optional[CryptoWorkers] = None):
+        """
+        Args:
+            signer: 接收方的签名者
+            cache_size: 缓存的 rumor 数量
+            workers: 加解密线程组，为None时使用进程级共享线程组
+        """
+        self.signer = signer
+        self.cache_size = cache_size
+        self.workers = workers or get_crypto_workers()
+        self._cache: OrderedDict[str, UnwrappedGift] = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        self.cache_hits = 0
+        self.unwrapped = 0
+        self.failed = 0
+        self.unwrap_time = Histogram()
+
+    async def unwrap(self, gift_wrap: Event) -> UnwrappedGift:
+        """解开 GiftWrap 事件，失败时抛出异常"""
+        wrap_id = gift_wrap.id().to_hex()
+        cached = self._cache.get(wrap_id)
+        if cached is not None:
+            self._cache.move_to_end(wrap_id)
+            self.cache_hits += 1
+            return cached
+
+        future = self._inflight.get(wrap_id)
+        if future is not None:
+            self.cache_hits += 1
+            return await asyncio.shield(future)
+
+        future = self.workers.submit(self._timed_unwrap(gift_wrap))
+        self._inflight[wrap_id] = future
+        try:
+            result = await asyncio.shield(future)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._inflight.pop(wrap_id, None)
+
+        self.unwrapped += 1
+        self._cache[wrap_id] = result
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "unwrapped": self.unwrapped,
+            "cache_hits": self.cache_hits,
+            "failed": self.failed,
+            "cache_size": len(self._cache),
+            "inflight": len(self._inflight),
+            "unwrap_time": self.unwrap_time.snapshot(),
+        }
+
+    def collect_metrics(self, metrics: MetricSet, **labels) -> None:
+        metrics.counter("unwrap_unwrapped", "解开的 GiftWrap 数", self.unwrapped,
+                        **labels)
+        metrics.counter("unwrap_cache_hits", "命中 rumor 缓存的 GiftWrap 数",
+                        self.cache_hits, **labels)
+        metrics.counter("unwrap_failed", "解包失败的 GiftWrap 数", self.failed,
+                        **labels)
+        metrics.histogram("unwrap_seconds", "单个 GiftWrap 的解包耗时",
+                          self.unwrap_time, **labels)
+
+    async def _timed_unwrap(self, gift_wrap: Event) -> UnwrappedGift:
+        # 在加解密线程的事件循环中运行
+        started = time.perf_counter()
+        try:
+            return await UnwrappedGift.from_gift_wrap(self.signer, gift_wrap)
+        finally:
+            self.unwrap_time.observe(time.perf_counter() - started)
@@ -0,0 +1,448 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import os
+import random
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from operator import itemgetter
+from typing import Dict, List, Optional, Set, Tuple
+
+from nostr_sdk import Event
+
+from avatarai.logger import init_logger
+from avatarai.nostr.pool import RelayPool
+from avatarai.utils.metrics import MetricSet
+from avatarai.utils.stats import Histogram
+from avatarai.utils.tasks import get_task_supervisor
+
+logger = init_logger("avatarai.nostr.outbox")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    avatar_id TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    relay_url TEXT NOT NULL,
+    event_json TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    created_at INTEGER NOT NULL,
+    PRIMARY KEY (avatar_id, event_id, relay_url)
+) WITHOUT ROWID;
+"""
+
+
+class OutboxFullError(RuntimeError):
+    """发件箱队列已满，事件未被接受"""
+
+
+class OutboxStore:
+    """
+    待发送事件的本地持久化存储（SQLite）
+
+    每个 (事件, 中继) 一行，事件被该中继接受后删除；进程重启后未送达的事件继续重试。
+    写入按顺序缓存在内存中，按时间间隔在一个事务中批量提交，发布事件不再
+    每次都同步提交一次；调用 start 后还会定时提交，崩溃时最多丢失一个间隔内的写入。
+    """
+
+    def __init__(self, path: str, flush_interval: float = 0.1) -> None:
+        """
+        Args:
+            path: SQLite 数据库文件路径
+            flush_interval: 两次批量提交的最小间隔（秒），为0时每次写入立即提交
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+        # (SQL, 参数)，按写入顺序提交
+        self._pending: List[Tuple[str, tuple]] = []
+        self._last_flush = time.monotonic()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """启动定时提交任务，在事件循环中调用"""
+        if self._flush_task is None:
+            self._flush_task = get_task_supervisor().spawn(
+                self._flush_periodically(), "outbox-flush")
+
+    def for_avatar(self, avatar_id: str) -> "AvatarOutboxStore":
+        return AvatarOutboxStore(self, avatar_id)
+
+    def add(self, avatar_id: str, event: Event, relays: List[str]) -> None:
+        event_id = event.id().to_hex()
+        event_json = event.as_json()
+        now = int(time.time())
+        self._execute(
+            "INSERT OR IGNORE INTO outbox "
+            "(avatar_id, event_id, relay_url, event_json, attempts, created_at) "
+            "VALUES (?, ?, ?, ?, 0, ?)",
+            [(avatar_id, event_id, relay_url, event_json, now) for relay_url in relays])
+
+    def record_attempt(self, avatar_id: str, event_id: str, relay_url: str,
+                       attempts: int) -> None:
+        self._execute(
+            "UPDATE outbox SET attempts = ? "
+            "WHERE avatar_id = ? AND event_id = ? AND relay_url = ?",
+            [(attempts, avatar_id, event_id, relay_url)])
+
+    def remove(self, avatar_id: str, event_id: str, relay_url: str) -> None:
+        self._execute(
+            "DELETE FROM outbox WHERE avatar_id = ? AND event_id = ? AND relay_url = ?",
+            [(avatar_id, event_id, relay_url)])
+
+    def pending(self, avatar_id: str) -> List[Tuple[str, str, str, int]]:
+        """未送达的 (事件ID, 中继, 事件JSON, 已尝试次数)"""
+        self.flush()
+        return self._conn.execute(
+            "SELECT event_id, relay_url, event_json, attempts FROM outbox "
+            "WHERE avatar_id = ? ORDER BY created_at",
+            (avatar_id,)).fetchall()
+
+    def flush(self) -> None:
+        """提交缓存的写入"""
+        writes, self._pending = self._pending, []
+        self._last_flush = time.monotonic()
+        if not writes:
+            return
+        try:
+            with self._conn:
+                # 相邻的同一语句合并为一次 executemany，整体仍按写入顺序执行
+                for sql, group in itertools.groupby(writes, key=itemgetter(0)):
+                    self._conn.executemany(sql, [row for _, row in group])
+        except sqlite3.Error as e:
+            logger.error(f"写入发件箱失败: {str(e)}")
+
+    def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self.flush()
+        self._conn.close()
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(max(self.flush_interval, 0.05))
+            self._maybe_flush()
+
+    def _maybe_flush(self) -> None:
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def _execute(self, sql: str, rows: list) -> None:
+        self._pending.extend((sql, tuple(row)) for row in rows)
+        self._maybe_flush()
+
+
+class AvatarOutboxStore:
+    """绑定到单个Avatar的发件箱存储视图"""
+
+    def __init__(self, store: OutboxStore, avatar_id: str):
+        self.store = store
+        self.avatar_id = avatar_id
+
+    def add(self, event: Event, relays: List[str]) -> None:
+        self.store.add(self.avatar_id, event, relays)
+
+    def record_attempt(self, event_id: str, relay_url: str, attempts: int) -> None:
+        self.store.record_attempt(self.avatar_id, event_id, relay_url, attempts)
+
+    def remove(self, event_id: str, relay_url: str) -> None:
+        self.store.remove(self.avatar_id, event_id, relay_url)
+
+    def pending(self) -> List[Tuple[str, str, str, int]]:
+        return self.store.pending(self.avatar_id)
+
+
+@dataclass(order=True)
+class _Retry:
+    next_attempt: float
+    event_id: str = field(compare=False)
+    relay_url: str = field(compare=False)
+    attempts: int = field(compare=False, default=0)
+
+
+class Outbox:
+    """
+    单个Avatar的发件箱
+
+    待发布的事件先持久化再进入队列，由若干worker并发发送：每个事件同时发往
+    所有中继，第一个中继接受后即返回，调用方的延迟只取决于最快的中继；
+    其余中继在后台继续发送，失败的中继按带抖动的指数退避重试，直到成功
+    或超过最大尝试次数。
+    """
+
+    def __init__(self, pool: RelayPool, relays: List[str],
+                 store: Optional[AvatarOutboxStore] = None,
+                 num_workers: int = 4, max_queue_size: int = 1024,
+                 max_attempts: int = 10, retry_base: float = 2.0,
+                 retry_max: float = 600.0):
+        """
+        Args:
+            pool: 中继连接池
+            relays: 发布的目标中继
+            store: 持久化存储，为None时未送达的事件不会跨重启保留
+            num_workers: 并发发送的worker数量
+            max_queue_size: 等待发送的事件数量上限
+            max_attempts: 单个中继的最大尝试次数
+            retry_base: 重试退避的初始时长（秒）
+            retry_max: 重试退避的上限（秒）
+        """
+        self.pool = pool
+        self.relays = relays
+        self.store = store
+        self.num_workers = num_workers
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._workers: List[asyncio.Task] = []
+        self._retry_task: Optional[asyncio.Task] = None
+        self._retry_wakeup = asyncio.Event()
+        self._retries: List[_Retry] = []
+        # 尚有中继未送达的事件
+        self._events: Dict[str, Event] = {}
+        self._undelivered: Dict[str, Set[str]] = {}
+        self._background: Set[asyncio.Task] = set()
+
+        self.sent = 0
+        self.failed_attempts = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.first_ack_latency = Histogram()
+
+    async def start(self) -> None:
+        """启动发送worker，并恢复持久化的未送达事件"""
+        if self._workers:
+            return
+        if self.store:
+            # 存储是未送达事件的唯一来源，重新启动时不保留上次的重试，避免重复调度
+            self._reset_retries()
+            now = time.monotonic()
+            for event_id, relay_url, event_json, attempts in self.store.pending():
+                if event_id not in self._events:
+                    self._events[event_id] = Event.from_json(event_json)
+                self._undelivered.setdefault(event_id, set()).add(relay_url)
+                heapq.heappush(self._retries,
+                               _Retry(now, event_id, relay_url, attempts))
+            if self._retries:
+                logger.info(f"发件箱恢复了 {len(self._retries)} 个未送达的投递")
+        supervisor = get_task_supervisor()
+        self._workers = [
+            supervisor.spawn(self._worker(), f"outbox-worker-{i}",
+                             group="outbox-worker")
+            for i in range(self.num_workers)
+        ]
+        self._retry_task = supervisor.spawn(self._retry_loop(), "outbox-retry")
+
+    async def stop(self, drain: bool = True, timeout: float = 10.0) -> None:
+        """
+        停止发送，未送达的事件保留在存储中，下次启动时继续
+
+        Args:
+            drain: 是否先把已入队的事件发往中继（等到第一个中继接受或全部失败）
+            timeout: 等待已入队事件发出的最长时间（秒）
+        """
+        if drain and self._workers:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"发件箱在 {timeout} 秒内未发完，剩余 "
+                               f"{self._queue.qsize()} 个事件下次启动时发送")
+        tasks = self._workers + list(self._background)
+        if self._retry_task:
+            tasks.append(self._retry_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._retry_task = None
+        self._background.clear()
+        if self.store:
+            self._reset_retries()
+        # 还在队列中的事件已持久化，通知等待方本次不会再发送
+        while not self._queue.empty():
+            _, _, future = self._queue.get_nowait()
+            self._queue.task_done()
+            if not future.done():
+                future.cancel()
+
+    def enqueue(self, event: Event,
+                relays: Optional[List[str]] = None) -> asyncio.Future:
+        """
+        持久化并排队一个已签名的事件
+
+        Returns:
+            第一个中继接受事件时完成的 Future，结果为该中继的URL；
+            所有中继首轮都失败时以 ConnectionError 结束（后台仍会重试）；
+            队列已满时立即以 OutboxFullError 结束，事件不会持久化，也不会在之后发送
+        """
+        relays = list(relays or self.relays)
+        future = asyncio.get_running_loop().create_future()
+        if self._queue.full():
+            # 先检查再持久化，被拒绝的事件不会留在存储中、在下次启动时被发出
+            self.rejected += 1
+            future.set_exception(
+                OutboxFullError(f"发件箱已满，拒绝事件 {event.id().to_hex()}"))
+            return future
+        if self.store:
+            self.store.add(event, relays)
+        self._queue.put_nowait((event, relays, future))
+        return future
+
+    async def publish(self, event: Event, relays: Optional[List[str]] = None) -> str:
+        """发布事件，等待第一个中继接受"""
+        return await self.enqueue(event, relays)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "pending_retries": len(self._retries),
+            "undelivered_events": len(self._undelivered),
+            "sent": self.sent,
+            "failed_attempts": self.failed_attempts,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "first_ack_latency": self.first_ack_latency.snapshot(),
+        }
+
+    def collect_metrics(self, metrics: MetricSet, **labels) -> None:
+        metrics.gauge("outbox_queued", "发件箱中等待发送的事件数", self._queue.qsize(),
+                      **labels)
+        metrics.gauge("outbox_pending_retries", "等待重试的投递数", len(self._retries),
+                      **labels)
+        metrics.counter("outbox_sent", "被中继接受的投递数", self.sent, **labels)
+        metrics.counter("outbox_failed_attempts", "失败的投递尝试数",
+                        self.failed_attempts, **labels)
+        metrics.counter("outbox_dropped", "超过重试次数被放弃的投递数", self.dropped,
+                        **labels)
+        metrics.counter("outbox_rejected", "发件箱已满时被拒绝的事件数", self.rejected,
+                        **labels)
+        metrics.histogram("outbox_first_ack_seconds", "事件被第一个中继接受的耗时",
+                          self.first_ack_latency, **labels)
+
+    async def _worker(self) -> None:
+        while True:
+            event, relays, future = await self._queue.get()
+            try:
+                await self._fan_out(event, relays, future)
+            except Exception as e:
+                logger.error(f"发送事件时出错: {str(e)}")
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    async def _fan_out(self, event: Event, relays: List[str],
+                       future: asyncio.Future) -> None:
+        """同时发往所有中继，等到第一个中继接受（或全部失败）后返回"""
+        event_id = event.id().to_hex()
+        self._events[event_id] = event
+        self._undelivered[event_id] = set(relays)
+        started = time.monotonic()
+        tasks = {
+            get_task_supervisor().spawn(
+                self._send_one(event, relay_url, attempts=0),
+                f"outbox-send-{relay_url}", group="outbox-send"): relay_url
+            for relay_url in relays
+        }
+        pending = set(tasks)
+        while pending and not future.done():
+            done, pending = await asyncio.wait(pending,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.result() and not future.done():
+                    self.first_ack_latency.observe(time.monotonic() - started)
+                    future.set_result(tasks[task])
+
+        # 较慢的中继在后台继续发送，不阻塞worker
+        for task in pending:
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+        if not future.done():
+            future.set_exception(
+                ConnectionError(f"所有中继都未接受事件 {event_id}，将在后台重试"))
+
+    async def _send_one(self, event: Event, relay_url: str, attempts: int) -> bool:
+        event_id = event.id().to_hex()
+        error = None
+        try:
+            output = await self.pool.send_event([relay_url], event)
+            if output.failed:
+                error = "; ".join(str(reason) for reason in output.failed.values())
+            elif not output.success:
+                error = "未收到中继的确认"
+        except Exception as e:
+            error = str(e)
+
+        if error is None:
+            self.sent += 1
+            self._delivered(event_id, relay_url)
+            return True
+
+        attempts += 1
+        self.failed_attempts += 1
+        if attempts >= self.max_attempts:
+            self.dropped += 1
+            logger.warning(f"事件 {event_id} 在 {relay_url} 上重试 {attempts} 次"
+                           f"仍失败，已放弃: {error}")
+            self._delivered(event_id, relay_url)
+            return False
+
+        if self.store:
+            self.store.record_attempt(event_id, relay_url, attempts)
+        heapq.heappush(self._retries, _Retry(
+            time.monotonic() + self._backoff(attempts), event_id, relay_url, attempts))
+        self._retry_wakeup.set()
+        logger.debug(f"事件 {event_id} 发送到 {relay_url} 失败"
+                     f"（第 {attempts} 次）: {error}")
+        return False
+
+    def _delivered(self, event_id: str, relay_url: str) -> None:
+        """该中继不再需要发送此事件（成功或放弃）"""
+        if self.store:
+            self.store.remove(event_id, relay_url)
+        relays = self._undelivered.get(event_id)
+        if relays is None:
+            return
+        relays.discard(relay_url)
+        if not relays:
+            del self._undelivered[event_id]
+            self._events.pop(event_id, None)
+
+    def _reset_retries(self) -> None:
+        self._retries.clear()
+        self._events.clear()
+        self._undelivered.clear()
+        self._retry_wakeup.clear()
+
+    def _backoff(self, attempts: int) -> float:
+        # full jitter，避免大量失败的事件同时重试
+        ceiling = min(self.retry_max, self.retry_base * (2 ** min(attempts, 16)))
+        return random.uniform(0, ceiling)
+
+    async def _retry_loop(self) -> None:
+        while True:
+            timeout = None
+            if self._retries:
+                timeout = max(0.0, self._retries[0].next_attempt - time.monotonic())
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._retry_wakeup.wait(), timeout=timeout)
+            self._retry_wakeup.clear()
+
+            now = time.monotonic()
+            while self._retries and self._retries[0].next_attempt <= now:
+                retry = heapq.heappop(self._retries)
+                event = self._events.get(retry.event_id)
+                if event is None:
+                    continue
+                task = get_task_supervisor().spawn(
+                    self._send_one(event, retry.relay_url, retry.attempts),
+                    f"outbox-send-{retry.relay_url}", group="outbox-send")
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
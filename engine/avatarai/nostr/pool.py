@@ -0,0 +1,365 @@
+import asyncio
+import contextlib
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from nostr_sdk import (
+    Client,
+    Event,
+    Filter,
+    HandleNotification,
+    RelayMessage,
+    SendEventOutput,
+)
+
+from avatarai.logger import init_logger
+from avatarai.utils.metrics import MetricSet
+from avatarai.utils.tasks import get_task_supervisor
+
+logger = init_logger("avatarai.nostr.pool")
+
+# 返回订阅当前应使用的过滤器（例如按检查点重新计算 since）
+FilterFactory = Callable[[], Filter]
+
+
+@dataclass
+class RelayHealth:
+    """单个中继的连接状态"""
+    url: str
+    connected: bool = False
+    ever_connected: bool = False
+    # 连续失败次数，决定退避时长
+    failures: int = 0
+    reconnects: int = 0
+    last_error: Optional[str] = None
+    last_change: float = field(default_factory=time.time)
+    next_attempt: float = 0.0
+    # 被中继关闭、等待重新订阅的订阅ID
+    closed_subscriptions: Set[str] = field(default_factory=set)
+
+    def as_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "connected": self.connected,
+            "failures": self.failures,
+            "reconnects": self.reconnects,
+            "last_error": self.last_error,
+            "last_change": self.last_change,
+        }
+
+
+@dataclass
+class _Route:
+    handler: HandleNotification
+    relays: List[str]
+    refresh: Optional[FilterFactory] = None
+
+
+class RelayPool:
+    """
+    进程级中继连接池
+
+    每个中继URL只建立一条连接，多个Avatar的订阅和发布复用同一个
+    nostr_sdk.Client。Client不持有签名者，事件由各Avatar在本地签名后
+    再交给连接池发送；收到的事件按订阅ID路由回对应Avatar的处理器。
+
+    每个中继单独跟踪连接状态。断线、订阅被关闭或发布失败时唤醒健康检查，
+    只对出问题的中继按带抖动的指数退避重连，并用原订阅ID重新发送订阅，
+    替换而不是叠加原有订阅。
+    """
+
+    def __init__(self, client: Optional[Client] = None,
+                 check_interval: float = 5.0,
+                 backoff_base: float = 1.0,
+                 backoff_max: float = 300.0) -> None:
+        """
+        Args:
+            client: 自定义的 nostr_sdk.Client，为None时创建不带签名者的Client
+            check_interval: 健康检查的兜底间隔（秒）
+            backoff_base: 重连退避的初始时长（秒）
+            backoff_max: 重连退避的上限（秒）
+        """
+        self.client = client or Client()
+        self.check_interval = check_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # 中继URL -> 使用该中继的Avatar数量
+        self._relay_refs: Counter = Counter()
+        self.health: Dict[str, RelayHealth] = {}
+        # 订阅ID -> 路由信息
+        self._routes: Dict[str, _Route] = {}
+        self._listen_task: Optional[asyncio.Task] = None
+        self._monitor_task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+
+    @property
+    def relays(self) -> List[str]:
+        return list(self._relay_refs)
+
+    async def acquire(self, relays: Iterable[str]) -> None:
+        """登记一组中继，尚未连接的中继会被添加并连接"""
+        async with self._lock:
+            relays = list(relays)
+            new_relays = [url for url in dict.fromkeys(relays)
+                          if url not in self._relay_refs]
+            added = []
+            try:
+                for relay_url in new_relays:
+                    await self.client.add_relay(relay_url)
+                    added.append(relay_url)
+                if new_relays:
+                    await self.client.connect()
+            except Exception:
+                # 全部添加成功后才登记引用，失败时撤销本次添加的中继，
+                # 否则引用计数残留，之后的 acquire 都不会再添加它
+                for relay_url in added:
+                    await self._remove_relay(relay_url)
+                raise
+            for relay_url in relays:
+                self._relay_refs[relay_url] += 1
+            for relay_url in new_relays:
+                self.health[relay_url] = RelayHealth(relay_url)
+                logger.info(f"连接池添加中继服务器: {relay_url}")
+            if new_relays:
+                # 立即检查一次，尽早得到新中继的连接状态
+                self._wakeup.set()
+
+            if self._listen_task is None or self._listen_task.done():
+                self._listen_task = get_task_supervisor().spawn(self._listen(),
+                                                                "relay-pool-listen")
+            if self._monitor_task is None or self._monitor_task.done():
+                self._monitor_task = get_task_supervisor().spawn(self._monitor(),
+                                                                 "relay-pool-monitor")
+
+    async def release(self, relays: Iterable[str]) -> None:
+        """释放一组中继，不再被任何Avatar使用的中继会被移除"""
+        async with self._lock:
+            for relay_url in relays:
+                self._relay_refs[relay_url] -= 1
+                if self._relay_refs[relay_url] > 0:
+                    continue
+                del self._relay_refs[relay_url]
+                self.health.pop(relay_url, None)
+                await self._remove_relay(relay_url)
+
+    async def subscribe(self, relays: List[str], filter_obj: Filter,
+                        handler: HandleNotification,
+                        refresh: Optional[FilterFactory] = None) -> str:
+        """
+        在指定中继上订阅，并将该订阅的事件路由到handler
+
+        Args:
+            relays: 订阅的中继
+            filter_obj: 过滤器
+            handler: 该订阅的处理器
+            refresh: 中继重连后重新订阅时用于生成过滤器，为None时不重新订阅
+        """
+        output = await self.client.subscribe_to(relays, filter_obj)
+        subscription_id = str(output.id)
+        self._routes[subscription_id] = _Route(handler, list(relays), refresh)
+        return subscription_id
+
+    async def unsubscribe(self, subscription_id: str) -> None:
+        self._routes.pop(subscription_id, None)
+        for health in self.health.values():
+            health.closed_subscriptions.discard(subscription_id)
+        try:
+            await self.client.unsubscribe(subscription_id)
+        except Exception as e:
+            logger.error(f"取消订阅 {subscription_id} 时出错: {str(e)}")
+
+    async def send_event(self, relays: List[str], event: Event) -> SendEventOutput:
+        """将已签名的事件发送到指定中继"""
+        output = await self.client.send_event_to(relays, event)
+        for relay_url, error in output.failed.items():
+            self.report_failure(str(relay_url), error)
+        return output
+
+    def report_failure(self, relay_url: str, error: Optional[str] = None) -> None:
+        """外部观察到中继异常时调用，立即触发一次健康检查"""
+        health = self.health.get(relay_url)
+        if health is not None:
+            health.last_error = error
+            self._wakeup.set()
+
+    def report_closed(self, relay_url: str, subscription_id: str) -> None:
+        """订阅被中继关闭，按该中继的退避节奏重新订阅"""
+        health = self.health.get(relay_url)
+        route = self._routes.get(subscription_id)
+        if health is None or route is None or route.refresh is None:
+            return
+        health.closed_subscriptions.add(subscription_id)
+        health.next_attempt = max(health.next_attempt,
+                                  time.monotonic() + self._backoff(health))
+        health.failures += 1
+        self._wakeup.set()
+
+    def health_snapshot(self, relays: Optional[Iterable[str]] = None) -> List[dict]:
+        urls = relays if relays is not None else self.health.keys()
+        return [self.health[url].as_dict() for url in urls if url in self.health]
+
+    def collect_metrics(self, metrics: MetricSet) -> None:
+        for relay_url, health in self.health.items():
+            metrics.gauge("relay_connected", "中继是否已连接", int(health.connected),
+                          relay=relay_url)
+            metrics.gauge("relay_consecutive_failures", "中继连续失败次数",
+                          health.failures, relay=relay_url)
+            metrics.counter("relay_reconnects", "中继断线后恢复连接的次数",
+                            health.reconnects, relay=relay_url)
+            metrics.gauge("relay_users", "使用该中继的Avatar数量",
+                          self._relay_refs[relay_url], relay=relay_url)
+        metrics.gauge("relay_subscriptions", "连接池中的订阅数", len(self._routes))
+
+    async def close(self) -> None:
+        """关闭连接池，断开所有中继"""
+        for task in (self._monitor_task, self._listen_task):
+            if task:
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+        self._monitor_task = None
+        self._listen_task = None
+        self._routes.clear()
+        self._relay_refs.clear()
+        self.health.clear()
+        try:
+            await self.client.disconnect()
+        except Exception as e:
+            logger.error(f"关闭连接池时发生错误: {str(e)}")
+
+    async def _remove_relay(self, relay_url: str) -> None:
+        try:
+            await self.client.remove_relay(relay_url)
+            logger.info(f"连接池移除中继服务器: {relay_url}")
+        except Exception as e:
+            logger.error(f"移除中继服务器 {relay_url} 时出错: {str(e)}")
+
+    async def _listen(self) -> None:
+        """所有订阅共用一个通知循环"""
+        try:
+            await self.client.handle_notifications(_PoolNotificationHandler(self))
+        except Exception as e:
+            logger.error(f"连接池监听过程中发生错误: {str(e)}")
+
+    def _backoff(self, health: RelayHealth) -> float:
+        # full jitter：在 [0, min(max, base * 2^n)] 中均匀取值，避免多个中继同时重连
+        ceiling = min(self.backoff_max,
+                      self.backoff_base * (2 ** min(health.failures, 16)))
+        return random.uniform(0, ceiling)
+
+    async def _monitor(self) -> None:
+        """健康检查循环：由异常事件唤醒，check_interval 作为兜底"""
+        while True:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.check_interval)
+            self._wakeup.clear()
+            try:
+                await self._check_relays()
+            except Exception as e:
+                logger.error(f"中继健康检查出错: {str(e)}")
+
+    async def _check_relays(self) -> None:
+        current = await self.client.relays()
+        relays = {str(url): relay for url, relay in current.items()}
+        now = time.monotonic()
+        for relay_url, health in list(self.health.items()):
+            relay = relays.get(relay_url)
+            connected = relay is not None and relay.is_connected()
+
+            if connected and not health.connected:
+                health.connected = True
+                health.failures = 0
+                health.last_change = time.time()
+                if health.ever_connected:
+                    health.reconnects += 1
+                    logger.info(f"中继服务器已恢复连接: {relay_url}")
+                    await self._resubscribe(relay_url, self._routes_on(relay_url))
+                health.ever_connected = True
+                continue
+
+            if not connected:
+                if health.connected:
+                    health.connected = False
+                    health.last_change = time.time()
+                    logger.warning(f"中继服务器连接断开: {relay_url}")
+                if now < health.next_attempt:
+                    continue
+                health.failures += 1
+                health.next_attempt = now + self._backoff(health)
+                try:
+                    await self.client.connect_relay(relay_url)
+                except Exception as e:
+                    health.last_error = str(e)
+                    logger.error(f"重连中继服务器 {relay_url} 失败: {str(e)}")
+                continue
+
+            # 连接正常，处理被中继关闭的订阅
+            if health.closed_subscriptions and now >= health.next_attempt:
+                closed = list(health.closed_subscriptions)
+                health.closed_subscriptions.clear()
+                await self._resubscribe(relay_url, closed)
+
+    def _routes_on(self, relay_url: str) -> List[str]:
+        return [
+            subscription_id for subscription_id, route in self._routes.items()
+            if relay_url in route.relays and route.refresh is not None
+        ]
+
+    async def _resubscribe(self, relay_url: str, subscription_ids: List[str]) -> None:
+        """用原订阅ID在单个中继上重新订阅，替换旧的订阅"""
+        for subscription_id in subscription_ids:
+            route = self._routes.get(subscription_id)
+            if route is None or route.refresh is None:
+                continue
+            try:
+                await self.client.subscribe_with_id_to(
+                    [relay_url], subscription_id, route.refresh())
+                logger.info(f"已在 {relay_url} 上重新订阅: {subscription_id}")
+            except Exception as e:
+                self.health[relay_url].closed_subscriptions.add(subscription_id)
+                logger.error(f"在 {relay_url} 上重新订阅 {subscription_id} 失败: "
+                             f"{str(e)}")
+
+
+class _PoolNotificationHandler(HandleNotification):
+    """按订阅ID把通知分发给各Avatar的处理器"""
+
+    def __init__(self, pool: RelayPool):
+        self.pool = pool
+
+    async def handle_msg(self, relay_url: str, msg: RelayMessage):
+        # EVENT 消息由 handle 处理，这里只转发携带订阅ID的控制消息（如CLOSED）
+        msg_enum = msg.as_enum()
+        if msg_enum.is_event_msg():
+            return
+        subscription_id = getattr(msg_enum, "subscription_id", None)
+        if not subscription_id:
+            return
+        subscription_id = str(subscription_id)
+        if msg_enum.is_closed():
+            self.pool.report_closed(relay_url, subscription_id)
+        route = self.pool._routes.get(subscription_id)
+        if route is not None:
+            await route.handler.handle_msg(relay_url, msg)
+
+    async def handle(self, relay_url: str, subscription_id: str, event: Event):
+        route = self.pool._routes.get(subscription_id)
+        if route is None:
+            logger.debug(f"收到未知订阅 {subscription_id} 的事件，已忽略")
+            return
+        await route.handler.handle(relay_url, subscription_id, event)
+
+
+_relay_pool: Optional[RelayPool] = None
+
+
+def get_relay_pool() -> RelayPool:
+    """获取进程级共享的中继连接池"""
+    global _relay_pool
+    if _relay_pool is None:
+        _relay_pool = RelayPool()
+    return _relay_pool
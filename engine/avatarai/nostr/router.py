@@ -0,0 +1,103 @@
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from nostr_sdk import Event
+
+from avatarai.logger import init_logger
+from avatarai.utils.metrics import MetricSet
+from avatarai.utils.stats import Histogram
+
+logger = init_logger("avatarai.nostr.router")
+
+EventHandler = Callable[[Event], Awaitable[None]]
+
+
+class _KindRoute:
+    def __init__(self, handler: EventHandler):
+        self.handler = handler
+        self.latency = Histogram()
+        self.handled = 0
+        self.failed = 0
+
+    def stats(self) -> dict:
+        return {
+            "handler": getattr(self.handler, "__name__", repr(self.handler)),
+            "handled": self.handled,
+            "failed": self.failed,
+            "latency": self.latency.snapshot(),
+        }
+
+
+class KindRouter:
+    """
+    按事件类型分发到已注册的处理器
+
+    以 kind 为键的字典查找，每个事件只分类一次，处理耗时自动记入该 kind
+    的直方图。处理器抛出的异常在这里记录，不会向上影响事件检查点的推进。
+
+    处理器在调用方（分发队列的worker）中直接执行，返回时事件即处理完成，
+    检查点才能据此推进；同时处理的事件数因此由分发队列的worker数量决定。
+    """
+
+    def __init__(self, default: Optional[EventHandler] = None):
+        """
+        Args:
+            default: 未注册的 kind 使用的处理器，为None时忽略这些事件
+        """
+        self._routes: Dict[int, _KindRoute] = {}
+        self._default = _KindRoute(default) if default else None
+
+    def register(self, kind: int, handler: EventHandler) -> None:
+        """
+        注册处理器，同一 kind 重复注册时替换原处理器
+
+        Args:
+            kind: 事件类型
+            handler: 异步处理函数
+        """
+        self._routes[kind] = _KindRoute(handler)
+
+    def unregister(self, kind: int) -> None:
+        self._routes.pop(kind, None)
+
+    def handles(self, kind: int) -> bool:
+        return kind in self._routes
+
+    async def dispatch(self, event: Event) -> bool:
+        """处理事件，没有对应处理器时返回False"""
+        route = self._routes.get(event.kind().as_u16(), self._default)
+        if route is None:
+            return False
+        await self._run(route, event)
+        return True
+
+    def stats(self) -> dict:
+        stats = {str(kind): route.stats() for kind, route in self._routes.items()}
+        if self._default:
+            stats["default"] = self._default.stats()
+        return stats
+
+    def collect_metrics(self, metrics: MetricSet, **labels) -> None:
+        routes = [(str(kind), route) for kind, route in self._routes.items()]
+        if self._default:
+            routes.append(("default", self._default))
+        for kind, route in routes:
+            metrics.counter("events_processed", "处理完成的事件数", route.handled,
+                            kind=kind, **labels)
+            metrics.counter("events_failed", "处理出错的事件数", route.failed,
+                            kind=kind, **labels)
+            metrics.histogram("handler_seconds", "事件处理器耗时", route.latency,
+                              kind=kind, **labels)
+
+    @staticmethod
+    async def _run(route: _KindRoute, event: Event) -> None:
+        started = time.perf_counter()
+        try:
+            await route.handler(event)
+            route.handled += 1
+        except Exception as e:
+            route.failed += 1
+            logger.error(f"处理 kind {event.kind().as_u16()} 事件 "
+                         f"{event.id().to_hex()} 时出错: {str(e)}")
+        finally:
+            route.latency.observe(time.perf_counter() - started)
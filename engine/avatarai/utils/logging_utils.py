@@ -1,4 +1,11 @@
+import copy
+import json
 import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
 
 
 class NewLineFormatter(logging.Formatter):
@@ -6,10 +13,179 @@ class NewLineFormatter(logging.Formatter):
 
     def __init__(self, fmt, datefmt=None, style="%"):
         logging.Formatter.__init__(self, fmt, datefmt, style)
+        # (秒, 格式化后的时间)，同一秒内的日志复用
+        self._time_cache: Tuple[int, str] = (-1, "")
 
     def format(self, record):
         msg = logging.Formatter.format(self, record)
-        if record.message != "":
-            parts = msg.split(record.message)
-            msg = msg.replace("\n", "\r\n" + parts[0])
-        return msg
+        # 单行日志（绝大多数）不需要对齐
+        if "\n" not in msg or record.message == "":
+            return msg
+        message = record.message
+        # 没有异常信息时消息位于末尾，endswith 只需一次比较；否则退回查找
+        if msg.endswith(message):
+            prefix = msg[:len(msg) - len(message)]
+        else:
+            prefix = msg[:msg.find(message)]
+        return msg.replace("\n", "\r\n" + prefix)
+
+    def formatTime(self, record, datefmt=None):
+        second = int(record.created)
+        cached_second, text = self._time_cache
+        if second != cached_second:
+            text = time.strftime(datefmt or self.default_time_format,
+                                 self.converter(record.created))
+            self._time_cache = (second, text)
+        if datefmt:
+            return text
+        return self.default_msec_format % (text, record.msecs)
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行JSON，便于日志系统直接解析"""
+
+    def format(self, record):
+        payload = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "location": f"{record.filename}:{record.lineno}",
+            "message": record.getMessage(),
+        }
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            payload["suppressed"] = suppressed
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # 经由队列的记录已在调用方线程中格式化了异常
+            payload["exception"] = record.exc_text
+        if record.stack_info:
+            payload["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def parse_rate_limits(spec: str) -> Dict[str, float]:
+    """解析 "avatarai.nostr=50,avatarai.agent=5" 形式的限速配置（条/秒）"""
+    rates = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, rate = item.partition("=")
+        if not rate:
+            raise ValueError(f"无效的日志限速配置: {item}")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    按记录器限速的过滤器
+
+    每个记录器（按名称前缀匹配最长的配置）一个令牌桶，超出速率的
+    WARNING 以下日志被丢弃，被丢弃的条数记在下一条放行日志的
+    ``suppressed`` 属性上。WARNING 及以上的日志总是放行。
+    """
+
+    def __init__(self, spec: str = "", rates: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            spec: 限速配置字符串，见 parse_rate_limits
+            rates: 记录器名称前缀 -> 每秒允许的日志条数，与 spec 合并
+        """
+        super().__init__()
+        self.rates = {**parse_rate_limits(spec), **(rates or {})}
+        # 记录器名称 -> [令牌, 上次补充时间, 被丢弃的条数]
+        self._buckets: Dict[str, list] = {}
+        self._resolved: Dict[str, Optional[float]] = {}
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate_for(record.name)
+        if rate is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(record.name)
+            if bucket is None:
+                bucket = [rate, now, 0]
+                self._buckets[record.name] = bucket
+            # 桶容量为一秒的配额
+            bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                self.dropped += 1
+                return False
+            bucket[0] -= 1
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+    def _rate_for(self, name: str) -> Optional[float]:
+        if name not in self._resolved:
+            matches = [prefix for prefix in self.rates
+                       if name == prefix or name.startswith(prefix + ".")]
+            self._resolved[name] = (self.rates[max(matches, key=len)]
+                                    if matches else None)
+        return self._resolved[name]
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    只把日志记录放入有界队列的处理器
+
+    调用方线程只合并消息参数，时间、前缀等格式化和写出在后台监听线程中进行；
+    队列满时丢弃记录而不是阻塞调用方（例如事件循环），丢弃的条数记在 ``dropped`` 上。
+    """
+
+    _exception_formatter = logging.Formatter()
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 参数可能是之后会被修改的可变对象，必须在调用方线程中合并进消息；
+        # 异常的 traceback 引用调用方的栈帧，同样在这里转成文本
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DrainingQueueListener(QueueListener):
+    """
+    退出时写完队列中剩余日志的监听器
+
+    标准库在 stop 时用 put_nowait 放入结束标记，队列满时会抛出 queue.Full；
+    这里等待监听线程腾出空位，超时后放弃剩余日志，不阻塞进程退出。
+    """
+
+    stop_timeout = 5.0
+
+    def stop(self):
+        if self._thread is None:
+            return
+        try:
+            self.queue.put(self._sentinel, timeout=self.stop_timeout)
+        except queue.Full:
+            self._thread = None
+            return
+        self._thread.join()
+        self._thread = None
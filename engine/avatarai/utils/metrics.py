@@ -0,0 +1,167 @@
+import inspect
+import math
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from avatarai.logger import init_logger
+from avatarai.utils.stats import Histogram
+
+logger = init_logger("avatarai.utils.metrics")
+
+METRIC_PREFIX = "avatarai"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# 直方图每个序列有十几个桶，按Avatar拆分时序列数随Avatar数量线性增长，
+# 直方图上去掉这些标签，跨Avatar合并为一个序列；计数器和仪表保留
+HISTOGRAM_AGGREGATED_LABELS = frozenset({"avatar"})
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class _Family:
+    def __init__(self, name: str, kind: str, help_text: str):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        # (样本名后缀, 标签, 值)
+        self.samples: List[Tuple[str, Labels, float]] = []
+        # 直方图按标签合并：标签 -> [上界 -> 累积计数, 总和, 次数]
+        self.histograms: Dict[Labels, list] = {}
+
+    def all_samples(self) -> List[Tuple[str, Labels, float]]:
+        samples = list(self.samples)
+        for labels, (counts, total, count) in self.histograms.items():
+            for bound, bucket_count in counts.items():
+                samples.append(("_bucket", labels + (("le", _format_value(bound)),),
+                                bucket_count))
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, count))
+        return samples
+
+
+class MetricSet:
+    """
+    一次采集得到的指标
+
+    各组件把当前状态写入 MetricSet，同名指标合并为一个指标族。
+    采集在事件循环中进行，只复制数值；render 只读取已复制的数值，
+    可以放到线程中执行。直方图去掉 HISTOGRAM_AGGREGATED_LABELS 中的标签后，
+    相同标签的直方图合并为一个序列。
+    """
+
+    def __init__(self, prefix: str = METRIC_PREFIX):
+        self.prefix = prefix
+        self._families: Dict[str, _Family] = {}
+
+    def counter(self, name: str, help_text: str, value: float, **labels) -> None:
+        self._family(name, "counter", help_text).samples.append(
+            ("_total", self._labels(labels), value))
+
+    def gauge(self, name: str, help_text: str, value: float, **labels) -> None:
+        self._family(name, "gauge", help_text).samples.append(
+            ("", self._labels(labels), value))
+
+    def histogram(self, name: str, help_text: str, histogram: Histogram,
+                  **labels) -> None:
+        family = self._family(name, "histogram", help_text)
+        base = self._labels({key: value for key, value in labels.items()
+                             if key not in HISTOGRAM_AGGREGATED_LABELS})
+        merged = family.histograms.get(base)
+        if merged is None:
+            merged = family.histograms[base] = [{}, 0.0, 0]
+        counts = merged[0]
+        for bound, count in histogram.cumulative_counts().items():
+            counts[bound] = counts.get(bound, 0) + count
+        merged[1] += histogram.sum
+        merged[2] += histogram.count
+
+    def render(self) -> str:
+        """Prometheus 文本格式（0.0.4）"""
+        lines = []
+        for family in self._families.values():
+            name = f"{self.prefix}_{family.name}"
+            lines.append(f"# HELP {name} {family.help}")
+            lines.append(f"# TYPE {name} {family.kind}")
+            for suffix, labels, value in family.all_samples():
+                lines.append(
+                    f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _family(self, name: str, kind: str, help_text: str) -> _Family:
+        family = self._families.get(name)
+        if family is None:
+            family = _Family(name, kind, help_text)
+            self._families[name] = family
+        elif family.kind != kind:
+            raise ValueError(f"指标 {name} 的类型冲突: {family.kind} / {kind}")
+        return family
+
+    @staticmethod
+    def _labels(labels: dict) -> Labels:
+        return tuple((key, str(value)) for key, value in labels.items())
+
+
+Collector = Callable[[MetricSet], Union[None, Awaitable[None]]]
+
+
+class MetricsRegistry:
+    """
+    指标采集器注册表，/metrics 请求时依次调用各采集器
+
+    采集器可以是协程函数，采集大量对象时分块进行并在块之间让出事件循环。
+    """
+
+    def __init__(self):
+        self._collectors: List[Collector] = []
+        self._lock = threading.Lock()
+
+    def register(self, collector: Collector) -> None:
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def unregister(self, collector: Collector) -> None:
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    async def collect(self) -> MetricSet:
+        metrics = MetricSet()
+        with self._lock:
+            collectors = list(self._collectors)
+        for collector in collectors:
+            try:
+                result = collector(metrics)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"采集指标时出错: {str(e)}")
+        return metrics
+
+
+_metrics_registry: Optional[MetricsRegistry] = None
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """获取进程级共享的指标注册表"""
+    global _metrics_registry
+    if _metrics_registry is None:
+        _metrics_registry = MetricsRegistry()
+    return _metrics_registry
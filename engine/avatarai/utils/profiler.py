@@ -0,0 +1,180 @@
+import asyncio
+import contextlib
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from types import CodeType, FrameType
+from typing import Dict, List, Optional
+
+from avatarai.logger import init_logger
+
+logger = init_logger("avatarai.utils.profiler")
+
+TRUNCATED_STACK = "[truncated]"
+
+
+class SamplingProfiler:
+    """
+    周期性的调用栈采样器
+
+    后台线程按固定间隔读取所有线程当前的调用栈（sys._current_frames），
+    在内存中按火焰图工具可直接使用的 collapsed 格式聚合：
+    ``线程;[task];外层函数;...;内层函数 次数``。事件循环线程上的样本
+    额外标注当时正在运行的 asyncio 任务名。
+
+    被采样的线程不需要任何配合，开销只在采样线程：单次采样耗时超过
+    max_overhead 占比时自动拉长采样间隔。
+    """
+
+    def __init__(self, interval: float = 0.01, max_depth: int = 64,
+                 max_stacks: int = 20000, max_overhead: float = 0.02):
+        """
+        Args:
+            interval: 采样间隔（秒）
+            max_depth: 每个调用栈保留的最大深度（保留最内层）
+            max_stacks: 不同调用栈的数量上限，超出后计入 [truncated]
+            max_overhead: 采样耗时占总时间的上限比例
+        """
+        self.interval = interval
+        self.max_depth = max_depth
+        self.max_stacks = max_stacks
+        self.max_overhead = max_overhead
+        self._stacks: Counter = Counter()
+        self._labels: Dict[CodeType, str] = {}
+        # 事件循环所在线程 -> 事件循环
+        self._loops: Dict[int, asyncio.AbstractEventLoop] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        self.samples = 0
+        self.sampling_time = 0.0
+        self.started_at: Optional[float] = None
+        self.elapsed = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def watch_loop(self, loop: asyncio.AbstractEventLoop,
+                   thread_id: Optional[int] = None) -> None:
+        """登记事件循环，该线程上的样本会标注当前运行的任务；默认为调用方线程"""
+        self._loops[thread_id or threading.get_ident()] = loop
+
+    def start(self, interval: Optional[float] = None) -> None:
+        if self.running:
+            return
+        if interval:
+            self.interval = interval
+        with contextlib.suppress(RuntimeError):
+            self.watch_loop(asyncio.get_running_loop())
+        self._stop.clear()
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="avatarai-profiler",
+                                        daemon=True)
+        self._thread.start()
+        logger.info(f"采样分析已启动，间隔 {self.interval * 1000:.1f}ms")
+
+    def stop(self) -> None:
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.elapsed += time.monotonic() - self.started_at
+        self.started_at = None
+        logger.info(f"采样分析已停止，共 {self.samples} 个样本")
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+            self.sampling_time = 0.0
+            self.elapsed = 0.0
+            if self.started_at is not None:
+                self.started_at = time.monotonic()
+
+    def collapsed(self) -> str:
+        """collapsed 格式的聚合结果，可直接交给 flamegraph.pl / speedscope"""
+        with self._lock:
+            stacks = list(self._stacks.items())
+        stacks.sort(key=lambda item: item[1], reverse=True)
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def stats(self) -> dict:
+        elapsed = self.elapsed
+        if self.started_at is not None:
+            elapsed += time.monotonic() - self.started_at
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "samples": self.samples,
+            "stacks": len(self._stacks),
+            "elapsed": elapsed,
+            "overhead": self.sampling_time / elapsed if elapsed else 0.0,
+        }
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        wait = self.interval
+        while not self._stop.wait(wait):
+            started = time.perf_counter()
+            self._sample(own_id)
+            cost = time.perf_counter() - started
+            self.sampling_time += cost
+            # 单次采样的耗时按 max_overhead 摊开，栈很多时自动降低采样频率
+            wait = max(self.interval, cost / self.max_overhead - cost)
+
+    def _sample(self, own_id: int) -> None:
+        frames = sys._current_frames()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        collected: List[str] = []
+        for thread_id, frame in frames.items():
+            if thread_id == own_id:
+                continue
+            stack = self._walk(frame)
+            root = names.get(thread_id, f"thread-{thread_id}")
+            loop = self._loops.get(thread_id)
+            if loop is not None:
+                task = asyncio.current_task(loop)
+                root += f";[task {task.get_name()}]" if task else ";[event loop]"
+            collected.append(";".join([root] + stack))
+        del frames
+
+        with self._lock:
+            for stack in collected:
+                if stack not in self._stacks and len(self._stacks) >= self.max_stacks:
+                    stack = TRUNCATED_STACK
+                self._stacks[stack] += 1
+            self.samples += 1
+
+    def _walk(self, frame: Optional[FrameType]) -> List[str]:
+        labels = []
+        while frame is not None and len(labels) < self.max_depth:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        labels.reverse()
+        return labels
+
+    def _label(self, code: CodeType) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            # collapsed 格式用 ; 分隔栈帧、用最后一个空格分隔次数
+            filename = os.path.basename(code.co_filename)
+            label = f"{code.co_name} ({filename}:{code.co_firstlineno})"
+            label = label.replace(";", ":")
+            self._labels[code] = label
+        return label
+
+
+_profiler: Optional[SamplingProfiler] = None
+
+
+def get_profiler() -> SamplingProfiler:
+    """获取进程级共享的采样分析器"""
+    global _profiler
+    if _profiler is None:
+        _profiler = SamplingProfiler()
+    return _profiler
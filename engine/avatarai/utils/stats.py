@@ -0,0 +1,65 @@
+import bisect
+import threading
+from typing import Dict, Sequence
+
+# 秒，覆盖从亚毫秒到十秒级的延迟
+DEFAULT_LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class Histogram:
+    """固定桶的累积直方图，内存占用与观测次数无关"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # 最后一个桶对应 +Inf
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """按桶上界估算分位数"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self.count
+        if total == 0:
+            return 0.0
+        target = q * total
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= target:
+                if index < len(self.buckets):
+                    return self.buckets[index]
+                return float("inf")
+        return float("inf")
+
+    def cumulative_counts(self) -> Dict[float, int]:
+        """上界 -> 累积计数，最后一项的上界为 +Inf"""
+        with self._lock:
+            counts = list(self._counts)
+        result = {}
+        total = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            total += bucket_count
+            result[bound] = total
+        return result
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "avg": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+        }
@@ -0,0 +1,269 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Coroutine, Deque, Dict, List, Optional
+
+from avatarai.logger import init_logger
+from avatarai.utils.metrics import MetricSet
+from avatarai.utils.stats import Histogram
+
+logger = init_logger("avatarai.utils.tasks")
+
+
+@dataclass
+class _TaskInfo:
+    group: str
+    started_at: float
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    # co_qualname 在 Python 3.11 才加入
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _await_chain(coro, limit: int = 16) -> List[str]:
+    """沿 await 链得到任务当前挂起的位置，从外到内"""
+    chain = []
+    while coro is not None and len(chain) < limit:
+        frame = (getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+                 or getattr(coro, "ag_frame", None))
+        if frame is None:
+            break
+        chain.append(_frame_label(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return chain
+
+
+class TaskSupervisor:
+    """
+    命名并跟踪引擎创建的后台任务
+
+    所有任务经 spawn 创建，持有强引用直到结束（避免任务被垃圾回收），
+    按分组统计运行中、失败和取消的数量；任务以异常结束时记录日志，
+    不会出现 "Task exception was never retrieved"。
+    """
+
+    def __init__(self):
+        self._tasks: Dict[asyncio.Task, _TaskInfo] = {}
+        self.spawned: Counter = Counter()
+        self.failed: Counter = Counter()
+        self.cancelled: Counter = Counter()
+
+    def spawn(self, coro: Coroutine, name: str,
+              group: Optional[str] = None) -> asyncio.Task:
+        """
+        在当前事件循环中创建并跟踪任务
+
+        Args:
+            coro: 协程
+            name: 任务名，出现在 /tasks 和采样分析的结果中
+            group: 统计分组，默认与任务名相同
+        """
+        group = group or name
+        task = asyncio.get_running_loop().create_task(coro, name=name)
+        self._tasks[task] = _TaskInfo(group, time.monotonic())
+        self.spawned[group] += 1
+        task.add_done_callback(self._on_done)
+        return task
+
+    def tasks(self) -> List[asyncio.Task]:
+        return list(self._tasks)
+
+    def snapshot(self) -> List[dict]:
+        """运行中的任务：名称、分组、运行时长和当前挂起的位置"""
+        now = time.monotonic()
+        return [
+            {
+                "name": task.get_name(),
+                "group": info.group,
+                "age": now - info.started_at,
+                "awaiting": _await_chain(task.get_coro()),
+            }
+            for task, info in list(self._tasks.items())
+        ]
+
+    def stats(self) -> dict:
+        running = Counter(info.group for info in list(self._tasks.values()))
+        groups = set(self.spawned) | set(running)
+        return {
+            group: {
+                "running": running[group],
+                "spawned": self.spawned[group],
+                "failed": self.failed[group],
+                "cancelled": self.cancelled[group],
+            }
+            for group in sorted(groups)
+        }
+
+    def collect_metrics(self, metrics: MetricSet) -> None:
+        for group, stats in self.stats().items():
+            metrics.gauge("tasks_running", "运行中的后台任务数", stats["running"],
+                          group=group)
+            metrics.counter("tasks_spawned", "创建的后台任务数", stats["spawned"],
+                            group=group)
+            metrics.counter("tasks_failed", "以异常结束的后台任务数",
+                            stats["failed"], group=group)
+            metrics.counter("tasks_cancelled", "被取消的后台任务数",
+                            stats["cancelled"], group=group)
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        info = self._tasks.pop(task, None)
+        if info is None:
+            return
+        if task.cancelled():
+            self.cancelled[info.group] += 1
+            return
+        error = task.exception()
+        if error is not None:
+            self.failed[info.group] += 1
+            logger.error(f"后台任务 {task.get_name()} 异常结束: {error!r}")
+
+
+@dataclass
+class SlowCallback:
+    """一次事件循环阻塞"""
+    duration: float
+    task: Optional[str]
+    stack: List[str]
+    at: float
+
+    def as_dict(self) -> dict:
+        return {"duration": self.duration, "task": self.task,
+                "stack": self.stack, "at": self.at}
+
+
+class LoopMonitor:
+    """
+    事件循环延迟和阻塞检测
+
+    事件循环中的心跳任务每 interval 秒醒来一次，计划唤醒与实际唤醒的
+    差值记入 lag 直方图。看门狗线程发现心跳超过 slow_callback_threshold
+    未更新时，读取事件循环线程当时的调用栈和正在运行的任务，
+    即阻塞事件循环的代码位置；阻塞结束后记录持续时间。
+    """
+
+    def __init__(self, interval: float = 0.05, slow_callback_threshold: float = 0.1,
+                 max_slow_callbacks: int = 100):
+        """
+        Args:
+            interval: 心跳间隔（秒）
+            slow_callback_threshold: 单次占用事件循环超过该时长（秒）视为阻塞
+            max_slow_callbacks: 保留的最近阻塞记录数
+        """
+        self.interval = interval
+        self.slow_callback_threshold = slow_callback_threshold
+        self.lag = Histogram()
+        self.slow_callbacks = 0
+        self.recent: Deque[SlowCallback] = deque(maxlen=max_slow_callbacks)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._beat = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._heartbeat_task is not None and not self._heartbeat_task.done()
+
+    def start(self) -> None:
+        """在要监控的事件循环中调用"""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._heartbeat_task = get_task_supervisor().spawn(self._heartbeat(),
+                                                           "loop-monitor")
+        self._watchdog = threading.Thread(target=self._watch,
+                                          name="avatarai-loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            await asyncio.gather(self._heartbeat_task, return_exceptions=True)
+            self._heartbeat_task = None
+        if self._watchdog:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "lag": self.lag.snapshot(),
+            "slow_callbacks": self.slow_callbacks,
+            "slow_callback_threshold": self.slow_callback_threshold,
+            "recent_slow_callbacks": [item.as_dict() for item in list(self.recent)],
+        }
+
+    def collect_metrics(self, metrics: MetricSet) -> None:
+        metrics.histogram("event_loop_lag_seconds", "事件循环计划唤醒与实际唤醒的差值",
+                          self.lag)
+        metrics.counter("event_loop_slow_callbacks", "占用事件循环超过阈值的次数",
+                        self.slow_callbacks)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat = now
+            self.lag.observe(max(0.0, now - expected))
+
+    def _watch(self) -> None:
+        stalled: Optional[SlowCallback] = None
+        check_interval = min(self.interval, self.slow_callback_threshold) / 2
+        while not self._stop.wait(check_interval):
+            now = time.monotonic()
+            # 心跳本身每 interval 才更新一次，超出的部分才是阻塞
+            blocked = now - self._beat - self.interval
+            if blocked >= self.slow_callback_threshold:
+                if stalled is None:
+                    stalled = self._capture()
+                stalled.duration = blocked
+            elif stalled is not None:
+                self.slow_callbacks += 1
+                self.recent.append(stalled)
+                location = stalled.stack[-1] if stalled.stack else "?"
+                logger.warning(f"事件循环被阻塞 {stalled.duration * 1000:.0f}ms，"
+                               f"任务 {stalled.task}，位置 {location}")
+                stalled = None
+
+    def _capture(self) -> SlowCallback:
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = []
+        while frame is not None and len(stack) < 32:
+            stack.append(_frame_label(frame))
+            frame = frame.f_back
+        stack.reverse()
+        task = asyncio.current_task(self._loop)
+        return SlowCallback(0.0, task.get_name() if task else None, stack, time.time())
+
+
+_task_supervisor: Optional[TaskSupervisor] = None
+_loop_monitor: Optional[LoopMonitor] = None
+
+
+def get_task_supervisor() -> TaskSupervisor:
+    """获取进程级共享的任务管理器"""
+    global _task_supervisor
+    if _task_supervisor is None:
+        _task_supervisor = TaskSupervisor()
+    return _task_supervisor
+
+
+def get_loop_monitor() -> LoopMonitor:
+    """获取进程级共享的事件循环监控"""
+    global _loop_monitor
+    if _loop_monitor is None:
+        _loop_monitor = LoopMonitor()
+    return _loop_monitor
@@ -0,0 +1,74 @@
+"""
+LLM 流式调用基准测试
+
+默认在进程内启动 fake_openai_server，并发发起流式请求，
+输出首token延迟和 tokens/s 的分布。也可以用 --api-url 指向真实服务。
+加 --gateway 时请求经由 LLMGateway，模拟多个Avatar发起部分相同的请求。
+
+    PYTHONPATH=. python benchmarks/benchmark_llm.py --concurrency 64 --num-requests 512
+    PYTHONPATH=. python benchmarks/benchmark_llm.py \
+        --gateway --num-avatars 8 --num-prompts 32
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_openai_server  # noqa: E402
+
+from avatarai.models.gateway import LLMGateway  # noqa: E402
+from avatarai.models.llm import LLM  # noqa: E402
+
+
+async def main(args: argparse.Namespace) -> None:
+    server_task = None
+    api_url = args.api_url
+    if not api_url:
+        server_task = asyncio.create_task(fake_openai_server.serve(args))
+        await asyncio.sleep(0.2)
+        api_url = f"http://{args.host}:{args.port}/v1"
+
+    llm = LLM(model=args.model,
+              credentials={"api_url": api_url, "api_key": args.api_key})
+    gateway = LLMGateway(max_concurrency_per_provider=args.provider_concurrency)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one_call(index: int) -> None:
+        prompt = f"benchmark request {index % args.num_prompts}"
+        async with semaphore:
+            if args.gateway:
+                await gateway.invoke(f"avatar-{index % args.num_avatars}", llm, prompt)
+            else:
+                await llm.invoke(prompt)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_call(i) for i in range(args.num_requests)))
+    elapsed = time.perf_counter() - started
+
+    print(f"{args.num_requests} requests in {elapsed:.2f}s "
+          f"({args.num_requests / elapsed:.1f} req/s)")
+    print(f"stats: {llm.stats()}")
+    if args.gateway:
+        print(f"gateway: {gateway.stats()}")
+
+    if server_task:
+        server_task.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LLM 流式调用基准测试")
+    parser = fake_openai_server.add_cli_args(parser)
+    parser.add_argument("--api-url", type=str, default=None)
+    parser.add_argument("--api-key", type=str, default="fake")
+    parser.add_argument("--model", type=str, default="fake-model")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--num-requests", type=int, default=256)
+    parser.add_argument("--gateway", action="store_true", help="经由 LLMGateway 调用")
+    parser.add_argument("--num-avatars", type=int, default=8)
+    parser.add_argument("--num-prompts", type=int, default=256,
+                        help="不同请求内容的数量，越少可合并的请求越多")
+    parser.add_argument("--provider-concurrency", type=int, default=16)
+    asyncio.run(main(parser.parse_args()))
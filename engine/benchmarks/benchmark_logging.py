@@ -0,0 +1,88 @@
+"""
+日志格式化基准测试
+
+对比 NewLineFormatter 改写前后的单条日志格式化耗时：短的单行日志、
+多行日志，以及大段的事件内容（例如完整的 Event JSON）。同时校验两者输出一致。
+
+    PYTHONPATH=. python benchmarks/benchmark_logging.py --num-records 20000
+"""
+import argparse
+import json
+import logging
+import time
+
+from avatarai.logger import _DATE_FORMAT, _FORMAT
+from avatarai.utils.logging_utils import NewLineFormatter
+
+
+class LegacyNewLineFormatter(logging.Formatter):
+    """改写前的实现：每条日志都按消息内容切分来得到前缀"""
+
+    def format(self, record):
+        msg = logging.Formatter.format(self, record)
+        if record.message != "":
+            parts = msg.split(record.message)
+            msg = msg.replace("\n", "\r\n" + parts[0])
+        return msg
+
+
+def make_messages(event_size: int) -> dict:
+    event = {
+        "id": "f" * 64,
+        "pubkey": "a" * 64,
+        "kind": 1,
+        "tags": [["p", "b" * 64]] * 8,
+        "content": "x" * event_size,
+        "sig": "c" * 128,
+    }
+    return {
+        "single-line": "SimpleAgent 收到Nostr事件: " + "f" * 64,
+        "multi-line": "处理事件时出错:\nline 1\nline 2\nline 3",
+        "event-dump": "SimpleAgent 收到Nostr事件:\n" + json.dumps(event, indent=2),
+    }
+
+
+def make_records(message: str, num_records: int, spread: float) -> list:
+    """日志时间均匀分布在 spread 秒内"""
+    now = time.time()
+    records = []
+    for i in range(num_records):
+        record = logging.LogRecord("avatarai.agent.simple", logging.INFO, __file__, 42,
+                                   message, None, None)
+        record.created = now + spread * i / num_records
+        record.msecs = (record.created - int(record.created)) * 1000
+        records.append(record)
+    return records
+
+
+def bench(formatter: logging.Formatter, records: list) -> float:
+    started = time.perf_counter()
+    for record in records:
+        formatter.format(record)
+    return (time.perf_counter() - started) / len(records)
+
+
+def main(args: argparse.Namespace) -> None:
+    legacy = LegacyNewLineFormatter(_FORMAT, _DATE_FORMAT)
+    current = NewLineFormatter(_FORMAT, _DATE_FORMAT)
+
+    print(f"{'scenario':<14}{'legacy (us)':>14}{'new (us)':>12}{'speedup':>10}")
+    for name, message in make_messages(args.event_size).items():
+        records = make_records(message, args.num_records, args.spread)
+        for record in records[:10]:
+            assert legacy.format(record) == current.format(record), name
+        legacy_cost = min(bench(legacy, records) for _ in range(args.repeat))
+        current_cost = min(bench(current, records) for _ in range(args.repeat))
+        print(f"{name:<14}{legacy_cost * 1e6:>14.2f}{current_cost * 1e6:>12.2f}"
+              f"{legacy_cost / current_cost:>9.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark log formatting")
+    parser.add_argument("--num-records", type=int, default=20000)
+    parser.add_argument("--event-size", type=int, default=20000,
+                        help="event-dump 场景中事件 content 的长度")
+    parser.add_argument("--spread", type=float, default=10.0,
+                        help="日志时间分布的秒数，影响时间戳缓存的命中率")
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
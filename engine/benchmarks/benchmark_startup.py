@@ -0,0 +1,162 @@
+"""
+冷启动基准测试
+
+在全新的解释器中导入入口模块，记录墙钟时间，并解析 ``python -X importtime``
+的输出，列出累计耗时和自身耗时最多的模块。给定 --avatar-path 时还会启动
+服务，测量从进程启动到 /health、/ready 返回200的时间。
+
+    PYTHONPATH=. python benchmarks/benchmark_startup.py --repeat 5
+    PYTHONPATH=. python benchmarks/benchmark_startup.py --avatar-path avatars/ \
+        --output startup.json
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_MODULES = [
+    "avatarai.engine.engine_args",
+    "avatarai.entrypoints.serve",
+    "avatarai.engine.async_avatar_engine",
+]
+
+
+def parse_importtime(output: str) -> List[Tuple[str, int, int, int]]:
+    """解析 -X importtime 的输出，返回 (模块, 嵌套深度, 自身us, 累计us)"""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            self_us, cumulative_us = int(self_us), int(cumulative_us)
+        except ValueError:
+            # 表头
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), depth, self_us, cumulative_us))
+    return rows
+
+
+def time_import(module: str, importtime: bool = False) -> Tuple[float, str]:
+    """在子进程中导入模块，返回 (墙钟秒数, stderr)"""
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", f"import {module}" if module else "pass"]
+    started = time.perf_counter()
+    result = subprocess.run(command, capture_output=True, text=True,
+                            env=os.environ.copy())
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{result.stderr}")
+    return elapsed, result.stderr
+
+
+def report_module(module: str, repeat: int, top: int, baseline: float) -> Dict:
+    walls = [time_import(module)[0] for _ in range(repeat)]
+    _, stderr = time_import(module, importtime=True)
+    rows = parse_importtime(stderr)
+    total_us = sum(cumulative for _, depth, _, cumulative in rows if depth == 0)
+
+    print(f"\n== {module}")
+    print(f"wall: min {min(walls) * 1000:.1f}ms, "
+          f"median {statistics.median(walls) * 1000:.1f}ms "
+          f"(interpreter {baseline * 1000:.1f}ms), {len(rows)} modules, "
+          f"importtime total {total_us / 1000:.1f}ms")
+    by_cumulative = sorted(rows, key=lambda row: row[3], reverse=True)[:top]
+    by_self = sorted(rows, key=lambda row: row[2], reverse=True)[:top]
+    print(f"{'cumulative (ms)':>16}  module")
+    for name, _, _, cumulative in by_cumulative:
+        print(f"{cumulative / 1000:>16.1f}  {name}")
+    print(f"{'self (ms)':>16}  module")
+    for name, _, self_us, _ in by_self:
+        print(f"{self_us / 1000:>16.1f}  {name}")
+
+    return {
+        "wall_min": min(walls),
+        "wall_median": statistics.median(walls),
+        "importtime_total": total_us / 1e6,
+        "modules": len(rows),
+        "top_cumulative": {name: cumulative / 1e6
+                           for name, _, _, cumulative in by_cumulative},
+        "top_self": {name: self_us / 1e6 for name, _, self_us, _ in by_self},
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(url: str, started: float, deadline: float,
+              process: subprocess.Popen) -> Optional[float]:
+    """轮询直到返回200，返回距进程启动的秒数；超时或进程退出时返回None"""
+    while time.perf_counter() < deadline and process.poll() is None:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter() - started
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.01)
+    return None
+
+
+def report_server(avatar_path: str, timeout: float) -> Dict:
+    port = _free_port()
+    command = [sys.executable, "-m", "avatarai.entrypoints.serve",
+               "--host", "127.0.0.1", "--port", str(port),
+               "--avatar-path", avatar_path, "--log-level", "warning"]
+    started = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    try:
+        deadline = started + timeout
+        base_url = f"http://127.0.0.1:{port}"
+        health = _wait_for(f"{base_url}/health", started, deadline, process)
+        ready = _wait_for(f"{base_url}/ready", started, deadline, process)
+    finally:
+        process.terminate()
+        process.wait()
+
+    def fmt(value: Optional[float]) -> str:
+        return f"{value * 1000:.0f}ms" if value is not None else "timeout"
+
+    print(f"\n== serve --avatar-path {avatar_path}")
+    print(f"/health: {fmt(health)}, /ready: {fmt(ready)}")
+    return {"health": health, "ready": ready}
+
+
+def main(args: argparse.Namespace) -> None:
+    baseline = min(time_import("")[0] for _ in range(args.repeat))
+    results = {"python": sys.version.split()[0], "interpreter": baseline, "modules": {}}
+    for module in args.modules:
+        results["modules"][module] = report_module(module, args.repeat, args.top,
+                                                   baseline)
+    if args.avatar_path:
+        results["server"] = report_server(args.avatar_path, args.timeout)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark cold start")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="列出耗时最多的模块数")
+    parser.add_argument("--avatar-path", type=str, default=None,
+                        help="启动服务并测量 /health、/ready 的可用时间")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", type=str, default=None,
+                        help="把结果写入JSON文件，便于跟踪变化")
+    main(parser.parse_args())
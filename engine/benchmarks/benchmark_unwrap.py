@@ -0,0 +1,94 @@
+"""
+GiftWrap 解包基准测试
+
+用合成的 GiftWrap 私信对比事件循环内逐个解包（UnwrappedGift.from_gift_wrap）
+与 GiftWrapUnwrapper 在加解密线程中解包的吞吐量，并统计事件循环的最大阻塞时间。
+重复投递的比例模拟多个中继推送同一事件。
+
+    PYTHONPATH=. python benchmarks/benchmark_unwrap.py \
+        --num-events 5000 --duplicate-ratio 0.3
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from nostr_sdk import EventBuilder, Keys, NostrSigner, UnwrappedGift, gift_wrap
+
+from avatarai.nostr.giftwrap import CryptoWorkers, GiftWrapUnwrapper
+
+
+async def make_gift_wraps(receiver: Keys, num_events: int, num_senders: int,
+                          duplicate_ratio: float, message_size: int) -> list:
+    senders = [NostrSigner.keys(Keys.generate()) for _ in range(num_senders)]
+    unique = []
+    for i in range(int(num_events * (1 - duplicate_ratio)) or 1):
+        signer = senders[i % num_senders]
+        content = f"message {i} " + "x" * message_size
+        rumor = EventBuilder.private_msg_rumor(receiver.public_key(), content).build(
+            await signer.get_public_key())
+        unique.append(await gift_wrap(signer, receiver.public_key(), rumor, []))
+    duplicates = [random.choice(unique) for _ in range(num_events - len(unique))]
+    events = unique + duplicates
+    random.shuffle(events)
+    return events
+
+
+async def _measure_loop_lag(stop: asyncio.Event, interval: float = 0.001) -> float:
+    max_lag = 0.0
+    while not stop.is_set():
+        expected = time.monotonic() + interval
+        await asyncio.sleep(interval)
+        max_lag = max(max_lag, time.monotonic() - expected)
+    return max_lag
+
+
+async def run_consumers(events: list, concurrency: int, unwrap) -> tuple:
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(_measure_loop_lag(stop))
+    pending = iter(events)
+
+    async def consumer() -> None:
+        # 模拟分发队列的worker：逐个取事件并等待解包结果
+        for event in pending:
+            await unwrap(event)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(consumer() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    return elapsed, await lag_task
+
+
+async def main(args: argparse.Namespace) -> None:
+    receiver = Keys.generate()
+    events = await make_gift_wraps(receiver, args.num_events, args.num_senders,
+                                   args.duplicate_ratio, args.message_size)
+    signer = NostrSigner.keys(receiver)
+
+    elapsed, max_lag = await run_consumers(
+        events, args.concurrency,
+        lambda event: UnwrappedGift.from_gift_wrap(signer, event))
+    print(f"inline:    {len(events) / elapsed:10.0f} events/s, "
+          f"max loop lag {max_lag * 1000:.2f} ms")
+
+    workers = CryptoWorkers(args.workers)
+    unwrapper = GiftWrapUnwrapper(signer, workers=workers)
+    elapsed, max_lag = await run_consumers(events, args.concurrency, unwrapper.unwrap)
+    print(f"unwrapper: {len(events) / elapsed:10.0f} events/s, "
+          f"max loop lag {max_lag * 1000:.2f} ms")
+    print(f"stats: {unwrapper.stats()}")
+    workers.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="GiftWrap 解包基准测试")
+    parser.add_argument("--num-events", type=int, default=2000)
+    parser.add_argument("--num-senders", type=int, default=20)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.2)
+    parser.add_argument("--message-size", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="加解密线程数，默认取 CPU 核数（最多4个）")
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="并发等待解包的worker数量")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,111 @@
+"""
+事件验签基准测试
+
+用合成的已签名事件对比事件循环内同步验签与 EventVerifier 的吞吐量，
+并统计验签期间事件循环的最大阻塞时间。同步验签的基线按 --concurrency
+一批处理同时到达的事件，批内不让出事件循环。
+
+    PYTHONPATH=. python benchmarks/benchmark_verify.py \
+        --num-events 20000 --duplicate-ratio 0.3
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from nostr_sdk import EventBuilder, Keys
+
+from avatarai.nostr.verify import EventVerifier
+
+
+def make_events(num_events: int, num_authors: int, duplicate_ratio: float) -> list:
+    keys = [Keys.generate() for _ in range(num_authors)]
+    unique = [
+        EventBuilder.text_note(f"synthetic note {i}")
+        .sign_with_keys(keys[i % num_authors])
+        for i in range(int(num_events * (1 - duplicate_ratio)) or 1)
+    ]
+    duplicates = [random.choice(unique) for _ in range(num_events - len(unique))]
+    events = unique + duplicates
+    random.shuffle(events)
+    return events
+
+
+async def _measure_loop_lag(stop: asyncio.Event, interval: float = 0.001) -> float:
+    max_lag = 0.0
+    while not stop.is_set():
+        expected = time.monotonic() + interval
+        await asyncio.sleep(interval)
+        max_lag = max(max_lag, time.monotonic() - expected)
+    return max_lag
+
+
+async def run_inline(events: list, burst: int) -> tuple:
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(_measure_loop_lag(stop))
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    for start in range(0, len(events), burst):
+        # 同时到达的一批事件在回调中同步验签，期间不让出事件循环
+        for event in events[start:start + burst]:
+            event.verify()
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    return elapsed, await lag_task
+
+
+async def run_verifier(events: list, args: argparse.Namespace) -> tuple:
+    verifier = EventVerifier(max_workers=args.workers, batch_size=args.batch_size,
+                             batch_delay=args.batch_delay,
+                             use_processes=args.use_processes,
+                             inline_batch_size=args.inline_batch_size)
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(_measure_loop_lag(stop))
+    pending = iter(events)
+
+    async def consumer() -> None:
+        # 模拟分发队列的worker：逐个取事件并等待验签结果
+        for event in pending:
+            await verifier.verify(event)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(consumer() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    max_lag = await lag_task
+    verifier.shutdown()
+    return elapsed, max_lag, verifier.stats()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="EventVerifier 基准测试")
+    parser.add_argument("--num-events", type=int, default=10000)
+    parser.add_argument("--num-authors", type=int, default=50)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.2)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="验签线程（进程）数量，默认 min(4, CPU核数)")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--batch-delay", type=float, default=0.002)
+    parser.add_argument("--inline-batch-size", type=int, default=4,
+                        help="小于该大小的批次直接在事件循环上验签")
+    parser.add_argument("--concurrency", type=int, default=64,
+                        help="并发等待验签的worker数量，也是同步验签时一批到达的事件数")
+    parser.add_argument("--use-processes", action="store_true",
+                        help="使用进程池验签")
+    args = parser.parse_args()
+
+    events = make_events(args.num_events, args.num_authors, args.duplicate_ratio)
+
+    elapsed, max_lag = asyncio.run(run_inline(events, args.concurrency))
+    print(f"inline:   {len(events) / elapsed:10.0f} events/s, "
+          f"max loop lag {max_lag * 1000:.2f} ms")
+
+    elapsed, max_lag, stats = asyncio.run(run_verifier(events, args))
+    print(f"verifier: {len(events) / elapsed:10.0f} events/s, "
+          f"max loop lag {max_lag * 1000:.2f} ms")
+    print(f"stats: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+本地模拟的 OpenAI 兼容流式接口，只依赖标准库
+
+POST /v1/chat/completions 按固定的首token延迟和token间隔返回 SSE 流，
+POST /v1/embeddings 返回固定维度的伪向量，用于在没有真实模型服务时
+测试和压测 avatarai.models.llm.LLM。
+
+    python benchmarks/fake_openai_server.py --port 8765 --ttft 0.2 --token-interval 0.01
+"""
+import argparse
+import asyncio
+import json
+import time
+import zlib
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                  args: argparse.Namespace) -> None:
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, _, value = line.decode().partition(":")
+                headers[key.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            payload = json.loads(body or b"{}")
+            if request_line.split()[1].endswith(b"/embeddings"):
+                await _handle_embeddings(writer, payload, args)
+                continue
+
+            writer.write(b"HTTP/1.1 200 OK\r\n"
+                         b"Content-Type: text/event-stream\r\n"
+                         b"Transfer-Encoding: chunked\r\n\r\n")
+            await asyncio.sleep(args.ttft)
+            for index in range(args.num_tokens):
+                chunk = {
+                    "id": "fake",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": payload.get("model", "fake"),
+                    "choices": [{"index": 0, "delta": {"content": f"tok{index} "}}],
+                }
+                _write_chunk(writer, f"data: {json.dumps(chunk)}\n\n")
+                await writer.drain()
+                await asyncio.sleep(args.token_interval)
+            usage = {"choices": [], "usage": {"completion_tokens": args.num_tokens}}
+            _write_chunk(writer, f"data: {json.dumps(usage)}\n\n")
+            _write_chunk(writer, "data: [DONE]\n\n")
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+    except (ConnectionResetError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def _handle_embeddings(writer: asyncio.StreamWriter, payload: dict,
+                             args: argparse.Namespace) -> None:
+    inputs = payload.get("input", [])
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    await asyncio.sleep(args.ttft)
+    data = []
+    for index, text in enumerate(inputs):
+        seed = zlib.crc32(text.encode())
+        vector = [((seed >> (i % 32)) & 0xff) / 255.0
+                  for i in range(args.embedding_dim)]
+        data.append({"object": "embedding", "index": index, "embedding": vector})
+    body = json.dumps({"object": "list", "data": data}).encode()
+    writer.write(b"HTTP/1.1 200 OK\r\n"
+                 b"Content-Type: application/json\r\n"
+                 + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+
+
+def _write_chunk(writer: asyncio.StreamWriter, data: str) -> None:
+    encoded = data.encode()
+    writer.write(f"{len(encoded):x}\r\n".encode() + encoded + b"\r\n")
+
+
+async def serve(args: argparse.Namespace) -> None:
+    server = await asyncio.start_server(
+        lambda r, w: _handle(r, w, args), args.host, args.port)
+    print(f"fake OpenAI server listening on http://{args.host}:{args.port}/v1")
+    async with server:
+        await server.serve_forever()
+
+
+def add_cli_args(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.2, help="首token延迟（秒）")
+    parser.add_argument("--token-interval", type=float, default=0.01,
+                        help="token间隔（秒）")
+    parser.add_argument("--num-tokens", type=int, default=50)
+    parser.add_argument("--embedding-dim", type=int, default=64)
+    return parser
+
+
+if __name__ == "__main__":
+    asyncio.run(serve(add_cli_args(argparse.ArgumentParser()).parse_args()))
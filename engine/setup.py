@@ -13,9 +13,15 @@ setup(
     install_requires=[
         "numpy>=1.20.0",
         "pillow>=8.0.0",
-        "torch>=1.9.0",
-        "transformers>=4.0.0",
+        "httpx>=0.24.0",
     ],
+    extras_require={
+        # 本地模型推理，引擎本身不导入，按需安装：pip install avatarai[ml]
+        "ml": [
+            "torch>=1.9.0",
+            "transformers>=4.0.0",
+        ],
+    },
     classifiers=[
         "Development Status :: 3 - Alpha",
         "Intended Audience :: Developers",
@@ -0,0 +1,23 @@
+from typing import Callable, Optional
+
+import pytest
+from nostr_sdk import Event, EventBuilder, Keys, Timestamp
+
+
+@pytest.fixture
+def keys() -> Keys:
+    return Keys.generate()
+
+
+@pytest.fixture
+def note(keys: Keys) -> Callable[..., Event]:
+    """签名文本事件的工厂，可指定 created_at 和签名的密钥"""
+
+    def make(content: str, created_at: Optional[int] = None,
+             signer: Optional[Keys] = None) -> Event:
+        builder = EventBuilder.text_note(content)
+        if created_at is not None:
+            builder = builder.custom_created_at(Timestamp.from_secs(created_at))
+        return builder.sign_with_keys(signer or keys)
+
+    return make
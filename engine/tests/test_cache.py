@@ -0,0 +1,110 @@
+import asyncio
+
+from avatarai.models import cache as cache_module
+from avatarai.models.cache import ResponseCache, normalize_prompt
+
+# 固定的 embedding：同义问题的向量相近，其他问题正交
+_VECTORS = {
+    "who are you": [1.0, 0.0, 0.0],
+    "who are you really": [0.99, 0.05, 0.0],
+    "what time is it": [0.0, 1.0, 0.0],
+}
+
+
+async def _embed(text):
+    return _VECTORS[text]
+
+
+def _collect(response_cache, messages, reply="hello", persona="bot", embed=None,
+             **params):
+    """经过缓存取一次响应，返回 (输出, 上游是否被调用)"""
+    called = []
+
+    async def producer():
+        called.append(True)
+        for chunk in (reply[:2], reply[2:]):
+            yield chunk
+
+    async def run():
+        chunks = []
+        async for chunk in response_cache.stream("m", messages, persona, producer,
+                                                 embed=embed, **params):
+            chunks.append(chunk)
+        return "".join(chunks)
+
+    return asyncio.run(run()), bool(called)
+
+
+def test_normalize_prompt():
+    assert normalize_prompt("  Who   are YOU?! ") == "who are you"
+    assert normalize_prompt("你好。") == "你好"
+
+
+def test_exact_hit_ignores_case_and_punctuation():
+    response_cache = ResponseCache()
+    assert _collect(response_cache, "Who are you?") == ("hello", True)
+    assert _collect(response_cache, " who are   you ") == ("hello", False)
+    assert response_cache.stats()["exact_hits"] == 1
+
+
+def test_persona_and_params_are_part_of_the_key():
+    response_cache = ResponseCache()
+    _collect(response_cache, "hi", persona="a")
+    assert _collect(response_cache, "hi", persona="b")[1]
+    assert _collect(response_cache, "hi", persona="a", temperature=0.5)[1]
+    assert not _collect(response_cache, "hi", persona="a")[1]
+
+
+def test_semantic_hit_for_similar_question():
+    response_cache = ResponseCache(similarity_threshold=0.95)
+    _collect(response_cache, "who are you", reply="a bot", embed=_embed)
+    similar = _collect(response_cache, "who are you really", embed=_embed)
+    assert similar == ("a bot", False)
+    assert _collect(response_cache, "what time is it", reply="noon", embed=_embed)[1]
+    stats = response_cache.stats()
+    assert stats["semantic_hits"] == 1
+    assert stats["misses"] == 2
+
+
+def test_embedding_failure_falls_back_to_upstream():
+    async def broken(text):
+        raise RuntimeError("embedding down")
+
+    response_cache = ResponseCache()
+    assert _collect(response_cache, "who are you", embed=broken) == ("hello", True)
+    assert _collect(response_cache, "who are you", embed=broken) == ("hello", False)
+
+
+def test_expired_entries_are_not_served(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    response_cache = ResponseCache(ttl=10)
+    _collect(response_cache, "hi")
+    now[0] += 11
+    assert _collect(response_cache, "hi")[1]
+
+
+def test_lru_eviction_drops_semantic_entry():
+    response_cache = ResponseCache(max_entries=1)
+    _collect(response_cache, "who are you", embed=_embed)
+    _collect(response_cache, "what time is it", embed=_embed)
+    assert response_cache.stats()["evictions"] == 1
+    assert _collect(response_cache, "who are you really", embed=_embed)[1]
+
+
+def test_abandoned_stream_is_not_cached():
+    response_cache = ResponseCache()
+
+    async def producer():
+        yield "partial"
+        yield "rest"
+
+    async def run():
+        stream = response_cache.stream("m", "hi", "bot", producer)
+        async for _ in stream:
+            break
+        await stream.aclose()
+
+    asyncio.run(run())
+    assert response_cache.stats()["size"] == 0
+
@@ -0,0 +1,197 @@
+import asyncio
+
+from nostr_sdk import Filter, Keys
+
+from avatarai.nostr.checkpoint import CheckpointStore, _RelayProgress
+from avatarai.nostr.client import Nostr
+
+RELAY = "ws://relay-1"
+OTHER_RELAY = "ws://relay-2"
+
+
+class FakePool:
+    """只记录订阅处理器的连接池，测试直接调用处理器投递事件"""
+
+    def __init__(self):
+        self.handler = None
+
+    async def acquire(self, relays):
+        pass
+
+    async def release(self, relays):
+        pass
+
+    async def subscribe(self, relays, filter_obj, handler, refresh=None):
+        self.handler = handler
+        return "sub"
+
+    async def unsubscribe(self, subscription_id):
+        pass
+
+    async def send_event(self, relays, event):
+        raise ConnectionError("offline")
+
+    def health_snapshot(self, relays):
+        return []
+
+
+def test_progress_does_not_pass_inflight_events():
+    progress = _RelayProgress()
+    for created_at in (10, 20, 30):
+        progress.begin(created_at)
+    progress.end(30)
+    progress.end(20)
+    assert progress.position() == 9
+    progress.end(10)
+    assert progress.position() == 30
+
+
+def test_progress_counts_duplicate_timestamps():
+    progress = _RelayProgress()
+    progress.begin(10)
+    progress.begin(10)
+    progress.end(10)
+    assert progress.position() == 9
+    progress.end(10)
+    assert progress.position() == 10
+
+
+def test_checkpoint_advances_after_out_of_order_completion(tmp_path):
+    store = CheckpointStore(str(tmp_path / "checkpoints.db"), flush_interval=0)
+    checkpoint = store.for_avatar("a")
+    checkpoint.begin(RELAY, "dm", 100)
+    checkpoint.begin(RELAY, "dm", 200)
+    checkpoint.complete(RELAY, "dm", "e200", 200)
+    assert checkpoint.get_since("dm") == 99
+    checkpoint.complete(RELAY, "dm", "e100", 100)
+    assert checkpoint.get_since("dm") == 200
+    assert checkpoint.is_processed("e100")
+    store.close()
+
+
+def test_progress_holds_before_oldest_held_event():
+    progress = _RelayProgress(max_held=2)
+    progress.seen(50)
+    progress.hold("e30", 30)
+    progress.hold("e40", 40)
+    assert progress.position() == 29
+    assert progress.release("e30")
+    assert not progress.release("e30")
+    assert progress.position() == 39
+    # 超出上限时放弃最早的挂起事件
+    progress.hold("e10", 10)
+    progress.hold("e45", 45)
+    assert progress.position() == 39
+
+
+def test_abandoned_event_holds_watermark_until_processed(tmp_path):
+    store = CheckpointStore(str(tmp_path / "checkpoints.db"), flush_interval=0)
+    checkpoint = store.for_avatar("a")
+    checkpoint.begin(RELAY, "dm", 100)
+    checkpoint.begin(RELAY, "dm", 200)
+    checkpoint.complete(RELAY, "dm", "e200", 200)
+    checkpoint.abandon(RELAY, "dm", "e100", 100)
+    # 被丢弃的事件没有处理，重新订阅时还要从它之前开始
+    assert checkpoint.get_since("dm") == 99
+    assert not checkpoint.is_processed("e100")
+    # 其他中继推送的副本处理完成后，两个中继都可以越过它
+    checkpoint.begin(OTHER_RELAY, "dm", 100)
+    checkpoint.complete(OTHER_RELAY, "dm", "e100", 100)
+    assert checkpoint.get_since("dm") == 100
+    checkpoint.skip(OTHER_RELAY, "dm", 200)
+    assert checkpoint.get_since("dm") == 200
+    store.close()
+
+
+def test_rejected_event_holds_watermark(tmp_path):
+    store = CheckpointStore(str(tmp_path / "checkpoints.db"), flush_interval=0)
+    checkpoint = store.for_avatar("a")
+    checkpoint.skip(RELAY, "dm", 100)
+    checkpoint.reject(RELAY, "dm", "e150", 150)
+    checkpoint.skip(RELAY, "dm", 300)
+    assert checkpoint.get_since("dm") == 149
+    checkpoint.begin(RELAY, "dm", 150)
+    checkpoint.complete(RELAY, "dm", "e150", 150)
+    assert checkpoint.get_since("dm") == 300
+    store.close()
+
+
+def test_since_is_minimum_across_relays(tmp_path):
+    store = CheckpointStore(str(tmp_path / "checkpoints.db"), flush_interval=0)
+    checkpoint = store.for_avatar("a")
+    checkpoint.skip(RELAY, "dm", 500)
+    checkpoint.skip(OTHER_RELAY, "dm", 300)
+    assert checkpoint.get_since("dm") == 300
+    assert checkpoint.get_since("other") is None
+    store.close()
+
+
+def test_checkpoints_survive_reopen(tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+    store = CheckpointStore(path, flush_interval=60)
+    checkpoint = store.for_avatar("a")
+    checkpoint.begin(RELAY, "dm", 100)
+    checkpoint.complete(RELAY, "dm", "e100", 100)
+    store.close()
+
+    reopened = CheckpointStore(path).for_avatar("a")
+    assert reopened.get_since("dm") == 100
+    assert reopened.is_processed("e100")
+    reopened.store.close()
+
+
+def test_periodic_flush_writes_last_batch(tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+
+    async def main():
+        store = CheckpointStore(path, flush_interval=0.1)
+        store.start()
+        store.advance("a", RELAY, "dm", 100)
+        # 之后没有新的写入，定时任务也应提交这一批
+        await asyncio.sleep(0.35)
+        rows = store._conn.execute("SELECT created_at FROM checkpoints").fetchall()
+        store.close()
+        return rows
+
+    assert asyncio.run(main()) == [(100,)]
+
+
+def test_dropped_events_do_not_stall_checkpoint(tmp_path, note):
+    async def main():
+        store = CheckpointStore(str(tmp_path / "checkpoints.db"), flush_interval=0)
+        checkpoint = store.for_avatar("a")
+        pool = FakePool()
+        client = Nostr(Keys.generate().secret_key().to_hex(), [RELAY, OTHER_RELAY],
+                       pool=pool, dispatch_workers=1, dispatch_queue_size=1,
+                       checkpoint=checkpoint)
+        processed = []
+
+        async def callback(event):
+            processed.append(event.created_at().as_secs())
+
+        await client.subscribe(Filter(), callback, name="dm")
+        await client.dispatcher.stop(drain=True)
+        events = [note(str(i), created_at=1000 + i) for i in range(5)]
+        # 队列容量为1，前四个事件依次被挤出
+        for event in events:
+            await pool.handler.handle(RELAY, "sub", event)
+        client.dispatcher.start()
+        await client.dispatcher.stop(drain=True)
+        since_after_drop = checkpoint.get_since("dm")
+
+        # 被丢弃的事件没有记为已处理，其他中继推送的副本仍会被处理
+        client.dispatcher.start()
+        await pool.handler.handle(OTHER_RELAY, "sub", events[0])
+        await client.dispatcher.stop(drain=True)
+        since = checkpoint.get_since("dm")
+        await client.outbox.stop(drain=False)
+        store.close()
+        return processed, since_after_drop, since, client.dispatcher.dropped
+
+    processed, since_after_drop, since, dropped = asyncio.run(main())
+    assert dropped == 4
+    # 被挤出的事件挡住检查点，重新订阅时可以再次获取
+    assert since_after_drop == 999
+    assert processed == [1004, 1000]
+    # 1000 的副本处理完成，1001~1003 仍未处理
+    assert since == 1000
@@ -0,0 +1,124 @@
+import os
+
+import pytest
+from nostr_sdk import Keys
+
+from avatarai.engine.config_loader import (
+    AvatarConfigError,
+    AvatarConfigWatcher,
+    list_avatar_files,
+    load_avatar_configs,
+    parse_avatar_file,
+)
+
+
+def _avatar_toml(memo_id: str, description: str = "bot", private_key: str = None,
+                 provider: str = "openai",
+                 relays: str = '["wss://relay.local"]') -> str:
+    private_key = private_key or Keys.generate().secret_key().to_hex()
+    return (f'name = "{memo_id}"\n'
+            f'description = "{description}"\n'
+            f'memoId = "{memo_id}"\n'
+            f'[llm]\napiUrl = "http://llm.local/v1"\nmodel = "m"\n'
+            f'provider = "{provider}"\napiKey = "k"\n'
+            f'[nostr]\nprivateKey = "{private_key}"\nrelays = {relays}\n')
+
+
+def _write(path, text: str) -> str:
+    path.write_text(text, encoding="utf-8")
+    # 保证 mtime 变化，不依赖文件系统的时间精度
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    return str(path)
+
+
+@pytest.mark.parametrize("text, message", [
+    (_avatar_toml("a", provider="unknown"), "provider"),
+    (_avatar_toml("a", private_key="not-a-key"), "privateKey"),
+    (_avatar_toml("a", relays="[]"), "relays"),
+    (_avatar_toml("a", relays='["http://relay.local"]'), "中继"),
+    ("name = ", ""),
+])
+def test_invalid_file_raises_config_error(tmp_path, text, message):
+    path = _write(tmp_path / "a.toml", text)
+    with pytest.raises(AvatarConfigError) as info:
+        parse_avatar_file(path)
+    assert info.value.file_path == path
+    assert message in info.value.message
+
+
+def test_duplicate_ids_are_errors_for_every_file(tmp_path):
+    first = _write(tmp_path / "1.toml", _avatar_toml("dup"))
+    second = _write(tmp_path / "2.toml", _avatar_toml("dup"))
+    unique = _write(tmp_path / "3.toml", _avatar_toml("unique"))
+    _write(tmp_path / ".hidden.toml", _avatar_toml("hidden"))
+
+    files = list_avatar_files(str(tmp_path))
+    assert files == [first, second, unique]
+    configs, errors = load_avatar_configs(files, max_workers=1)
+    assert list(configs) == [unique]
+    assert set(errors) == {first, second}
+
+
+def _watch(tmp_path, count: int = 3) -> AvatarConfigWatcher:
+    for i in range(count):
+        _write(tmp_path / f"{i}.toml", _avatar_toml(f"a{i}"))
+    files = list_avatar_files(str(tmp_path))
+    configs, errors = load_avatar_configs(files, max_workers=1)
+    assert not errors
+    watcher = AvatarConfigWatcher(str(tmp_path), max_workers=1)
+    watcher.track(configs)
+    return watcher
+
+
+def test_watcher_reports_added_changed_and_removed(tmp_path):
+    watcher = _watch(tmp_path)
+    assert not watcher.poll()
+
+    _write(tmp_path / "0.toml", _avatar_toml("a0", description="changed"))
+    os.remove(tmp_path / "1.toml")
+    _write(tmp_path / "9.toml", _avatar_toml("a9"))
+    changes = watcher.poll()
+    assert list(changes.changed) == ["a0"]
+    assert changes.changed["a0"].description == "changed"
+    assert changes.removed == ["a1"]
+    assert list(changes.added) == ["a9"]
+    assert not watcher.poll()
+
+
+def test_touched_file_is_not_a_change(tmp_path):
+    watcher = _watch(tmp_path)
+    path = tmp_path / "0.toml"
+    _write(path, path.read_text(encoding="utf-8"))
+    assert not watcher.poll()
+
+
+def test_invalid_edit_keeps_previous_config(tmp_path):
+    watcher = _watch(tmp_path)
+    path = _write(tmp_path / "0.toml", "name = ")
+    changes = watcher.poll()
+    assert not changes
+    assert path in changes.errors
+
+
+def test_revert_retries_change_on_next_poll(tmp_path):
+    watcher = _watch(tmp_path)
+    _write(tmp_path / "0.toml", _avatar_toml("a0", description="changed"))
+    _write(tmp_path / "9.toml", _avatar_toml("a9"))
+    changes = watcher.poll()
+    assert list(changes.changed) == ["a0"]
+
+    # 应用失败：撤销后下一次轮询重新报告同样的变化
+    watcher.revert(["a0", "a9"])
+    retry = watcher.poll()
+    assert list(retry.changed) == ["a0"]
+    assert list(retry.added) == ["a9"]
+    assert not watcher.poll()
+
+
+def test_id_moved_to_another_file_keeps_original(tmp_path):
+    watcher = _watch(tmp_path)
+    path = _write(tmp_path / "9.toml", _avatar_toml("a0"))
+    changes = watcher.poll()
+    assert not changes
+    assert path in changes.errors
@@ -0,0 +1,94 @@
+import asyncio
+
+from avatarai.memory.conversation import ConversationStore, estimate_tokens
+
+
+def _rows(store: ConversationStore) -> int:
+    return store._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("abcdefgh") == 3
+    assert estimate_tokens("你好") == 3
+
+
+def test_context_is_truncated_to_budget(tmp_path):
+    store = ConversationStore(str(tmp_path / "memory.db"), token_budget=20)
+    memory = store.for_avatar("a")
+    for i in range(10):
+        memory.append("peer", "user", f"message number {i}")
+    context = memory.context("peer")
+    assert context[-1] == {"role": "user", "content": "message number 9"}
+    assert len(context) < 10
+    assert sum(estimate_tokens(m["content"]) for m in context) <= 20
+    # 单条消息超出预算时仍保留最新的一条
+    memory.append("peer", "assistant", "x" * 200)
+    assert memory.context("peer") == [{"role": "assistant", "content": "x" * 200}]
+    store.close()
+
+
+def test_conversations_are_separated_by_avatar_and_peer(tmp_path):
+    store = ConversationStore(str(tmp_path / "memory.db"))
+    store.for_avatar("a").append("p1", "user", "to a from p1")
+    store.for_avatar("a").append("p2", "user", "to a from p2")
+    store.for_avatar("b").append("p1", "user", "to b from p1")
+    assert [m["content"] for m in store.context("a", "p1")] == ["to a from p1"]
+    assert [m["content"] for m in store.context("b", "p1")] == ["to b from p1"]
+    store.close()
+
+
+def test_window_reloads_from_disk_within_budget(tmp_path):
+    path = str(tmp_path / "memory.db")
+    store = ConversationStore(path, token_budget=20)
+    for i in range(10):
+        store.append("a", "peer", "user", f"message number {i}")
+    expected = store.context("a", "peer")
+    store.close()
+
+    reopened = ConversationStore(path, token_budget=20)
+    assert reopened.context("a", "peer") == expected
+    # 序号接着之前的会话继续
+    assert reopened.append("a", "peer", "assistant", "reply") == 10
+    reopened.close()
+
+
+def test_history_pages_backwards(tmp_path):
+    store = ConversationStore(str(tmp_path / "memory.db"), flush_interval=60)
+    for i in range(7):
+        store.append("a", "peer", "user", str(i))
+    # history 会先提交缓存的消息
+    first = store.history("a", "peer", limit=3)
+    second = store.history("a", "peer", limit=3, before_seq=first[-1].seq)
+    third = store.history("a", "peer", limit=3, before_seq=second[-1].seq)
+    assert [m.content for m in first] == ["6", "5", "4"]
+    assert [m.content for m in second] == ["3", "2", "1"]
+    assert [m.content for m in third] == ["0"]
+    store.close()
+
+
+def test_evicted_window_is_flushed_before_reload(tmp_path):
+    store = ConversationStore(str(tmp_path / "memory.db"), cache_size=1,
+                              flush_interval=60)
+    store.append("a", "p1", "user", "hello")
+    store.append("a", "p2", "user", "other")
+    assert [m["content"] for m in store.context("a", "p1")] == ["hello"]
+    store.close()
+
+
+def test_periodic_flush_writes_quiet_conversations(tmp_path):
+    async def main():
+        store = ConversationStore(str(tmp_path / "memory.db"), flush_interval=0.1)
+        store.start()
+        store.append("a", "peer", "user", "first")
+        store.append("a", "peer", "user", "second")
+        before = _rows(store)
+        # 之后没有新消息，定时任务也应提交这一批
+        await asyncio.sleep(0.35)
+        after = _rows(store)
+        store.close()
+        return before, after
+
+    before, after = asyncio.run(main())
+    assert before < 2
+    assert after == 2
@@ -0,0 +1,45 @@
+import pytest
+
+from avatarai.nostr import dedup
+from avatarai.nostr.dedup import EventDeduplicator
+
+
+def test_second_sighting_is_duplicate():
+    deduplicator = EventDeduplicator()
+    assert not deduplicator.is_duplicate("a")
+    assert deduplicator.is_duplicate("a")
+    assert not deduplicator.is_duplicate("b")
+    assert deduplicator.stats() == {"size": 2, "hits": 1, "misses": 2}
+
+
+def test_evicts_oldest_beyond_max_size():
+    deduplicator = EventDeduplicator(max_size=2, ttl=None)
+    for event_id in ("a", "b", "c"):
+        deduplicator.is_duplicate(event_id)
+    assert deduplicator.stats()["size"] == 2
+    assert not deduplicator.is_duplicate("a")
+    assert deduplicator.is_duplicate("c")
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(dedup.time, "monotonic", lambda: now[0])
+    deduplicator = EventDeduplicator(ttl=10)
+    deduplicator.is_duplicate("a")
+    now[0] += 5
+    assert deduplicator.is_duplicate("a")
+    now[0] += 6
+    assert not deduplicator.is_duplicate("a")
+
+
+def test_forget_allows_event_again():
+    deduplicator = EventDeduplicator()
+    deduplicator.is_duplicate("a")
+    deduplicator.forget("a")
+    deduplicator.forget("unknown")
+    assert not deduplicator.is_duplicate("a")
+
+
+def test_invalid_max_size():
+    with pytest.raises(ValueError):
+        EventDeduplicator(max_size=0)
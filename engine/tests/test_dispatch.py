@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+from nostr_sdk import Keys
+
+from avatarai.nostr.dispatch import BackpressurePolicy, EventDispatcher
+
+
+def test_drop_oldest_evicts_and_notifies(note):
+    async def main():
+        dispatcher = EventDispatcher(num_workers=1, max_queue_size=2)
+        processed, dropped = [], []
+        for i in range(5):
+            accepted = await dispatcher.submit(
+                note(f"n{i}"), lambda event: processed.append(event.content()),
+                on_drop=lambda event: dropped.append(event.content()))
+            assert accepted
+        dispatcher.start()
+        await dispatcher.stop(drain=True)
+        return processed, dropped, dispatcher.stats()
+
+    processed, dropped, stats = asyncio.run(main())
+    assert processed == ["n3", "n4"]
+    assert dropped == ["n0", "n1", "n2"]
+    assert stats["dropped"] == 3
+    assert stats["processed"] == 2
+
+
+def test_shed_by_kind_rejects_without_on_drop(note):
+    async def main():
+        dispatcher = EventDispatcher(num_workers=1, max_queue_size=1,
+                                     policy=BackpressurePolicy.SHED_BY_KIND,
+                                     shed_kinds=[1])
+        dropped = []
+        first = await dispatcher.submit(note("a"), lambda event: None,
+                                        on_drop=dropped.append)
+        second = await dispatcher.submit(note("b"), lambda event: None,
+                                         on_drop=dropped.append)
+        return first, second, dropped, dispatcher.queue_depth
+
+    first, second, dropped, depth = asyncio.run(main())
+    assert first is True
+    assert second is False
+    assert dropped == []
+    assert depth == 1
+
+
+def test_block_waits_for_space(note):
+    async def main():
+        dispatcher = EventDispatcher(num_workers=1, max_queue_size=1,
+                                     policy=BackpressurePolicy.BLOCK)
+        processed = []
+
+        def callback(event):
+            processed.append(event.content())
+
+        await dispatcher.submit(note("a"), callback)
+        blocked = asyncio.ensure_future(dispatcher.submit(note("b"), callback))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        dispatcher.start()
+        assert await asyncio.wait_for(blocked, 1)
+        await dispatcher.stop(drain=True)
+        return processed, dispatcher.dropped
+
+    processed, dropped = asyncio.run(main())
+    assert processed == ["a", "b"]
+    assert dropped == 0
+
+
+def test_same_author_processed_in_order(note):
+    async def main():
+        dispatcher = EventDispatcher(num_workers=4, max_queue_size=64)
+        processed = []
+
+        async def callback(event):
+            # 先到的事件处理得更慢，仍应先完成
+            await asyncio.sleep(0.001 * (10 - int(event.content())))
+            processed.append(event.content())
+
+        dispatcher.start()
+        for i in range(10):
+            await dispatcher.submit(note(str(i)), callback)
+        await dispatcher.stop(drain=True)
+        return processed
+
+    assert asyncio.run(main()) == [str(i) for i in range(10)]
+
+
+def test_stop_without_drain_drops_queued_events(note):
+    async def main():
+        dispatcher = EventDispatcher(num_workers=1, max_queue_size=8)
+        dropped = []
+        for i in range(3):
+            await dispatcher.submit(
+                note(str(i)), lambda event: None,
+                on_drop=lambda event: dropped.append(event.content()))
+        await dispatcher.stop(drain=False)
+        return dropped, dispatcher.queue_depth
+
+    dropped, depth = asyncio.run(main())
+    assert dropped == ["0", "1", "2"]
+    assert depth == 0
+
+
+def test_failing_callback_is_counted(note):
+    async def main():
+        dispatcher = EventDispatcher(num_workers=1)
+
+        def callback(event):
+            raise RuntimeError("boom")
+
+        dispatcher.start()
+        await dispatcher.submit(note("x"), callback)
+        await dispatcher.stop(drain=True)
+        return dispatcher.stats()
+
+    stats = asyncio.run(main())
+    assert stats["failed"] == 1
+    assert stats["processed"] == 0
+
+
+def test_invalid_worker_count():
+    with pytest.raises(ValueError):
+        EventDispatcher(num_workers=0)
+
+
+def test_authors_spread_over_workers(note):
+    dispatcher = EventDispatcher(num_workers=4)
+    indexes = {
+        dispatcher._worker_index(note("x", signer=Keys.generate())) for _ in range(32)
+    }
+    assert len(indexes) > 1
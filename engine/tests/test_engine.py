@@ -0,0 +1,230 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from avatarai.config import AvatarAIConfig, AvatarConfig, LLMConfig, NostrConfig
+from avatarai.engine import async_avatar_engine
+from avatarai.engine.async_avatar_engine import AsyncAvatarEngine
+from avatarai.engine.registry import AvatarRegistry
+
+
+def _config(memo_id: str, description: str = "bot") -> AvatarConfig:
+    return AvatarConfig(
+        name=memo_id, description=description, memoId=memo_id, version="1",
+        author="", tags=[], tools_config=[],
+        llm_config=LLMConfig(api_url="http://llm.local/v1", model="m",
+                             provider="openai", api_key="k"),
+        nostr_config=NostrConfig(private_key="unused", relays=["wss://relay.local"]))
+
+
+class FakeAgent:
+    """记录启动和停止顺序的Avatar，description 为 "broken" 时启动失败"""
+
+    def __init__(self, avatar_id, avatar_config, events, live):
+        self.avatar_id = avatar_id
+        self.avatar_config = avatar_config
+        self.events = events
+        self.live = live
+        self.ready = False
+        self.nostr_client = SimpleNamespace(pool=FakePool(events), relays=[])
+
+    async def serve(self):
+        await asyncio.sleep(0.01)
+        if self.avatar_config.description == "broken":
+            raise RuntimeError("cannot connect")
+        # 同一Avatar ID 任何时刻最多只有一个实例在运行
+        assert self.avatar_id not in self.live
+        self.live[self.avatar_id] = self
+        self.ready = True
+        self.events.append(("serve", self.avatar_id, self.avatar_config.description))
+
+    async def stop(self):
+        await asyncio.sleep(0.01)
+        if self.live.get(self.avatar_id) is self:
+            del self.live[self.avatar_id]
+        self.ready = False
+        self.events.append(("stop", self.avatar_id, self.avatar_config.description))
+
+    def collect_metrics(self, metrics):
+        pass
+
+
+class FakePool:
+    def __init__(self, events):
+        self.events = events
+
+    async def close(self):
+        self.events.append(("pool-close",))
+
+    def health_snapshot(self, relays):
+        return []
+
+    def collect_metrics(self, metrics):
+        pass
+
+
+@pytest.fixture
+def events(monkeypatch):
+    events, live = [], {}
+
+    def create_agent(self, avatar_id, avatar_config):
+        return FakeAgent(avatar_id, avatar_config, events, live)
+
+    monkeypatch.setattr(AsyncAvatarEngine, "_create_agent", create_agent)
+    pool = FakePool(events)
+    monkeypatch.setattr(async_avatar_engine, "get_relay_pool", lambda: pool)
+    return events
+
+
+def _ids_in_same_shard(registry: AvatarRegistry, count: int):
+    shard = registry._shard_index("a0")
+    ids = [f"a{i}" for i in range(1000) if registry._shard_index(f"a{i}") == shard]
+    return ids[:count]
+
+
+def test_registry_basic_operations():
+    registry = AvatarRegistry(num_shards=4)
+    for i in range(10):
+        registry.put(f"a{i}", i)
+    assert len(registry) == 10
+    assert "a3" in registry
+    assert registry.get("a3") == 3
+    assert registry.pop("a3") == 3
+    assert registry.pop("a3") is None
+    assert sorted(registry.ids()) == sorted(f"a{i}" for i in range(10) if i != 3)
+
+
+def test_registry_items_tolerate_concurrent_changes():
+    registry = AvatarRegistry(num_shards=2)
+    for i in range(10):
+        registry.put(f"a{i}", i)
+    for avatar_id, _ in registry.items():
+        registry.pop(avatar_id)
+    assert len(registry) == 0
+
+
+def test_registry_locks_are_per_shard():
+    registry = AvatarRegistry(num_shards=16)
+    first, second = _ids_in_same_shard(registry, 2)
+    assert registry.lock(first) is registry.lock(second)
+    other = next(f"b{i}" for i in range(1000)
+                 if registry._shard_index(f"b{i}") != registry._shard_index(first))
+    assert registry.lock(other) is not registry.lock(first)
+    # 分片由 crc32 决定，与进程无关
+    fresh = AvatarRegistry(num_shards=16)
+    assert fresh._shard_index(first) == registry._shard_index(first)
+
+
+def test_registry_rejects_invalid_shard_count():
+    with pytest.raises(ValueError):
+        AvatarRegistry(num_shards=0)
+
+
+def test_duplicate_ids_rejected_at_construction(events):
+    with pytest.raises(ValueError):
+        AsyncAvatarEngine(AvatarAIConfig(avatar_configs=[_config("a"), _config("a")]))
+
+
+def test_locked_shard_does_not_block_other_shards(events):
+    async def main():
+        engine = AsyncAvatarEngine(AvatarAIConfig())
+        await engine.serve()
+        blocked_id = "a0"
+        free_id = next(f"b{i}" for i in range(1000)
+                       if engine.avatars._shard_index(f"b{i}")
+                       != engine.avatars._shard_index(blocked_id))
+        async with engine.avatars.lock(blocked_id):
+            blocked = asyncio.ensure_future(
+                engine.add_avatar_async(blocked_id, avatar_config=_config(blocked_id)))
+            added = await asyncio.wait_for(
+                engine.add_avatar_async(free_id, avatar_config=_config(free_id)), 1)
+            assert not blocked.done()
+        assert await blocked
+        await engine.stop()
+        return added
+
+    assert asyncio.run(main())
+
+
+def test_concurrent_add_and_remove_of_same_id_are_serialized(events):
+    async def main():
+        engine = AsyncAvatarEngine(AvatarAIConfig())
+        await engine.serve()
+        results = await asyncio.gather(
+            engine.add_avatar_async("a", avatar_config=_config("a", "v1")),
+            engine.add_avatar_async("a", avatar_config=_config("a", "v2")),
+            engine.remove_avatar_async("a"),
+            engine.add_avatar_async("a", avatar_config=_config("a", "v3")),
+        )
+        current = engine.avatars.get("a").avatar_config.description
+        await engine.stop()
+        return results, current
+
+    results, current = asyncio.run(main())
+    # 按加锁顺序执行：第二次添加时ID已存在，移除后可以再次添加
+    assert results == [True, False, True, True]
+    assert current == "v3"
+    assert events[:3] == [("serve", "a", "v1"), ("stop", "a", "v1"),
+                          ("serve", "a", "v3")]
+
+
+def test_replace_failure_restores_previous_config(events):
+    async def main():
+        engine = AsyncAvatarEngine(AvatarAIConfig(avatar_configs=[_config("a", "v1")]))
+        await engine.serve()
+        with pytest.raises(RuntimeError):
+            await engine.replace_avatar_async("a", _config("a", "broken"))
+        current = engine.avatars.get("a")
+        restored = (current.avatar_config.description, current.ready)
+        replaced = await engine.replace_avatar_async("a", _config("a", "v2"))
+        updated = engine.avatars.get("a").avatar_config.description
+        await engine.stop()
+        return restored, replaced, updated
+
+    assert asyncio.run(main()) == (("v1", True), True, "v2")
+    # 旧实例先停止，新实例才启动；启动失败的实例释放资源后恢复旧配置
+    assert events[:4] == [("serve", "a", "v1"), ("stop", "a", "v1"),
+                          ("stop", "a", "broken"), ("serve", "a", "v1")]
+
+
+def test_failed_startup_is_reported_without_blocking_others(events):
+    async def main():
+        engine = AsyncAvatarEngine(AvatarAIConfig(
+            avatar_configs=[_config("good"), _config("bad", "broken")]))
+        await engine.serve()
+        state = engine.readiness()
+        await engine.stop()
+        return state
+
+    state = asyncio.run(main())
+    assert state["avatars"]["good"]["ready"]
+    assert state["avatars"]["bad"]["error"] == "cannot connect"
+    assert not state["ready"]
+
+
+def test_stop_drains_avatars_before_closing_shared_resources(events, tmp_path,
+                                                             monkeypatch):
+    async def main():
+        engine = AsyncAvatarEngine(AvatarAIConfig(
+            avatar_configs=[_config("a"), _config("b")], data_dir=str(tmp_path)))
+        for name in ("checkpoint_store", "conversation_store", "outbox_store"):
+            store = getattr(engine, name)
+            close = store.close
+
+            def closing(name=name, close=close):
+                events.append((name + "-close",))
+                close()
+
+            monkeypatch.setattr(store, "close", closing)
+        await engine.serve()
+        await engine.stop()
+        return engine.ready()
+
+    assert asyncio.run(main()) is False
+    closing = [event[0] for event in events if event[0] not in ("serve", "stop")]
+    stops = [index for index, event in enumerate(events) if event[0] == "stop"]
+    assert len(stops) == 2
+    assert closing == ["pool-close", "checkpoint_store-close",
+                       "conversation_store-close", "outbox_store-close"]
+    assert max(stops) < events.index(("pool-close",))
@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+from avatarai.config import LLMConfig
+from avatarai.models.gateway import LLMGateway, _FairScheduler
+
+
+def _fake_llm(gateway: LLMGateway, api_key: str = "key", chunks=("hel", "lo"),
+              error: Exception = None):
+    """把网关中的 LLM 客户端替换为本地的流式输出，返回 (客户端, 上游调用记录)"""
+    llm = gateway.get_llm(LLMConfig(api_url="http://llm.local/v1", model="m",
+                                    provider="openai", api_key=api_key))
+    calls = []
+
+    async def stream(messages, stats=None, **params):
+        calls.append(messages)
+        for chunk in chunks:
+            await asyncio.sleep(0.01)
+            yield chunk
+        if error is not None:
+            raise error
+
+    llm.stream = stream
+    return llm, calls
+
+
+def test_identical_requests_share_one_upstream_call():
+    async def main():
+        gateway = LLMGateway()
+        llm, calls = _fake_llm(gateway)
+        results = await asyncio.gather(
+            *(gateway.invoke(f"avatar-{i}", llm, "hi") for i in range(3)))
+        return results, calls, gateway.stats()
+
+    results, calls, stats = asyncio.run(main())
+    assert results == ["hello"] * 3
+    assert len(calls) == 1
+    assert stats["coalesced"] == 2
+    assert stats["inflight"] == 0
+
+
+def test_different_credentials_are_not_coalesced():
+    async def main():
+        gateway = LLMGateway()
+        first, first_calls = _fake_llm(gateway, api_key="k1")
+        second, second_calls = _fake_llm(gateway, api_key="k2")
+        await asyncio.gather(gateway.invoke("a", first, "hi"),
+                             gateway.invoke("b", second, "hi"))
+        return len(first_calls), len(second_calls), gateway.coalesced
+
+    assert asyncio.run(main()) == (1, 1, 0)
+
+
+def test_upstream_error_reaches_every_caller():
+    async def main():
+        gateway = LLMGateway()
+        llm, _ = _fake_llm(gateway, error=RuntimeError("upstream"))
+        return await asyncio.gather(gateway.invoke("a", llm, "hi"),
+                                    gateway.invoke("b", llm, "hi"),
+                                    return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_fair_scheduler_round_robins_between_avatars():
+    async def main():
+        scheduler = _FairScheduler(max_concurrency=1)
+        await scheduler.acquire("holder")
+        order = []
+
+        async def call(avatar_id):
+            await scheduler.acquire(avatar_id)
+            order.append(avatar_id)
+            await asyncio.sleep(0)
+            scheduler.release()
+
+        # a 先突发四个请求，b 后到的请求不应排在 a 的全部请求之后
+        tasks = [asyncio.ensure_future(call("a")) for _ in range(4)]
+        tasks += [asyncio.ensure_future(call("b")) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert scheduler.waiting == 6
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        return order, scheduler.active
+
+    order, active = asyncio.run(main())
+    assert order == ["a", "b", "a", "b", "a", "a"]
+    assert active == 0
+
+
+def test_cancelled_waiter_gives_up_its_slot():
+    async def main():
+        scheduler = _FairScheduler(max_concurrency=1)
+        await scheduler.acquire("holder")
+        waiter = asyncio.ensure_future(scheduler.acquire("a"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        waiting = scheduler.waiting
+        scheduler.release()
+        return waiting, scheduler.active
+
+    assert asyncio.run(main()) == (0, 0)
+
+
+def test_embeddings_are_batched_within_provider_limit():
+    async def main():
+        gateway = LLMGateway(max_concurrency_per_provider=1, batch_window=0.001,
+                             max_batch_size=2)
+        llm, _ = _fake_llm(gateway)
+        scheduler = gateway._scheduler(llm)
+        batches, peak = [], [0]
+
+        async def embed(texts):
+            batches.append(list(texts))
+            peak[0] = max(peak[0], scheduler.active)
+            await asyncio.sleep(0.01)
+            return [[float(text)] for text in texts]
+
+        llm.embed = embed
+        vectors = await asyncio.gather(*(gateway.embed(llm, str(i)) for i in range(5)))
+        return vectors, batches, peak[0], scheduler.active
+
+    vectors, batches, peak, active = asyncio.run(main())
+    assert vectors == [[float(i)] for i in range(5)]
+    assert sorted(len(batch) for batch in batches) == [1, 2, 2]
+    assert peak == 1
+    assert active == 0
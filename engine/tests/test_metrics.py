@@ -0,0 +1,58 @@
+import asyncio
+
+from avatarai.utils.metrics import MetricSet, MetricsRegistry
+from avatarai.utils.stats import Histogram
+
+
+def _histogram(*values: float) -> Histogram:
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in values:
+        histogram.observe(value)
+    return histogram
+
+
+def test_histograms_are_aggregated_across_avatars():
+    metrics = MetricSet()
+    for avatar, values in (("a", (0.05, 0.5)), ("b", (2.0,))):
+        metrics.counter("events", "事件数", len(values), avatar=avatar)
+        metrics.histogram("handler_seconds", "耗时", _histogram(*values),
+                          avatar=avatar, kind="1")
+    text = metrics.render()
+
+    assert 'avatarai_events_total{avatar="a"} 2' in text
+    assert 'avatarai_events_total{avatar="b"} 1' in text
+    assert "avatar=" not in "".join(
+        line for line in text.splitlines() if "handler_seconds" in line)
+    assert 'avatarai_handler_seconds_bucket{kind="1",le="0.1"} 1' in text
+    assert 'avatarai_handler_seconds_bucket{kind="1",le="1"} 2' in text
+    assert 'avatarai_handler_seconds_bucket{kind="1",le="+Inf"} 3' in text
+    assert 'avatarai_handler_seconds_count{kind="1"} 3' in text
+    assert 'avatarai_handler_seconds_sum{kind="1"} 2.55' in text
+
+
+def test_histograms_with_other_labels_stay_separate():
+    metrics = MetricSet()
+    metrics.histogram("handler_seconds", "耗时", _histogram(0.5), avatar="a", kind="1")
+    metrics.histogram("handler_seconds", "耗时", _histogram(0.5), avatar="a", kind="4")
+    text = metrics.render()
+    assert 'avatarai_handler_seconds_count{kind="1"} 1' in text
+    assert 'avatarai_handler_seconds_count{kind="4"} 1' in text
+
+
+def test_registry_awaits_async_collectors_and_skips_failures():
+    def sync_collector(metrics):
+        metrics.gauge("sync", "同步采集", 1)
+
+    async def async_collector(metrics):
+        await asyncio.sleep(0)
+        metrics.gauge("async", "异步采集", 2)
+
+    def broken(metrics):
+        raise RuntimeError("boom")
+
+    registry = MetricsRegistry()
+    for collector in (sync_collector, broken, async_collector):
+        registry.register(collector)
+    text = asyncio.run(registry.collect()).render()
+    assert "avatarai_sync 1" in text
+    assert "avatarai_async 2" in text
@@ -0,0 +1,173 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from avatarai.nostr.outbox import Outbox, OutboxFullError, OutboxStore
+
+FAST = "ws://fast"
+SLOW = "ws://slow"
+
+
+class FakePool:
+    """按中继返回预设结果的连接池，记录每次发送"""
+
+    def __init__(self, failures=None, delays=None):
+        # 中继 -> 前几次发送失败
+        self.failures = dict(failures or {})
+        self.delays = delays or {}
+        self.sent = []
+
+    async def send_event(self, relays, event):
+        relay_url = relays[0]
+        await asyncio.sleep(self.delays.get(relay_url, 0))
+        self.sent.append((relay_url, event.id().to_hex()))
+        if self.failures.get(relay_url, 0) > 0:
+            self.failures[relay_url] -= 1
+            return SimpleNamespace(success=set(), failed={relay_url: "rate-limited"})
+        return SimpleNamespace(success={relay_url}, failed={})
+
+
+async def _wait_until(predicate, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "等待超时"
+        await asyncio.sleep(0.005)
+
+
+def test_publish_returns_first_relay_and_finishes_in_background(tmp_path, note):
+    async def main():
+        store = OutboxStore(str(tmp_path / "outbox.db")).for_avatar("a")
+        pool = FakePool(delays={SLOW: 0.05})
+        outbox = Outbox(pool, [SLOW, FAST], store=store)
+        await outbox.start()
+        event = note("hi")
+        first = await outbox.publish(event)
+        pending_after_first = store.pending()
+        await _wait_until(lambda: not store.pending())
+        await outbox.stop()
+        return first, pending_after_first, outbox.stats()
+
+    first, pending_after_first, stats = asyncio.run(main())
+    assert first == FAST
+    assert [row[1] for row in pending_after_first] == [SLOW]
+    assert stats["sent"] == 2
+    assert stats["undelivered_events"] == 0
+
+
+def test_failed_relay_is_retried_until_accepted(tmp_path, note):
+    async def main():
+        store = OutboxStore(str(tmp_path / "outbox.db")).for_avatar("a")
+        pool = FakePool(failures={SLOW: 2})
+        outbox = Outbox(pool, [FAST, SLOW], store=store, retry_base=0.001)
+        await outbox.start()
+        await outbox.publish(note("hi"))
+        await _wait_until(lambda: not store.pending())
+        await outbox.stop()
+        return pool.sent, outbox.stats()
+
+    sent, stats = asyncio.run(main())
+    assert [relay for relay, _ in sent].count(SLOW) == 3
+    assert stats["failed_attempts"] == 2
+    assert stats["dropped"] == 0
+
+
+def test_gives_up_after_max_attempts(tmp_path, note):
+    async def main():
+        store = OutboxStore(str(tmp_path / "outbox.db")).for_avatar("a")
+        pool = FakePool(failures={FAST: 100})
+        outbox = Outbox(pool, [FAST], store=store, max_attempts=3, retry_base=0.001)
+        await outbox.start()
+        with pytest.raises(ConnectionError):
+            await outbox.publish(note("hi"))
+        await _wait_until(lambda: outbox.dropped == 1)
+        await outbox.stop()
+        return pool.sent, store.pending()
+
+    sent, pending = asyncio.run(main())
+    assert len(sent) == 3
+    assert pending == []
+
+
+def test_undelivered_events_resume_after_restart(tmp_path, note):
+    path = str(tmp_path / "outbox.db")
+
+    async def main():
+        store = OutboxStore(path).for_avatar("a")
+        offline = Outbox(FakePool(failures={FAST: 100}), [FAST], store=store,
+                         retry_base=60)
+        await offline.start()
+        event = note("hi")
+        with pytest.raises(ConnectionError):
+            await offline.publish(event)
+        await offline.stop()
+        attempts = store.pending()[0][3]
+        store.store.close()
+
+        store = OutboxStore(path).for_avatar("a")
+        pool = FakePool()
+        outbox = Outbox(pool, [FAST], store=store)
+        await outbox.start()
+        await _wait_until(lambda: not store.pending())
+        await outbox.stop()
+        return event.id().to_hex(), attempts, pool.sent
+
+    event_id, attempts, sent = asyncio.run(main())
+    assert attempts == 1
+    assert sent == [(FAST, event_id)]
+
+
+def test_full_queue_rejects_without_persisting(tmp_path, note):
+    async def main():
+        store = OutboxStore(str(tmp_path / "outbox.db")).for_avatar("a")
+        outbox = Outbox(FakePool(), [FAST], store=store, max_queue_size=1)
+        accepted = outbox.enqueue(note("1"))
+        rejected = outbox.enqueue(note("2"))
+        with pytest.raises(OutboxFullError):
+            await rejected
+        pending = store.pending()
+        await outbox.stop(drain=False)
+        return accepted, pending, outbox.stats()
+
+    accepted, pending, stats = asyncio.run(main())
+    assert accepted.cancelled()
+    assert len(pending) == 1
+    assert stats["rejected"] == 1
+
+
+def test_restart_does_not_duplicate_retries(tmp_path, note):
+    async def main():
+        store = OutboxStore(str(tmp_path / "outbox.db")).for_avatar("a")
+        outbox = Outbox(FakePool(failures={FAST: 100}), [FAST, SLOW], store=store,
+                        retry_base=60)
+        await outbox.start()
+        # SLOW 接受，FAST 等待重试
+        await outbox.publish(note("hi"))
+        await outbox.stop()
+        after_stop = outbox.stats()["pending_retries"]
+        # 同一进程内重复启停，重试只按存储中的未送达投递恢复一次
+        for _ in range(2):
+            await outbox.start()
+            restored = outbox.stats()["pending_retries"]
+            await outbox.stop()
+        return after_stop, restored
+
+    assert asyncio.run(main()) == (0, 1)
+
+
+def test_store_batches_writes_in_order(tmp_path, note):
+    store = OutboxStore(str(tmp_path / "outbox.db"), flush_interval=60)
+
+    def committed():
+        return store._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    kept, sent = note("kept"), note("sent")
+    store.add("a", kept, [FAST, SLOW])
+    store.add("a", sent, [FAST])
+    store.remove("a", sent.id().to_hex(), FAST)
+    store.record_attempt("a", kept.id().to_hex(), SLOW, 2)
+    assert committed() == 0
+    # 读取前先提交，删除在插入之后执行
+    rows = {(row[0], row[1]): row[3] for row in store.pending("a")}
+    assert rows == {(kept.id().to_hex(), FAST): 0, (kept.id().to_hex(), SLOW): 2}
+    store.close()
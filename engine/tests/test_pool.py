@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from avatarai.nostr.pool import RelayPool
+
+GOOD = "wss://good"
+BAD = "wss://bad"
+
+
+class FakeClient:
+    """模拟 nostr_sdk.Client，failing 中的中继添加失败"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.added = []
+
+    async def add_relay(self, relay_url):
+        if relay_url in self.failing:
+            raise ValueError(f"invalid relay {relay_url}")
+        self.added.append(relay_url)
+
+    async def remove_relay(self, relay_url):
+        self.added.remove(relay_url)
+
+    async def connect(self):
+        pass
+
+    async def relays(self):
+        return {}
+
+    async def connect_relay(self, relay_url):
+        pass
+
+    async def handle_notifications(self, handler):
+        await asyncio.Event().wait()
+
+    async def disconnect(self):
+        pass
+
+
+def test_failed_add_does_not_leak_references():
+    async def main():
+        client = FakeClient(failing=[BAD])
+        pool = RelayPool(client=client)
+        with pytest.raises(ValueError):
+            await pool.acquire([GOOD, BAD])
+        state = (dict(pool._relay_refs), pool.health_snapshot(), list(client.added))
+
+        # 中继恢复后再次 acquire 会重新添加
+        client.failing.clear()
+        await pool.acquire([GOOD, BAD])
+        retried = (dict(pool._relay_refs), sorted(client.added),
+                   sorted(health["url"] for health in pool.health_snapshot()))
+        await pool.close()
+        return state, retried
+
+    state, retried = asyncio.run(main())
+    assert state == ({}, [], [])
+    assert retried == ({GOOD: 1, BAD: 1}, [BAD, GOOD], [BAD, GOOD])
+
+
+def test_failed_add_keeps_relays_of_other_avatars():
+    async def main():
+        client = FakeClient(failing=[BAD])
+        pool = RelayPool(client=client)
+        await pool.acquire([GOOD])
+        with pytest.raises(ValueError):
+            await pool.acquire([GOOD, BAD])
+        state = (dict(pool._relay_refs), list(client.added))
+        await pool.close()
+        return state
+
+    assert asyncio.run(main()) == ({GOOD: 1}, [GOOD])
+
+
+def test_relay_removed_when_last_user_releases():
+    async def main():
+        client = FakeClient()
+        pool = RelayPool(client=client)
+        await pool.acquire([GOOD])
+        await pool.acquire([GOOD, BAD])
+        await pool.release([GOOD, BAD])
+        after_first = (dict(pool._relay_refs), list(client.added))
+        await pool.release([GOOD])
+        after_last = (dict(pool._relay_refs), list(client.added),
+                      pool.health_snapshot())
+        await pool.close()
+        return after_first, after_last
+
+    after_first, after_last = asyncio.run(main())
+    assert after_first == ({GOOD: 1}, [GOOD])
+    assert after_last == ({}, [], [])
@@ -0,0 +1,92 @@
+import asyncio
+
+from nostr_sdk import Keys
+
+from avatarai.nostr.dispatch import EventDispatcher
+from avatarai.nostr.router import KindRouter
+
+TEXT_NOTE = 1
+
+
+def test_unknown_kind_without_default_is_ignored(note):
+    async def main():
+        router = KindRouter()
+        handled = []
+
+        async def on_reaction(event):
+            handled.append(event)
+
+        router.register(7, on_reaction)
+        return await router.dispatch(note("hello")), handled
+
+    assert asyncio.run(main()) == (False, [])
+
+
+def test_unknown_kind_goes_to_default(note):
+    async def main():
+        handled = []
+
+        async def fallback(event):
+            handled.append(event.content())
+
+        router = KindRouter(default=fallback)
+        return await router.dispatch(note("hello")), handled, router.stats()
+
+    routed, handled, stats = asyncio.run(main())
+    assert routed
+    assert handled == ["hello"]
+    assert stats["default"]["handled"] == 1
+
+
+def test_handler_error_is_counted_in_failed(note):
+    async def main():
+        async def broken(event):
+            raise RuntimeError("boom")
+
+        router = KindRouter()
+        router.register(TEXT_NOTE, broken)
+        # 异常不会向上抛出，事件仍算作已路由
+        routed = [await router.dispatch(note(str(i))) for i in range(3)]
+        return routed, router.stats()[str(TEXT_NOTE)]
+
+    routed, stats = asyncio.run(main())
+    assert routed == [True, True, True]
+    assert stats["handled"] == 0
+    assert stats["failed"] == 3
+    assert stats["latency"]["count"] == 3
+
+
+def test_concurrency_is_capped_by_dispatch_workers(note):
+    async def main():
+        dispatcher = EventDispatcher(num_workers=2)
+        router = KindRouter()
+        active, peak, done = 0, 0, []
+
+        async def slow(event):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            done.append(event.content())
+
+        router.register(TEXT_NOTE, slow)
+        # 每个worker分到多个作者，保证两个worker都有事件
+        signers = {}
+        while len(signers) < 2 or sum(len(v) for v in signers.values()) < 8:
+            signer = Keys.generate()
+            event = note("probe", signer=signer)
+            signers.setdefault(dispatcher._worker_index(event), []).append(signer)
+        for group in signers.values():
+            for signer in group:
+                for i in range(3):
+                    await dispatcher.submit(note(str(i), signer=signer),
+                                            router.dispatch)
+        dispatcher.start()
+        await dispatcher.stop(drain=True)
+        submitted = 3 * sum(len(group) for group in signers.values())
+        return peak, len(done), submitted
+
+    peak, processed, submitted = asyncio.run(main())
+    assert peak == 2
+    assert processed == submitted
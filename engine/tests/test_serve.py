@@ -0,0 +1,37 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from avatarai.entrypoints import serve
+
+ADMIN_ROUTES = ["/tasks", "/profiler", "/avatars"]
+
+
+@pytest.fixture
+def client():
+    # 不进入 lifespan，不会创建引擎
+    return TestClient(serve.app)
+
+
+@pytest.mark.parametrize("path", ADMIN_ROUTES)
+def test_admin_routes_closed_without_token(client, monkeypatch, path):
+    monkeypatch.setattr(serve, "admin_token", None)
+    # 没有配置令牌时，本机请求也不放行
+    assert client.get(path).status_code == 404
+    assert client.get(path, headers={"Authorization": "Bearer "}).status_code == 404
+
+
+@pytest.mark.parametrize("path", ADMIN_ROUTES)
+def test_admin_routes_require_bearer_token(client, monkeypatch, path):
+    monkeypatch.setattr(serve, "admin_token", "secret")
+    assert client.get(path).status_code == 401
+    for header in ("Bearer wrong", "Basic secret"):
+        assert client.get(path, headers={"Authorization": header}).status_code == 401
+    response = client.get(path, headers={"Authorization": "Bearer secret"})
+    # /avatars 在引擎启动前返回503，说明已通过访问控制
+    assert response.status_code in (200, 503)
+
+
+def test_public_routes_need_no_token(client, monkeypatch):
+    monkeypatch.setattr(serve, "admin_token", None)
+    assert client.get("/health").status_code == 200
+    assert client.get("/metrics").status_code == 200
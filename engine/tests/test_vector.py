@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from avatarai.memory.vector import VectorStore
+
+
+def _clustered(count: int, dim: int = 16, clusters: int = 8,
+               seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    labels = rng.integers(clusters, size=count)
+    return (centers[labels] + 0.05 * rng.normal(size=(count, dim))).astype(np.float32)
+
+
+def test_search_returns_most_similar(tmp_path):
+    store = VectorStore(str(tmp_path / "vectors"))
+    assert store.search(np.ones(3)) == [[]]
+    store.add(np.array([[1, 0, 0], [0, 1, 0], [0, 0, 1]]), ["x", "y", "z"])
+    hits = store.search(np.array([[0.1, 0.9, 0], [0, 0, 2]]), k=2)
+    assert [hit.payload for hit in hits[0]] == ["y", "x"]
+    assert hits[1][0].payload == "z"
+    assert hits[1][0].score == pytest.approx(1.0)
+
+
+def test_rejects_mismatched_input(tmp_path):
+    store = VectorStore(str(tmp_path / "vectors"))
+    store.add(np.ones((1, 4)), ["a"])
+    with pytest.raises(ValueError):
+        store.add(np.ones((1, 3)), ["b"])
+    with pytest.raises(ValueError):
+        store.add(np.ones((2, 4)), ["b"])
+
+
+def test_grows_and_reloads_from_disk(tmp_path):
+    path = str(tmp_path / "vectors")
+    vectors = _clustered(300)
+    store = VectorStore(path)
+    for start in range(0, len(vectors), 50):
+        store.add(vectors[start:start + 50], [str(i) for i in range(start, start + 50)])
+    store.close()
+
+    reopened = VectorStore(path)
+    assert len(reopened) == 300
+    assert reopened.search(vectors[123])[0][0].payload == "123"
+
+
+def test_ivf_index_matches_flat_search(tmp_path):
+    vectors = _clustered(1000)
+    queries = vectors[::50]
+    store = VectorStore(str(tmp_path / "vectors"), nprobe=4)
+    store.add(vectors, [str(i) for i in range(len(vectors))])
+    flat = store.search(queries, k=1)
+    store.build_index(nlist=16)
+    assert store.indexed
+    indexed = store.search(queries, k=1)
+    assert [hits[0].payload for hits in indexed] == [hits[0].payload for hits in flat]
+
+
+def test_vectors_added_after_index_are_searchable(tmp_path):
+    path = str(tmp_path / "vectors")
+    vectors = _clustered(400)
+    store = VectorStore(path, nprobe=4)
+    store.add(vectors[:300], [str(i) for i in range(300)])
+    store.build_index(nlist=8)
+    store.add(vectors[300:], [str(i) for i in range(300, 400)])
+    assert store.search(vectors[350])[0][0].payload == "350"
+    store.close()
+
+    reopened = VectorStore(path, nprobe=4)
+    assert reopened.indexed
+    assert reopened.search(vectors[399])[0][0].payload == "399"
@@ -0,0 +1,89 @@
+import asyncio
+import json
+from concurrent.futures import Executor, Future
+
+from nostr_sdk import Event
+
+from avatarai.nostr.verify import EventVerifier
+
+
+class FailingExecutor(Executor):
+    """提交的任务都以异常结束"""
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = Future()
+        future.set_exception(RuntimeError("worker crashed"))
+        return future
+
+
+def _tampered(event: Event) -> Event:
+    data = json.loads(event.as_json())
+    data["content"] = "tampered"
+    return Event.from_json(json.dumps(data))
+
+
+def test_repeated_event_hits_cache(note):
+    async def main():
+        verifier = EventVerifier(max_workers=1)
+        event = note("hello")
+        results = [await verifier.verify(event) for _ in range(3)]
+        verifier.shutdown()
+        return results, verifier.stats()
+
+    results, stats = asyncio.run(main())
+    assert results == [True, True, True]
+    assert stats["verified"] == 1
+    assert stats["cache_hits"] == 2
+
+
+def test_tampered_event_with_cached_id_is_rejected(note):
+    async def main():
+        verifier = EventVerifier(max_workers=1)
+        event = note("hello")
+        first = await verifier.verify(event)
+        tampered = _tampered(event)
+        assert tampered.id().to_hex() == event.id().to_hex()
+        second = await verifier.verify(tampered)
+        verifier.shutdown()
+        return first, second, verifier.stats()
+
+    first, second, stats = asyncio.run(main())
+    assert (first, second) == (True, False)
+    assert stats["cache_hits"] == 0
+    assert stats["rejected"] == 1
+
+
+def test_batches_go_through_executor(note):
+    async def main():
+        verifier = EventVerifier(max_workers=2, batch_size=8, inline_batch_size=4)
+        events = [note(str(i)) for i in range(8)]
+        results = await asyncio.gather(*(verifier.verify(event) for event in events))
+        verifier.shutdown()
+        return results, verifier.stats()
+
+    results, stats = asyncio.run(main())
+    assert results == [True] * 8
+    assert stats["batch_latency"]["count"] == 1
+
+
+def test_executor_failure_resolves_to_false(note):
+    async def main():
+        verifier = EventVerifier(executor=FailingExecutor(), batch_size=4,
+                                 inline_batch_size=0)
+        events = [note(str(i)) for i in range(6)]
+        results = await asyncio.gather(*(verifier.verify(event) for event in events))
+        return results, verifier.stats()
+
+    results, stats = asyncio.run(main())
+    assert results == [False] * 6
+    assert stats["rejected"] == 6
+    assert stats["cache_size"] == 0
+
+
+def test_shutdown_executor_resolves_to_false(note):
+    async def main():
+        verifier = EventVerifier(max_workers=1, inline_batch_size=0)
+        verifier.shutdown()
+        return await asyncio.wait_for(verifier.verify(note("late")), 1)
+
+    assert asyncio.run(main()) is False